@@ -1,7 +1,8 @@
 import numpy as np
 import uproot as ur
 import pandas as pd
-import re, os, glob
+import re, os, glob, shutil, tempfile
+from multiprocessing import Pool
 
 from argparse import ArgumentParser
 from configparser import ConfigParser
@@ -10,8 +11,8 @@ from delphes.CrossSectionReader import CrossSectionReader
 from delphes.Hbb0LepDelphesPreprocessor import Hbb0LepDelphesPreprocessor
 from delphes.Hbb1LepDelphesPreprocessor import Hbb1LepDelphesPreprocessor
 
-def PrepareDelphesDataset(input_files, lumifile_path, channel):
-    """ Return a pandas table with the needed event variables, after applying selection. """
+def ReadLumiWeight(lumifile_path):
+    """ Return the per-event weight needed to normalize the events to the luminosity given in the lumifile. """
 
     if lumifile_path:
         print("using the following lumifile: '{}'".format(lumifile_path))
@@ -31,24 +32,44 @@ def PrepareDelphesDataset(input_files, lumifile_path, channel):
 
     print("using the following lumi event weight: {}".format(lumiweight))
 
-    # look for the ROOT file(s) with the events and process it
-    processed_events = []
+    return lumiweight
 
+def GetDelphesPreprocessor(channel):
     if channel == "0lep":
-        pre = Hbb0LepDelphesPreprocessor()
+        return Hbb0LepDelphesPreprocessor()
     elif channel == "1lep":
-        pre = Hbb1LepDelphesPreprocessor()
+        return Hbb1LepDelphesPreprocessor()
     else:
         raise Exception("The requested channel is not supported!")
 
+def ProcessDelphesFiles(input_files, lumiweight, channel, chunksize = None):
+    """ Generator yielding the selected events, one pandas table per input file (or per chunk of 'chunksize' entries). """
+
+    pre = GetDelphesPreprocessor(channel)
+
     for event_file_candidate in input_files:
         print("currently processing {}".format(event_file_candidate))
-        
-        pre.load(event_file_candidate)
-        processed = pre.process(lumiweight = lumiweight)
-        if processed is not None:
-            print("got {} processed events".format(len(processed)))
-            processed_events.append(processed)
+
+        if chunksize:
+            for _ in pre.iterate(event_file_candidate, chunksize = chunksize):
+                processed = pre.process(lumiweight = lumiweight)
+                if processed is not None:
+                    print("got {} processed events".format(len(processed)))
+                    yield processed
+        else:
+            pre.load(event_file_candidate)
+            processed = pre.process(lumiweight = lumiweight)
+            if processed is not None:
+                print("got {} processed events".format(len(processed)))
+                yield processed
+
+def PrepareDelphesDataset(input_files, lumifile_path, channel, chunksize = None):
+    """ Return a pandas table with the needed event variables, after applying selection. """
+
+    lumiweight = ReadLumiWeight(lumifile_path)
+
+    # look for the ROOT file(s) with the events and process it
+    processed_events = list(ProcessDelphesFiles(input_files, lumiweight, channel, chunksize = chunksize))
 
     # this will return a Pandas dataframe
     if len(processed_events) > 0:
@@ -58,12 +79,78 @@ def PrepareDelphesDataset(input_files, lumifile_path, channel):
 
     return retval
 
+def WriteEventTable(processed_events, outfile_path, sample_name):
+    """ Append the tables yielded by 'processed_events' one after the other to the output file. Returns the number of stored events. """
+
+    number_stored_events = 0
+    store = None
+    try:
+        for processed in processed_events:
+
+            # only create the output once there are events to store
+            if store is None:
+                store = pd.HDFStore(outfile_path, mode = 'a')
+                if sample_name in store:
+                    store.remove(sample_name)
+
+            store.append(sample_name, processed.reset_index(drop = True), format = "table", index = False)
+            number_stored_events += len(processed)
+    finally:
+        if store is not None:
+            store.close()
+
+    return number_stored_events
+
+def StreamDelphesDataset(input_files, lumifile_path, channel, outfile_path, sample_name, chunksize):
+    """ Like 'PrepareDelphesDataset', but appends the selected events of every chunk directly to the output table,
+    such that the memory usage does not grow with the size of the input. Returns the number of stored events. """
+
+    lumiweight = ReadLumiWeight(lumifile_path)
+
+    return WriteEventTable(ProcessDelphesFiles(input_files, lumiweight, channel, chunksize = chunksize), outfile_path, sample_name)
+
+def _WriteDelphesShard(shard_def):
+    """ Worker function: process a single input file and store the selected events in a separate shard file. """
+    input_file, lumiweight, channel, chunksize, shard_path, sample_name = shard_def
+
+    number_events = WriteEventTable(ProcessDelphesFiles([input_file], lumiweight, channel, chunksize = chunksize), shard_path, sample_name)
+
+    return shard_path, number_events
+
+def ParallelDelphesDataset(input_files, lumifile_path, channel, outfile_path, sample_name, jobs, chunksize = None, merge_chunksize = 100000):
+    """ Like 'StreamDelphesDataset', but distributes the input files over a pool of 'jobs' worker processes. Every worker
+    writes the events it selects into a shard file, and the shards are merged into the output table as they become available. """
+
+    lumiweight = ReadLumiWeight(lumifile_path)
+
+    # keep the shards next to the output file, such that they end up on the same file system
+    shard_dir = tempfile.mkdtemp(prefix = "shards_", dir = os.path.dirname(os.path.abspath(outfile_path)))
+    shard_defs = [(input_file, lumiweight, channel, chunksize, os.path.join(shard_dir, "shard_{}.h5".format(ind)), sample_name) for ind, input_file in enumerate(input_files)]
+
+    def read_shards(finished_shards):
+        # Note: 'imap' returns the shards in the order of the input files, such that the output is reproducible
+        for shard_path, number_events in finished_shards:
+            if number_events > 0:
+                for chunk in pd.read_hdf(shard_path, key = sample_name, chunksize = merge_chunksize):
+                    yield chunk
+                os.remove(shard_path)
+
+    try:
+        with Pool(processes = jobs) as pool:
+            number_stored_events = WriteEventTable(read_shards(pool.imap(_WriteDelphesShard, shard_defs)), outfile_path, sample_name)
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors = True)
+
+    return number_stored_events
+
 if __name__ == "__main__":
     parser = ArgumentParser(description = "convert Delphes datasets into hdf5, applying some event selection")
     parser.add_argument("--outfile", action = "store", dest = "outfile")
     parser.add_argument("--lumifile", action = "store", dest = "lumifile", default = None)
     parser.add_argument("--sname", action = "store", dest = "sample_name")
     parser.add_argument("--channel", action = "store", dest = "channel", default = "0lep")
+    parser.add_argument("--chunksize", action = "store", dest = "chunksize", type = int, default = None) # if given, stream the input in chunks of this many entries
+    parser.add_argument("--jobs", action = "store", dest = "jobs", type = int, default = 1) # number of worker processes to spread the input files over
     parser.add_argument("files", nargs = '+', action = "store")
     args = vars(parser.parse_args())
 
@@ -72,22 +159,36 @@ if __name__ == "__main__":
     files = args["files"]
     sample_name = args["sample_name"]
     channel = args["channel"]
+    chunksize = args["chunksize"]
+    jobs = args["jobs"]
 
-    processed_events = PrepareDelphesDataset(files, lumifile_path, channel)
-
-    # merge all events together and dump them
-    # Note: if no events survived the selection, NO output will be written!
-    if processed_events is not None:
-        print("finished processing, here is a sample:")
-        print(processed_events.head())
+    if jobs > 1 or chunksize:
+        # Note: if no events survived the selection, NO output will be written!
+        if jobs > 1:
+            number_stored_events = ParallelDelphesDataset(files, lumifile_path, channel, outfile_path, sample_name, jobs, chunksize = chunksize)
+        else:
+            number_stored_events = StreamDelphesDataset(files, lumifile_path, channel, outfile_path, sample_name, chunksize)
 
-        print("stored {} events".format(len(processed_events)))
-        
-        if os.path.exists(outfile_path):
-            mode = 'a'
+        if number_stored_events > 0:
+            print("stored {} events".format(number_stored_events))
         else:
-            mode = 'w'
-            
-        processed_events.to_hdf(outfile_path, key = sample_name, mode = mode)
+            print("no events passed the selection, no output written")
     else:
-        print("no events passed the selection, no output written")
+        processed_events = PrepareDelphesDataset(files, lumifile_path, channel)
+
+        # merge all events together and dump them
+        # Note: if no events survived the selection, NO output will be written!
+        if processed_events is not None:
+            print("finished processing, here is a sample:")
+            print(processed_events.head())
+
+            print("stored {} events".format(len(processed_events)))
+
+            if os.path.exists(outfile_path):
+                mode = 'a'
+            else:
+                mode = 'w'
+
+            processed_events.to_hdf(outfile_path, key = sample_name, mode = mode)
+        else:
+            print("no events passed the selection, no output written")
@@ -1,13 +1,14 @@
-import pandas as pd
 import numpy as np
 import os, pickle
 from argparse import ArgumentParser
 
-from NewTrainAdversarialModel import extract_shuffled_slice
+from NewTrainAdversarialModel import load_shuffled_slices
 from base.Configs import TrainingConfig
 from models.ModelCollection import ModelCollection
 from analysis.NewCutBasedCategoryFiller import CutBasedCategoryFiller
 from analysis.NewClassifierBasedCategoryFiller import ClassifierBasedCategoryFiller
+from analysis.RegionCategoryFiller import RegionCategoryFiller
+from analysis.BinnedCategory import BinnedCategory
 from plotting.CategoryPlotter import CategoryPlotter
 from plotting.ModelEvaluator import ModelEvaluator
 from plotting.TrainingStatisticsPlotter import TrainingStatisticsPlotter
@@ -25,13 +26,10 @@ def ExportAnalysisRegionHistograms(infile_path, model_dir, out_dir):
     test_slice_size = test_slice[1] - test_slice[0]
 
     print("loading data ...")
-    sig_data = [pd.read_hdf(infile_path, key = cur_sample) for cur_sample in sig_sample_names]
-    bkg_data = [pd.read_hdf(infile_path, key = cur_sample) for cur_sample in bkg_sample_names]
+    sig_data_test, = load_shuffled_slices(infile_path, sig_sample_names, [test_slice])
+    bkg_data_test, = load_shuffled_slices(infile_path, bkg_sample_names, [test_slice])
     print("done!")
 
-    sig_data_test = [extract_shuffled_slice(cur_sample, slice_def = test_slice) for cur_sample in sig_data]
-    bkg_data_test = [extract_shuffled_slice(cur_sample, slice_def = test_slice) for cur_sample in bkg_data]
-
     # take care to preserve the total event yield
     sig_data_test = [renormalize_yields(cur_sample, factor = 1.0 / test_slice_size) for cur_sample in sig_data_test]
     bkg_data_test = [renormalize_yields(cur_sample, factor = 1.0 / test_slice_size) for cur_sample in bkg_data_test]
@@ -63,16 +61,19 @@ def ExportAnalysisRegionHistograms(infile_path, model_dir, out_dir):
         training_plotter = TrainingStatisticsPlotter(model.path)
         training_plotter.plot(model.path)
 
+    # all exported quantities only need the binned mBB distributions, the categories therefore do not need to keep the individual events
+    binned_category = lambda name: BinnedCategory(name, binning = SR_binning, variables = ["mBB"])
+
+    # Note: all categories are filled by assigning the events of each process to a set of mutually exclusive regions in a single pass
     # fill inclusive categories with 2j / 3j events
-    inclusive_2J = CutBasedCategoryFiller.create_nJ_category(process_data = all_processes, process_names = all_process_names, nJ = 2)
+    inclusive_regions = RegionCategoryFiller([("inclusive_{}J".format(nJ), CutBasedCategoryFiller.nJ_selection(nJ)) for nJ in [2, 3]], category_factory = binned_category)
+    inclusive_2J, inclusive_3J = inclusive_regions.create_categories(process_data = all_processes, process_names = all_process_names)
 
     for cur_process in all_process_names:
         inclusive_2J.export_histogram(binning = SR_binning, processes = [cur_process], var_name = "mBB", outfile = os.path.join(out_dir, "dist_mBB_{}_2jet.pkl".format(cur_process)), density = True)
 
     inclusive_2J.export_histogram(binning = SR_binning, processes = bkg_sample_names, var_name = "mBB", outfile = os.path.join(out_dir, "dist_mBB_bkg_2jet.pkl"), density = True)
 
-    inclusive_3J = CutBasedCategoryFiller.create_nJ_category(process_data = all_processes, process_names = all_process_names, nJ = 3)
-
     for cur_process in all_process_names:
         inclusive_3J.export_histogram(binning = SR_binning, processes = [cur_process], var_name = "mBB", outfile = os.path.join(out_dir, "dist_mBB_{}_3jet.pkl".format(cur_process)), density = True)
 
@@ -80,45 +81,68 @@ def ExportAnalysisRegionHistograms(infile_path, model_dir, out_dir):
 
     anadict = {}
 
+    # the classifier is evaluated only once on every process, all classifier-based regions are defined in terms of its output
+    all_process_preds = [mcoll.predict(cur_process)[:, 1] for cur_process in all_processes]
+    sig_process_preds = all_process_preds[:len(sig_data_test)]
+
     # fill the signal regions of the classifier-based analysis
-    #for nJ, cur_inclusive_cat in zip([2, 3], [inclusive_2J, inclusive_3J]):
-    for nJ, cur_inclusive_cat in zip([3], [inclusive_3J]):
-    #for nJ, cur_inclusive_cat in zip([2], [inclusive_2J]):
+    #classifier_nJs = [2, 3]
+    classifier_nJs = [3]
+    #classifier_nJs = [2]
+
+    classifier_regions = []
+    classifier_region_defs = []
+    for nJ in classifier_nJs:
         for cut_end, cut_start, cut_label in zip(cuts[nJ][0:-1], cuts[nJ][1:], cut_labels):
-            print("exporting {}J region with sigeff range {} - {}".format(nJ, cut_start, cut_end))
+            classifier_range = ClassifierBasedCategoryFiller.get_classifier_range(sig_data_test, sig_process_preds, classifier_sigeff_range = (cut_start, cut_end), nJ = nJ)
+            classifier_regions.append(("clf_{:.2f}_{:.2f}".format(cut_start, cut_end), ClassifierBasedCategoryFiller.classifier_selection(classifier_range, nJ = nJ)))
+            classifier_region_defs.append((nJ, cut_end, cut_start, cut_label))
 
-            cur_cat = ClassifierBasedCategoryFiller.create_classifier_category(mcoll, sig_process_data = sig_data_test, sig_process_names = sig_sample_names,
-                                                                               bkg_process_data = bkg_data_test, bkg_process_names = bkg_sample_names,
-                                                                               classifier_sigeff_range = (cut_start, cut_end), nJ = nJ)
-            
-            cur_cat.export_ROOT_histogram(binning = SR_binning, processes = all_process_names, var_names = "mBB",
-                                          outfile_path = os.path.join(out_dir, "region_{}jet_{}_{}.root".format(nJ, cut_start, cut_end)), clipping = True, density = False)
+    classifier_filler = RegionCategoryFiller(classifier_regions, category_factory = binned_category)
+    classifier_categories = classifier_filler.create_categories(process_data = all_processes, process_names = all_process_names,
+                                                                process_columns = [{"clf": cur_pred} for cur_pred in all_process_preds])
 
-            for cur_process in all_process_names:
-                cur_cat.export_histogram(binning = SR_binning, processes = [cur_process], var_name = "mBB", outfile = os.path.join(out_dir, "dist_mBB_{}_{}jet_{}.pkl".format(cur_process, nJ, cut_label)), density = True)
+    inclusive_categories = {2: inclusive_2J, 3: inclusive_3J}
+    for cur_cat, (nJ, cut_end, cut_start, cut_label) in zip(classifier_categories, classifier_region_defs):
+        cur_inclusive_cat = inclusive_categories[nJ]
+        print("exporting {}J region with sigeff range {} - {}".format(nJ, cut_start, cut_end))
+
+        cur_cat.export_ROOT_histogram(binning = SR_binning, processes = all_process_names, var_names = "mBB",
+                                      outfile_path = os.path.join(out_dir, "region_{}jet_{}_{}.root".format(nJ, cut_start, cut_end)), clipping = True, density = False)
+
+        for cur_process in all_process_names:
+            cur_cat.export_histogram(binning = SR_binning, processes = [cur_process], var_name = "mBB", outfile = os.path.join(out_dir, "dist_mBB_{}_{}jet_{}.pkl".format(cur_process, nJ, cut_label)), density = True)
+
+        anadict["{}_{}jet_sig_eff".format(cut_label, nJ)] = ModelEvaluator.get_efficiency(cur_cat, cur_inclusive_cat, sig_sample_names)
+        anadict["{}_{}jet_bkg_eff".format(cut_label, nJ)] = ModelEvaluator.get_efficiency(cur_cat, cur_inclusive_cat, bkg_sample_names)
 
-            anadict["{}_{}jet_sig_eff".format(cut_label, nJ)] = ModelEvaluator.get_efficiency(cur_cat, cur_inclusive_cat, sig_sample_names)
-            anadict["{}_{}jet_bkg_eff".format(cut_label, nJ)] = ModelEvaluator.get_efficiency(cur_cat, cur_inclusive_cat, bkg_sample_names)
+        anadict["{}_{}jet_inv_JS_bkg".format(cut_label, nJ)] = 1.0 / ModelEvaluator.get_JS_categories(cur_cat, cur_inclusive_cat, binning = SR_binning, var = "mBB", processes = bkg_sample_names)
+        anadict["{}_{}jet_binned_sig".format(cut_label, nJ)] = cur_cat.get_binned_significance(binning = SR_binning, signal_processes = sig_sample_names, background_processes = bkg_sample_names, var_name = "mBB")
 
-            anadict["{}_{}jet_inv_JS_bkg".format(cut_label, nJ)] = 1.0 / ModelEvaluator.get_JS_categories(cur_cat, cur_inclusive_cat, binning = SR_binning, var = "mBB", processes = bkg_sample_names)
-            anadict["{}_{}jet_binned_sig".format(cut_label, nJ)] = cur_cat.get_binned_significance(binning = SR_binning, signal_processes = sig_sample_names, background_processes = bkg_sample_names, var_name = "mBB")
+        cur_cat.export_histogram(binning = SR_binning, processes = bkg_sample_names, var_name = "mBB", outfile = os.path.join(out_dir, "dist_mBB_bkg_{}jet_{}.pkl".format(nJ, cut_label)), density = True)
 
-            cur_cat.export_histogram(binning = SR_binning, processes = bkg_sample_names, var_name = "mBB", outfile = os.path.join(out_dir, "dist_mBB_bkg_{}jet_{}.pkl".format(nJ, cut_label)), density = True)
+        CategoryPlotter.plot_category_composition(cur_cat, binning = SR_binning, outpath = os.path.join(out_dir, "dist_mBB_region_{}jet_{}_{}.pdf".format(nJ, cut_start, cut_end)), 
+                                                  var = "mBB", xlabel = r'$m_{bb}$ [GeV]', plotlabel = ["MadGraph + Pythia8", r'$\sqrt{s} = 13$ TeV, 140 fb$^{-1}$', cut_label + r', {} jet'.format(nJ), adversary_label])
 
-            CategoryPlotter.plot_category_composition(cur_cat, binning = SR_binning, outpath = os.path.join(out_dir, "dist_mBB_region_{}jet_{}_{}.pdf".format(nJ, cut_start, cut_end)), 
-                                                      var = "mBB", xlabel = r'$m_{bb}$ [GeV]', plotlabel = ["MadGraph + Pythia8", r'$\sqrt{s} = 13$ TeV, 140 fb$^{-1}$', cut_label + r', {} jet'.format(nJ), adversary_label])
+        CategoryPlotter.plot_category_composition(cur_cat, binning = SR_binning, outpath = os.path.join(out_dir, "dist_mBB_region_{}jet_{}_{}_nostack.pdf".format(nJ, cut_start, cut_end)), 
+                                                  var = "mBB", xlabel = r'$m_{bb}$ [GeV]', ylabel = "a.u.", plotlabel = ["MadGraph + Pythia8", r'$\sqrt{s} = 13$ TeV, 140 fb$^{-1}$', cut_label + r', {} jet'.format(nJ), adversary_label], stacked = False, histtype = 'step', density = True)
 
-            CategoryPlotter.plot_category_composition(cur_cat, binning = SR_binning, outpath = os.path.join(out_dir, "dist_mBB_region_{}jet_{}_{}_nostack.pdf".format(nJ, cut_start, cut_end)), 
-                                                      var = "mBB", xlabel = r'$m_{bb}$ [GeV]', ylabel = "a.u.", plotlabel = ["MadGraph + Pythia8", r'$\sqrt{s} = 13$ TeV, 140 fb$^{-1}$', cut_label + r', {} jet'.format(nJ), adversary_label], stacked = False, histtype = 'step', density = True)
 
+    # fill the signal regions of the cut-based analysis: the low- and high-MET regions of both jet multiplicities are exclusive
+    CBA_categories = {}
+    for cur_cuts, prefix in zip([CBA_original, CBA_optimized], ["original_", "optimized_"]):
+        CBA_regions = RegionCategoryFiller([(region_name, region_selection(nJ, cur_cuts)) for nJ in [2, 3] for region_name, region_selection in 
+                                            [("low_MET", CutBasedCategoryFiller.low_MET_selection), ("high_MET", CutBasedCategoryFiller.high_MET_selection)]],
+                                           category_factory = binned_category)
+        low_MET_2J, high_MET_2J, low_MET_3J, high_MET_3J = CBA_regions.create_categories(process_data = all_processes, process_names = all_process_names)
+        CBA_categories[prefix] = {2: (low_MET_2J, high_MET_2J), 3: (low_MET_3J, high_MET_3J)}
 
-    # fill the signal regions of the cut-based analysis
     for nJ, cur_inclusive_cat in zip([2, 3], [inclusive_2J, inclusive_3J]):
         for cur_cuts, prefix in zip([CBA_original, CBA_optimized], ["original_", "optimized_"]):
+            low_MET_cat, high_MET_cat = CBA_categories[prefix][nJ]
 
             # low-MET regions
-            print("filling {} jet low_MET category".format(nJ))
-            low_MET_cat = CutBasedCategoryFiller.create_low_MET_category(process_data = all_processes, process_names = all_process_names, nJ = nJ, cuts = cur_cuts)
+            print("exporting {} jet low_MET category".format(nJ))
 
             low_MET_cat.export_ROOT_histogram(binning = SR_binning, processes = all_process_names, var_names = "mBB",
                                               outfile_path = os.path.join(out_dir, prefix + "{}jet_low_MET.root".format(nJ)), clipping = True, density = False)
@@ -141,8 +165,7 @@ def ExportAnalysisRegionHistograms(infile_path, model_dir, out_dir):
                                                       plotlabel = ["MadGraph + Pythia8", r'$\sqrt{s} = 13$ TeV, 140 fb$^{-1}$', r'150 GeV < $E_{\mathrm{T}}^{\mathrm{miss}}$' +  '< {MET_cut} GeV'.format(**cur_cuts), r'$\Delta R_{{bb}} < {dRBB_lowMET_cut}$'.format(**cur_cuts), r'{} jet'.format(nJ)], args = {}, stacked = False, histtype = 'step', density = True)
             
             # high-MET regions
-            print("filling {} jet high_MET category".format(nJ))
-            high_MET_cat = CutBasedCategoryFiller.create_high_MET_category(process_data = all_processes, process_names = all_process_names, nJ = nJ, cuts = cur_cuts)
+            print("exporting {} jet high_MET category".format(nJ))
 
             high_MET_cat.export_ROOT_histogram(binning = SR_binning, processes = all_process_names, var_names = "mBB",
                                               outfile_path = os.path.join(out_dir, prefix + "{}jet_high_MET.root".format(nJ)), clipping = True, density = False)
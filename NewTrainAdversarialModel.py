@@ -4,14 +4,47 @@ import pandas as pd
 from argparse import ArgumentParser
 
 from base.Configs import TrainingConfig
+from base.CompiledDataset import CompiledDataset
+from base.PermutationCache import PermutationCache
 
-def extract_shuffled_slice(sample, slice_def, random_state = 12345):
-    shuffled_sample = sample.sample(frac = 1, random_state = random_state).reset_index(drop = True)
-    cur_length = len(shuffled_sample)
-    cur_slice = shuffled_sample[int(slice_def[0] * cur_length) : int(slice_def[1] * cur_length)]
+def extract_shuffled_slice(sample, slice_def, random_state = 12345, permutation = None):
+    # only the rows in the slice are copied, the rest of the sample is never reshuffled
+    if permutation is None:
+        permutation = PermutationCache.compute(len(sample), random_state)
+
+    cur_length = len(sample)
+    start, stop = int(slice_def[0] * cur_length), int(slice_def[1] * cur_length)
+    cur_slice = sample.iloc[permutation[start:stop]].reset_index(drop = True)
+    cur_slice.index = pd.RangeIndex(start, stop) # same index as the slice of the fully shuffled sample
     return cur_slice
 
-def TrainAdversarialModel(infile_path, outdir, verbose_statistics = False):
+def load_shuffled_slices(infile_path, sample_names, slice_defs, random_state = 12345):
+    """ Return, for each entry in 'slice_defs', the list of the corresponding shuffled slices of all samples.
+    'infile_path' can either be a HDF5 file or a dataset compiled with 'dataprep/CompileDataset.py'. """
+
+    if CompiledDataset.is_compiled(infile_path):
+        # the compiled dataset is already shuffled, only need to map the requested rows
+        dataset = CompiledDataset(infile_path)
+        if dataset.random_state != random_state:
+            raise Exception("Error: dataset '{}' was compiled with random_state = {}, but {} is requested!".format(infile_path, dataset.random_state, random_state))
+
+        return [[dataset.get_slice(cur_sample, slice_def) for cur_sample in sample_names] for slice_def in slice_defs]
+
+    # every sample is read and permuted only once, all slices are taken from the same (cached) permutation
+    permutation_cache = PermutationCache()
+    slices = [[] for slice_def in slice_defs]
+    for cur_sample_name in sample_names:
+        cur_sample = pd.read_hdf(infile_path, key = cur_sample_name)
+        permutation = permutation_cache.get(infile_path, cur_sample_name, len(cur_sample), random_state = random_state)
+
+        for cur_slices, slice_def in zip(slices, slice_defs):
+            cur_slices.append(extract_shuffled_slice(cur_sample, slice_def = slice_def, permutation = permutation))
+
+    return slices
+
+def TrainAdversarialModel(infile_path, outdirs, verbose_statistics = False):
+    """ Train the ModelCollection in each of the 'outdirs'. If there are several of them, they are expected to be part of the
+    same sweep (e.g. differ only in the value of lambda): their corresponding models are then trained together, in the same session. """
     
     # read the training data
     sig_sample_names = TrainingConfig.sig_samples
@@ -19,30 +52,38 @@ def TrainAdversarialModel(infile_path, outdir, verbose_statistics = False):
     training_slice = TrainingConfig.training_slice
     validation_slice = TrainingConfig.validation_slice
 
+    # load the training / validation slices
     print("loading data ...")
-    sig_data = [pd.read_hdf(infile_path, key = cur_sample) for cur_sample in sig_sample_names]
-    bkg_data = [pd.read_hdf(infile_path, key = cur_sample) for cur_sample in bkg_sample_names]
+    sig_data_train, sig_data_val = load_shuffled_slices(infile_path, sig_sample_names, [training_slice, validation_slice])
+    bkg_data_train, bkg_data_val = load_shuffled_slices(infile_path, bkg_sample_names, [training_slice, validation_slice])
     print("done!")
 
-    # split it into training / validation slices
-    sig_data_train = [extract_shuffled_slice(cur_sample, slice_def = training_slice) for cur_sample in sig_data]
-    sig_data_val = [extract_shuffled_slice(cur_sample, slice_def = validation_slice) for cur_sample in sig_data]
+    from models.ModelCollection import ModelCollection
+    from training.BatchSamplers import VectorizedSampler
 
-    bkg_data_train = [extract_shuffled_slice(cur_sample, slice_def = training_slice) for cur_sample in bkg_data]
-    bkg_data_val = [extract_shuffled_slice(cur_sample, slice_def = validation_slice) for cur_sample in bkg_data]
+    if len(outdirs) == 1:
+        mcoll = ModelCollection.from_config(outdirs[0])
 
-    from models.ModelCollection import ModelCollection
-    mcoll = ModelCollection.from_config(outdir)
+        from training.ModelCollectionTrainer import ModelCollectionTrainer
+        trainer = ModelCollectionTrainer(mcoll, batch_sampler = VectorizedSampler())
+        trainer.train(sig_data_train, bkg_data_train, sig_data_val, bkg_data_val)
+    else:
+        from models.AdversarialModelSweep import AdversarialModelSweep
+        from training.AdversarialModelSweepTrainer import AdversarialModelSweepTrainer
+
+        # the data, the preprocessing and the graph are shared by the corresponding models of all collections
+        model_dirs = [ModelCollection.prepare_model_dirs(outdir) for outdir in outdirs]
+        for ind, cur_model_dirs in enumerate(zip(*model_dirs)):
+            print("now training model {}".format(ind))
 
-    from training.ModelCollectionTrainer import ModelCollectionTrainer
-    from training.BatchSamplers import sample_from_TrainingSamples
-    trainer = ModelCollectionTrainer(mcoll, batch_sampler = sample_from_TrainingSamples)
-    trainer.train(sig_data_train, bkg_data_train, sig_data_val, bkg_data_val)
+            sweep = AdversarialModelSweep.from_config(cur_model_dirs)
+            trainer = AdversarialModelSweepTrainer(sweep, batch_sampler = VectorizedSampler(), training_pars = sweep.training_config)
+            trainer.train(sig_data_train, bkg_data_train, sig_data_val, bkg_data_val)
 
 if __name__ == "__main__":
     parser = ArgumentParser(description = "train adversarial networks")
     parser.add_argument("--data", action = "store", dest = "infile_path")
-    parser.add_argument("--outdir", action = "store", dest = "outdir")
+    parser.add_argument("--outdir", action = "store", dest = "outdirs", nargs = '+')
     parser.add_argument("--statistics", action = "store_const", const = True, default = False, dest = "verbose_statistics")
     args = vars(parser.parse_args())
 
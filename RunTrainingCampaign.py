@@ -1,4 +1,4 @@
-import sys, os, glob, uuid
+import sys, os, glob, uuid, re
 from argparse import ArgumentParser
 from shutil import copyfile
 
@@ -7,22 +7,23 @@ from utils.CondorJobSubmitter import CondorJobSubmitter
 from utils.LocalJobSubmitter import LocalJobSubmitter
 from base.Configs import TrainingConfig
 
-def create_job_script(training_data_path, run_dir, script_dir, rootdir, statistics):
+def create_job_script(training_data_path, run_dirs, script_dir, rootdir, statistics):
     script_name = str(uuid.uuid4()) + ".sh"
     script_path = os.path.join(script_dir, script_name)
 
+    # all runs given here are trained by the same process
     with open(script_path, "w") as outfile:
         outfile.write("#!/bin/bash\n")
         outfile.write("source " + os.path.join(rootdir, "bin", "activate") + "\n")
         outfile.write("source " + os.path.join(rootdir, "setup_env.sh") + "\n")
 
-        outfile.write("python " + os.path.join(rootdir, "NewTrainAdversarialModel.py") + " --data " + training_data_path + " --outdir " + run_dir + (" --statistics" if statistics else "") + " | tee " + os.path.join(run_dir, "job.log\n"))
+        outfile.write("python " + os.path.join(rootdir, "NewTrainAdversarialModel.py") + " --data " + training_data_path + " --outdir " + " ".join(run_dirs) + (" --statistics" if statistics else "") + " | tee " + " ".join([os.path.join(run_dir, "job.log") for run_dir in run_dirs]) + "\n")
 
         outfile.write("deactivate\n")
 
     return script_path
     
-def RunTrainingCampaign(master_confpath, nrep = 1, statistics = False):
+def RunTrainingCampaign(master_confpath, nrep = 1, statistics = False, runs_per_job = 1):
     # some global settings
     training_data_path = TrainingConfig.data_path
     
@@ -31,7 +32,10 @@ def RunTrainingCampaign(master_confpath, nrep = 1, statistics = False):
     ConfigFileSweeper(infile_path = master_confpath, output_dir = campaign_dir)
 
     # then, create separate subdirectories for each run, and put the respective config files into those directories
+    # (neighbouring slices, e.g. adjacent values of lambda, are kept next to each other, such that they can share a job)
     config_files = glob.glob(os.path.join(campaign_dir, "*_slice*.conf"))
+    config_files = sorted(config_files, key = lambda config_file: int(re.search("_slice_?([0-9]+)", config_file).group(1)))
+    run_dirs = [[] for rep in range(nrep)]
     for config_file in config_files:
         config_file_basename, _ = os.path.splitext(config_file)
         config_file_fundname = config_file_basename.replace('.conf', '')
@@ -44,14 +48,19 @@ def RunTrainingCampaign(master_confpath, nrep = 1, statistics = False):
                 os.makedirs(run_dir)
             copyfile(config_file, os.path.join(run_dir, "meta.conf"))
             #os.rename(config_file, os.path.join(run_dir, "meta.conf"))
+            run_dirs[rep].append(run_dir)
         
+        os.remove(config_file)
+
+    for cur_run_dirs in run_dirs:
+        for start in range(0, len(cur_run_dirs), runs_per_job):
+            job_run_dirs = cur_run_dirs[start:start + runs_per_job]
+
             # create the job scripts
-            job_script = create_job_script(training_data_path, run_dir, run_dir, rootdir = os.environ["ROOTDIR"], statistics = statistics)
+            job_script = create_job_script(training_data_path, job_run_dirs, job_run_dirs[0], rootdir = os.environ["ROOTDIR"], statistics = statistics)
             
             # submit them
             TrainingConfig.submitter.submit_job(job_script)
-            
-        os.remove(config_file)
 
 if __name__ == "__main__":
     if not os.environ["ROOTDIR"]:
@@ -61,9 +70,12 @@ if __name__ == "__main__":
     parser.add_argument("--confpath", action = "store", dest = "master_confpath")
     parser.add_argument("--nrep", action = "store", dest = "nrep")
     parser.add_argument("--statistics", action = "store_const", const = True, default = False, dest = "statistics")
+    parser.add_argument("--runs_per_job", action = "store", dest = "runs_per_job", type = int, default = 1, 
+                        help = "number of runs (slices of the sweep) that are trained together in a single process")
     args = vars(parser.parse_args())
 
     master_confpath = args["master_confpath"]
     nrep = int(args["nrep"])
     statistics = args["statistics"]
-    RunTrainingCampaign(master_confpath, nrep = nrep, statistics = statistics)
+    runs_per_job = args["runs_per_job"]
+    RunTrainingCampaign(master_confpath, nrep = nrep, statistics = statistics, runs_per_job = runs_per_job)
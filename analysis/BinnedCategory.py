@@ -0,0 +1,90 @@
+import numpy as np
+from analysis.Category import Category
+from base.Histograms import fill_weighted_histogram, project_weighted_histogram
+
+class BinnedCategory(Category):
+    # only keeps the weighted histograms of some variables (including under- and overflow), not the individual events
+
+    def __init__(self, name, binning, variables = ["mBB"]):
+        super().__init__(name)
+        self.binning = np.asarray(binning)
+        self.variables = variables
+
+        # for every process and variable, the histograms with the layout [underflow, bins ..., overflow]
+        self.sow = {}
+        self.sow_squared = {}
+
+    @classmethod
+    def from_merger(cls, categories):
+        retval = cls(categories[0].name, binning = categories[0].binning, variables = categories[0].variables)
+
+        for category in categories:
+            if not np.array_equal(category.binning, retval.binning) or category.variables != retval.variables:
+                raise Exception("Error: can only merge binned categories that use the same binning and variables!")
+
+            for process in category.sow.keys():
+                retval._add_histograms(process, category.sow[process], category.sow_squared[process])
+
+        return retval
+
+    def _add_histograms(self, process, sow, sow_squared):
+        if not process in self.sow:
+            self.sow[process] = {var: np.zeros(len(self.binning) + 1) for var in self.variables}
+            self.sow_squared[process] = {var: np.zeros(len(self.binning) + 1) for var in self.variables}
+
+        for var in self.variables:
+            self.sow[process][var] += sow[var]
+            self.sow_squared[process][var] += sow_squared[var]
+
+    def add_events(self, events, weights, process, event_variables, aux_content = None, aux_variables = None):
+        if len(events) != len(weights):
+            raise Exception("Need to have exactly one weight per event!")
+
+        sow = {}
+        sow_squared = {}
+        for var in self.variables:
+            if var in event_variables:
+                values = events[:, event_variables.index(var)]
+            elif aux_variables is not None and var in aux_variables:
+                values = aux_content[:, aux_variables.index(var)]
+            else:
+                raise KeyError("Error: unknown variable '{}'".format(var))
+
+            sow[var], sow_squared[var] = fill_weighted_histogram(values, weights, self.binning)
+
+        self._add_histograms(process, sow, sow_squared)
+
+    def get_processes(self):
+        return list(self.sow.keys())
+
+    def get_total_events(self):
+        total_events = 0
+        for process in self.sow.keys():
+            total_events += self.get_number_events(process)
+
+        return total_events
+
+    def get_number_events(self, process):
+        if not process in self.sow:
+            return 0.0
+
+        # every event ends up in exactly one slot of each histogram
+        return np.sum(self.sow[process][self.variables[0]])
+
+    def get_event_variable(self, processes, var):
+        raise NotImplementedError("Error: a binned category does not keep individual events!")
+
+    def get_histogram(self, binning, processes, var_name, clipping = False, density = False):
+        if not isinstance(processes, list):
+            processes = [processes]
+
+        if not np.array_equal(binning, self.binning):
+            raise Exception("Error: this category was filled with a different binning!")
+
+        if not var_name in self.variables:
+            raise KeyError("Error: unknown variable '{}'".format(var_name))
+
+        sow = np.sum([self.sow[process][var_name] for process in processes], axis = 0)
+        sow_squared = np.sum([self.sow_squared[process][var_name] for process in processes], axis = 0)
+
+        return project_weighted_histogram(sow, sow_squared, self.binning, clipping = clipping, density = density)
@@ -1,34 +1,43 @@
 from base.Configs import TrainingConfig
+from base.Histograms import weighted_histogram
 
 import pickle
 import numpy as np
-from array import array
+import uproot as ur
+from uproot_methods.classes.TH1 import from_numpy
 
 class Category:
 
     # need to store all the events in this category, depending on the process from which they came
     def __init__(self, name):
         self.name = name
-        self.event_content = {}
-        self.weight_content = {}
         self.event_variables = {}
 
         # holds some auxiliary information that is not part of the event per se
-        self.aux_content = {}
         self.aux_variables = {}
 
+        # the events are collected as lists of chunks, one per call to 'add_events', and only concatenated once they are needed
+        self._event_chunks = {}
+        self._weight_chunks = {}
+        self._aux_chunks = {}
+
     @classmethod
     def from_merger(cls, categories):
         retval = cls(categories[0].name)
 
+        # only collects the chunks of all categories, they are concatenated once on first access
         for category in categories:
-            for process in category.event_content.keys():
-                retval.add_events(events = category.event_content[process],
-                                  weights = category.weight_content[process],
-                                  process = process,
-                                  event_variables = category.event_variables[process],
-                                  aux_content = category.aux_content[process],
-                                  aux_variables = category.aux_variables[process])
+            for process in category._event_chunks.keys():
+                if not process in retval._event_chunks:
+                    retval._event_chunks[process] = []
+                    retval._weight_chunks[process] = []
+                    retval._aux_chunks[process] = []
+                    retval.event_variables[process] = category.event_variables[process]
+                    retval.aux_variables[process] = category.aux_variables[process]
+
+                retval._event_chunks[process] += category._event_chunks[process]
+                retval._weight_chunks[process] += category._weight_chunks[process]
+                retval._aux_chunks[process] += category._aux_chunks[process]
 
         return retval
 
@@ -36,19 +45,48 @@ class Category:
         if len(events) != len(weights):
             raise Exception("Need to have exactly one weight per event!")
 
-        if not process in self.event_content:
-            self.event_content[process] = events
-            self.weight_content[process] = weights
+        if not process in self._event_chunks:
+            self._event_chunks[process] = []
+            self._weight_chunks[process] = []
+            self._aux_chunks[process] = []
             self.event_variables[process] = event_variables
-        else:
-            self.event_content[process] = np.append(self.event_content[process], events, axis = 0)
-            self.weight_content[process] = np.append(self.weight_content[process], weights, axis = 0)
-
-        if not process in self.aux_content:
-            self.aux_content[process] = aux_content
             self.aux_variables[process] = aux_variables
-        else:
-            self.aux_content[process] = np.append(self.aux_content[process], aux_content, axis = 0)
+
+        self._event_chunks[process].append(events)
+        self._weight_chunks[process].append(weights)
+        self._aux_chunks[process].append(aux_content)
+
+    @staticmethod
+    def _finalize(chunks):
+        # concatenates the chunks of every process (if there is more than one) and keeps the result in place of the chunks
+        content = {}
+        for process, cur_chunks in chunks.items():
+            if any(chunk is None for chunk in cur_chunks):
+                content[process] = None
+                continue
+
+            if len(cur_chunks) > 1:
+                cur_chunks[:] = [np.concatenate(cur_chunks, axis = 0)]
+
+            content[process] = cur_chunks[0]
+
+        return content
+
+    @property
+    def event_content(self):
+        return Category._finalize(self._event_chunks)
+
+    @property
+    def weight_content(self):
+        return Category._finalize(self._weight_chunks)
+
+    @property
+    def aux_content(self):
+        return Category._finalize(self._aux_chunks)
+
+    # return the names of all processes that contributed events to this category
+    def get_processes(self):
+        return list(self._event_chunks.keys())
 
     # return the total number of events in this category (from all processes)
     def get_total_events(self):
@@ -95,31 +133,22 @@ class Category:
 
         return event_retval, weight_retval
 
-    # computes and exports the histogram of some event variable, as filled in this category
-    def export_histogram(self, binning, processes, var_name, outfile, clipping = False, density = True):
-        # obtain the data that is to be plotted
+    # computes the weighted histogram of some event variable, summed over the given processes, together with the sum of squared weights in each bin
+    def get_histogram(self, binning, processes, var_name, clipping = False, density = False):
         data, weights = self.get_event_variable(processes, var_name)
 
-        # perform the histogramming
-        if clipping:
-            data = np.clip(data, binning[0], binning[-1])
-
-        # print("data / weights")
-        # print(np.shape(data))
-        # print(np.shape(weights.flatten()))
+        return weighted_histogram(data, weights, binning, clipping = clipping, density = density)
 
-        n, bins = np.histogram(data, bins = binning, weights = weights.flatten(), density = density)
+    # computes and exports the histogram of some event variable, as filled in this category
+    def export_histogram(self, binning, processes, var_name, outfile, clipping = False, density = True):
+        n, _, bins = self.get_histogram(binning, processes, var_name, clipping = clipping, density = density)
 
         with open(outfile, "wb") as outfile:
             pickle.dump((n, bins, var_name), outfile)
 
-    # similar to 'export_histogram', but instead writes a *.root file
+    # similar to 'export_histogram', but instead writes a *.root file (does not need ROOT itself)
     def export_ROOT_histogram(self, binning, processes, var_names, outfile_path, clipping = False, density = False, ignore_binning = False):
 
-        # for exporting ROOT histograms
-        import ROOT
-        from ROOT import TH1F, TFile
-
         if isinstance(var_names, list):
             if len(var_names) > 1:
                 raise NotImplementedError("Error: can only export TH1 up to now - please call for a single variable at a time!")
@@ -128,37 +157,25 @@ class Category:
         else:
             var_name = var_names # just to get the semantics right :)
 
-        outfile = TFile(outfile_path, 'RECREATE')
-        ROOT.SetOwnership(outfile, False)
-        outfile.cd()
-
+        hists = {}
         for process in processes:
-            # obtain the data that is to be histogrammed
-            data, weights = self.get_event_variable(process, var_name)
-
-            # perform the histogramming
-            if clipping:
-                data = np.clip(data, binning[0], binning[-1])
+            # obtain the histogrammed data
+            bin_contents, _, bins = self.get_histogram(binning, process, var_name, clipping = clipping, density = density)
 
-            bin_contents, bins = np.histogram(data, bins = binning, weights = weights.flatten(), density = density)
-
-            # now, just need to fill it into a ROOT histogram and dump it into a file
-            hist_name = process + "_" + var_name
             if ignore_binning:
-                hist = TH1F(hist_name, hist_name, len(bins) - 1, bins[0], bins[-1])
-            else:
-                hist = TH1F(hist_name, hist_name, len(bins) - 1, array('d', bins))
-            ROOT.SetOwnership(hist, False) # avoid problems with Python's garbage collector
+                bins = np.linspace(bins[0], bins[-1], num = len(bins), endpoint = True)
 
-            for bin_number, bin_content in enumerate(bin_contents):
-                if bin_content <= 0:
-                    bin_content = 1e-4
+            # empty bins are not allowed in the exported histograms
+            bin_contents = np.where(bin_contents <= 0, 1e-4, bin_contents).astype(np.float32) # this makes it a TH1F
 
-                hist.SetBinContent(bin_number + 1, bin_content)
-
-            hist.Write()
+            hist_name = process + "_" + var_name
+            hists[hist_name] = from_numpy((bin_contents, bins, hist_name))
 
-        outfile.Close()
+        # write the histograms of all processes in one go
+        outfile = ur.recreate(outfile_path)
+        for hist_name, hist in hists.items():
+            outfile[hist_name] = hist
+        outfile.close()
 
     # def _get_SB_binning(self, binning, signal_processes, background_processes, var_name):
     #     # first, bin all participating processes
@@ -183,11 +200,8 @@ class Category:
     #     return total_binned_signal, total_binned_background
 
     def _get_SB_binning(self, binning, signal_processes, background_processes, var_name):
-        sigvar, sigweights = self.get_event_variable(signal_processes, var_name)
-        bkgvar, bkgweights = self.get_event_variable(background_processes, var_name)
-
-        binned_signal, _ = np.histogram(np.clip(sigvar, binning[0], binning[-1]), bins = binning, weights = sigweights.flatten())
-        binned_background, _ = np.histogram(np.clip(bkgvar, binning[0], binning[-1]), bins = binning, weights = bkgweights.flatten())
+        binned_signal, _, _ = self.get_histogram(binning, signal_processes, var_name, clipping = True)
+        binned_background, _, _ = self.get_histogram(binning, background_processes, var_name, clipping = True)
 
         return binned_signal, binned_background
 
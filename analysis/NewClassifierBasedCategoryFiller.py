@@ -12,6 +12,23 @@ class ClassifierBasedCategoryFiller:
         return (ModelEvaluator._weighted_percentile(all_signal_pred, 1 - sigeff_range[0], weights = all_signal_weights), 
                 ModelEvaluator._weighted_percentile(all_signal_pred, 1 - sigeff_range[1], weights = all_signal_weights))
         
+    @staticmethod
+    def get_classifier_range(sig_process_data, sig_process_preds, classifier_sigeff_range, nJ = 2):
+        """ translate a range of signal efficiencies into a range of the classifier output, given the predictions on the full signal samples """
+        nJ_masks = [(cur_data["nJ"] == nJ).values for cur_data in sig_process_data]
+        all_signal_pred = np.concatenate([cur_pred[cur_mask] for cur_pred, cur_mask in zip(sig_process_preds, nJ_masks)], axis = 0)
+        all_signal_weights = np.concatenate([cur_data[["EventWeight"]].values[cur_mask] for cur_data, cur_mask in zip(sig_process_data, nJ_masks)], axis = 0)
+
+        classifier_range = ClassifierBasedCategoryFiller._sigeff_range_to_score_range(all_signal_pred, all_signal_weights = all_signal_weights, sigeff_range = classifier_sigeff_range)
+        print("translated signal efficiency range ({}, {}) to classifier output range ({}, {})".format(classifier_sigeff_range[0], classifier_sigeff_range[1], 
+                                                                                                       classifier_range[0], classifier_range[1]))
+        return classifier_range
+
+    # event selection of a classifier-based region (see also 'RegionCategoryFiller'), expects the classifier output in the column 'clf'
+    @staticmethod
+    def classifier_selection(classifier_range, nJ = 2):
+        return lambda columns: (columns["nJ"] == nJ) & (columns["clf"] > classifier_range[0]) & (columns["clf"] < classifier_range[1])
+        
     @staticmethod
     def create_classifier_category(mcoll, sig_process_data, sig_process_names, bkg_process_data, bkg_process_names, classifier_sigeff_range = (1.0, 0.0), nJ = 2):
         
@@ -18,6 +18,19 @@ class CutBasedCategoryFiller:
 
         return retcat
 
+    # the event selections of the regions, as functions of the columns of a table of events (see also 'RegionCategoryFiller')
+    @staticmethod
+    def nJ_selection(nJ):
+        return lambda columns: columns["nJ"] == nJ
+
+    @staticmethod
+    def low_MET_selection(nJ, cuts):
+        return lambda columns: (columns["MET"] > 150) & (columns["MET"] < cuts["MET_cut"]) & (columns["dRBB"] < cuts["dRBB_lowMET_cut"]) & (columns["nJ"] == nJ)
+
+    @staticmethod
+    def high_MET_selection(nJ, cuts):
+        return lambda columns: (columns["MET"] > cuts["MET_cut"]) & (columns["dRBB"] < cuts["dRBB_highMET_cut"]) & (columns["nJ"] == nJ)
+
     @staticmethod
     def create_low_MET_category(process_data, process_names, nJ = 2, cuts = {"MET_cut": 191, "dRBB_highMET_cut": 1.2, "dRBB_lowMET_cut": 5.0}):
         
@@ -26,7 +39,7 @@ class CutBasedCategoryFiller:
         for cur_process_data, cur_process_name in zip(process_data, process_names):
             
             # apply the cuts
-            passed = cur_process_data.loc[(cur_process_data["MET"] > 150) & (cur_process_data["MET"] < cuts["MET_cut"]) & (cur_process_data["dRBB"] < cuts["dRBB_lowMET_cut"]) & (cur_process_data["nJ"] == nJ)]
+            passed = cur_process_data.loc[CutBasedCategoryFiller.low_MET_selection(nJ, cuts)(cur_process_data)]
             passed = TrainingSample.fromTable(passed)
 
             # fill the category
@@ -44,7 +57,7 @@ class CutBasedCategoryFiller:
         for cur_process_data, cur_process_name in zip(process_data, process_names):
             
             # apply the cuts
-            passed = cur_process_data.loc[(cur_process_data["MET"] > cuts["MET_cut"]) & (cur_process_data["dRBB"] < cuts["dRBB_highMET_cut"]) & (cur_process_data["nJ"] == nJ)]
+            passed = cur_process_data.loc[CutBasedCategoryFiller.high_MET_selection(nJ, cuts)(cur_process_data)]
             passed = TrainingSample.fromTable(passed)
 
             # fill the category
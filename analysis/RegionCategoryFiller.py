@@ -0,0 +1,53 @@
+import numpy as np
+from analysis.Category import Category
+from base.Configs import TrainingConfig
+from training.DataFormatters import TrainingSample
+
+class RegionCategoryFiller:
+    # fills the categories of mutually exclusive regions from a single region label per event
+
+    def __init__(self, regions, category_factory = Category):
+        # list of (category name, selection), where the selection maps the columns of a table of events onto a boolean mask
+        self.regions = regions
+
+        # creates an empty category from its name, e.g. to fill binned categories instead
+        self.category_factory = category_factory
+
+    def assign_regions(self, columns):
+        """ return the index of the region each event belongs to (-1 for events outside of all regions) """
+        nevents = len(next(iter(columns.values())))
+        labels = np.full(nevents, -1, dtype = np.int32)
+
+        for label, (name, selection) in enumerate(self.regions):
+            mask = np.asarray(selection(columns), dtype = bool)
+            if np.any(labels[mask] >= 0):
+                raise Exception("Error: region '{}' overlaps with another one, regions need to be mutually exclusive!".format(name))
+
+            labels[mask] = label
+
+        return labels
+
+    def create_categories(self, process_data, process_names, process_columns = None):
+        """ Return one category per region, filled with the events from all processes. 'process_columns' can provide
+        additional per-event columns for the selections (e.g. the classifier output), one dictionary per process. """
+        categories = [self.category_factory(name) for name, selection in self.regions]
+
+        if process_columns is None:
+            process_columns = [{} for cur_process_data in process_data]
+
+        for cur_process_data, cur_process_name, cur_process_columns in zip(process_data, process_names, process_columns):
+            columns = {column: cur_process_data[column].values for column in cur_process_data.columns}
+            columns.update(cur_process_columns)
+
+            labels = self.assign_regions(columns)
+            sample = TrainingSample.fromTable(cur_process_data)
+
+            # after a stable sort, the events of each region form a contiguous block (and keep their original order)
+            order = np.argsort(labels, kind = "stable")
+            boundaries = np.searchsorted(labels[order], np.arange(len(self.regions) + 1))
+
+            for label, category in enumerate(categories):
+                rows = order[boundaries[label]:boundaries[label + 1]]
+                category.add_events(events = sample.data[rows], weights = sample.weights[rows], process = cur_process_name, event_variables = TrainingConfig.training_branches)
+
+        return categories
@@ -0,0 +1,30 @@
+import os
+import numpy as np
+
+# files backing the on-disk caches are always replaced atomically, such that an interrupted job never leaves a broken one behind
+
+def write_atomic(path, write, mode = "w"):
+    """ calls 'write' with a file object opened in 'mode' and moves the result to 'path' """
+    tmp_path = path + ".{}.tmp".format(os.getpid())
+    with open(tmp_path, mode) as outfile:
+        write(outfile)
+    os.replace(tmp_path, path)
+
+def load_npy(path, what):
+    """ returns None if the file does not exist or cannot be read """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        return np.load(path)
+    except (IOError, ValueError):
+        print("{} '{}' is corrupted, ignoring it".format(what, path))
+        return None
+
+def save_npy(path, array, what):
+    # the caches are only an optimization: don't fail if they cannot be written
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        write_atomic(path, lambda outfile: np.save(outfile, array), mode = "wb")
+    except OSError:
+        print("could not write {} '{}'".format(what, path))
@@ -0,0 +1,81 @@
+import os, json
+import numpy as np
+import pandas as pd
+
+from base.PermutationCache import PermutationCache
+
+class CompiledDataset:
+    """ A training dataset in which every process is stored as a set of contiguous, memory-mappable column arrays (one .npy file
+    per column), with the events already put into shuffled order. Any slice of the shuffled sample is then a contiguous range of rows. """
+
+    manifest_name = "manifest.json"
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(self.path, CompiledDataset.manifest_name), 'r') as manifest_file:
+            self.manifest = json.load(manifest_file)
+
+        self.random_state = self.manifest["random_state"]
+        self.samples = self.manifest["samples"]
+
+    @staticmethod
+    def is_compiled(path):
+        return os.path.isfile(os.path.join(path, CompiledDataset.manifest_name))
+
+    @classmethod
+    def compile(cls, infile_path, outdir, sample_names = None, random_state = 12345, dtype = np.float32, slice_defs = None):
+        """ convert the tables in the HDF5 file 'infile_path' into a compiled dataset in 'outdir' """
+
+        if slice_defs is None:
+            slice_defs = {}
+
+        if sample_names is None:
+            with pd.HDFStore(infile_path, mode = 'r') as hdf:
+                sample_names = [os.path.basename(key) for key in hdf.keys()]
+
+        manifest = {"source": os.path.abspath(infile_path), "random_state": random_state, "dtype": np.dtype(dtype).name, "samples": {}}
+
+        for sample_name in sample_names:
+            print("compiling sample '{}'".format(sample_name))
+            sample = pd.read_hdf(infile_path, key = sample_name).reset_index(drop = True)
+            nevents = len(sample)
+
+            # Note: this is the same permutation as the one used by 'extract_shuffled_slice'
+            permutation = PermutationCache.compute(nevents, random_state)
+
+            sample_dir = os.path.join(outdir, sample_name)
+            if not os.path.exists(sample_dir):
+                os.makedirs(sample_dir)
+
+            for column in sample.columns:
+                np.save(os.path.join(sample_dir, column + ".npy"), np.ascontiguousarray(sample[column].values[permutation], dtype = dtype))
+
+            # also store the event boundaries of the standard slices, for reference
+            slices = {slice_name: CompiledDataset.slice_boundaries(slice_def, nevents) for slice_name, slice_def in slice_defs.items()}
+            manifest["samples"][sample_name] = {"nevents": nevents, "columns": list(sample.columns), "slices": slices}
+
+        with open(os.path.join(outdir, CompiledDataset.manifest_name), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent = 1)
+
+        return cls(outdir)
+
+    @staticmethod
+    def slice_boundaries(slice_def, nevents):
+        return int(slice_def[0] * nevents), int(slice_def[1] * nevents)
+
+    def get_column(self, sample_name, column):
+        """ memory-map a full column of the (shuffled) sample """
+        return np.load(os.path.join(self.path, sample_name, column + ".npy"), mmap_mode = 'r')
+
+    def get_slice(self, sample_name, slice_def, columns = None):
+        """ return the slice 'slice_def' of the shuffled sample, reading only the rows (and columns) that are needed """
+        sample = self.samples[sample_name]
+        start, stop = CompiledDataset.slice_boundaries(slice_def, sample["nevents"])
+
+        if columns is None:
+            columns = sample["columns"]
+
+        # the index agrees with the one of the equivalent slice of the shuffled pandas table
+        return pd.DataFrame({column: np.array(self.get_column(sample_name, column)[start:stop]) for column in columns},
+                            columns = columns, index = pd.RangeIndex(start, stop))
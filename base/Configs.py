@@ -35,6 +35,39 @@ class TrainingConfig:
                                     inter_op_parallelism_threads = 1,
                                     allow_soft_placement = True, 
                                     device_count = {'CPU': 1})
+
+    # environment variable that sets the number of threads available to each training session
+    num_threads_env = "TRAINING_THREADS"
+
+    @classmethod
+    def get_num_threads(cls, num_threads = None):
+        # explicit request (e.g. 'num_threads' in the training config) > $TRAINING_THREADS > CPUs of the batch job > 1
+        if num_threads is not None:
+            return max(int(float(num_threads)), 1)
+
+        if cls.num_threads_env in os.environ:
+            return max(int(os.environ[cls.num_threads_env]), 1)
+
+        # HTCondor makes the description of the slot the job runs in available in this file
+        machine_ad_path = os.environ.get("_CONDOR_MACHINE_AD", None)
+        if machine_ad_path is not None and os.path.exists(machine_ad_path):
+            with open(machine_ad_path, 'r') as machine_ad:
+                for line in machine_ad:
+                    key, _, val = line.partition('=')
+                    if key.strip() == "Cpus":
+                        return max(int(val.strip()), 1)
+
+        return 1
+
+    @classmethod
+    def make_session_config(cls, num_threads = None):
+        num_threads = cls.get_num_threads(num_threads)
+
+        # the graphs are small: most of the parallelism is available within the individual operations
+        return tf.ConfigProto(intra_op_parallelism_threads = num_threads, 
+                              inter_op_parallelism_threads = min(num_threads, 2),
+                              allow_soft_placement = True, 
+                              device_count = {'CPU': 1})
     
     @classmethod
     def from_file(cls, config_dir):
@@ -0,0 +1,51 @@
+import numpy as np
+
+# Weighted histograms that are filled in a single pass over the data and that return the sum of squared weights in each bin
+# together with the bin contents. The raw histograms have the layout [underflow, bins ..., overflow], such that they can later
+# be projected onto the bins with or without clipping (i.e. with or without adding the underflow and overflow to the outer bins).
+
+def histogram_slots(values, binning):
+    # slot 0 is the underflow, slot len(binning) the overflow; as in np.histogram, the last bin also includes its upper edge
+    binning = np.asarray(binning)
+    slots = np.searchsorted(binning, values, side = "right")
+    slots[values == binning[-1]] = len(binning) - 1
+
+    return slots
+
+def fill_weighted_histogram(values, weights, binning):
+    weights = np.asarray(weights).flatten()
+    slots = histogram_slots(values, binning)
+
+    sow = np.bincount(slots, weights = weights, minlength = len(binning) + 1)
+    sow_squared = np.bincount(slots, weights = np.square(weights), minlength = len(binning) + 1)
+
+    return sow, sow_squared
+
+def project_weighted_histogram(sow, sow_squared, binning, clipping = False, density = False):
+    binning = np.asarray(binning)
+
+    if clipping:
+        # move the underflow and overflow into the first and last bin
+        sow = np.copy(sow)
+        sow_squared = np.copy(sow_squared)
+        sow[1] += sow[0]
+        sow[-2] += sow[-1]
+        sow_squared[1] += sow_squared[0]
+        sow_squared[-2] += sow_squared[-1]
+
+    bin_contents = sow[1:-1]
+    sow_squared = sow_squared[1:-1]
+
+    if density:
+        # same normalization as np.histogram
+        norm = 1.0 / (np.sum(bin_contents) * np.diff(binning))
+        bin_contents = bin_contents * norm
+        sow_squared = sow_squared * np.square(norm)
+
+    return bin_contents, sow_squared, binning
+
+def weighted_histogram(values, weights, binning, clipping = False, density = False):
+    """ returns the bin contents, the sum of squared weights in each bin, and the bin edges """
+    sow, sow_squared = fill_weighted_histogram(values, weights, binning)
+
+    return project_weighted_histogram(sow, sow_squared, binning, clipping = clipping, density = density)
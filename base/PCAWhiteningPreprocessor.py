@@ -33,4 +33,12 @@ class PCAWhiteningPreprocessor(Preprocessor):
         processed_data = self.pca.transform(chunk)
         return processed_data
 
+    # express the fitted transformation as 'process(chunk) = (chunk - offset) @ matrix'
+    def get_affine_transform(self):
+        matrix = self.pca.components_.T
+        if self.pca.whiten:
+            matrix = matrix / np.sqrt(self.pca.explained_variance_)
+
+        return self.pca.mean_, matrix
+
     
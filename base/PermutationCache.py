@@ -0,0 +1,55 @@
+import os, hashlib
+import numpy as np
+import pandas as pd
+
+from base.CacheFiles import load_npy, save_npy
+
+class PermutationCache:
+    """ Store for the event permutations used to shuffle the samples of a dataset, so that every slice is a range in one of them """
+
+    def __init__(self, cache_dir = None):
+        if cache_dir is None:
+            cache_dir = os.environ.get("PERMUTATION_CACHE_DIR", None)
+        self.cache_dir = cache_dir
+        self.permutations = {}
+
+    @staticmethod
+    def compute(nevents, random_state):
+        """ the permutation applied by 'sample(frac = 1, random_state = random_state)' to a table with 'nevents' rows """
+        return pd.Series(np.arange(nevents)).sample(frac = 1, random_state = random_state).values
+
+    @staticmethod
+    def fingerprint(dataset_path, block_size = 1 << 20):
+        """ cheap content hash of the dataset: its size together with its first and last block """
+        file_size = os.path.getsize(dataset_path)
+        sha = hashlib.sha1(str(file_size).encode())
+
+        with open(dataset_path, "rb") as infile:
+            sha.update(infile.read(block_size))
+            infile.seek(max(file_size - block_size, 0))
+            sha.update(infile.read(block_size))
+
+        return sha.hexdigest()
+
+    def _cache_path(self, dataset_path, sample_name, random_state):
+        return os.path.join(self.cache_dir, "{}_{}_{}.npy".format(PermutationCache.fingerprint(dataset_path), sample_name, random_state))
+
+    def get(self, dataset_path, sample_name, nevents, random_state = 12345):
+        key = (os.path.abspath(dataset_path), sample_name, random_state)
+        if key in self.permutations and len(self.permutations[key]) == nevents:
+            return self.permutations[key]
+
+        # the permutations are only written to disk if a cache directory is given (or set via $PERMUTATION_CACHE_DIR)
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path = self._cache_path(dataset_path, sample_name, random_state)
+
+        permutation = None if cache_path is None else load_npy(cache_path, "permutation cache")
+
+        if permutation is None or len(permutation) != nevents:
+            permutation = PermutationCache.compute(nevents, random_state)
+            if cache_path is not None:
+                save_npy(cache_path, permutation, "permutation cache")
+
+        self.permutations[key] = permutation
+        return permutation
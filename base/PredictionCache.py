@@ -0,0 +1,64 @@
+import os, hashlib
+import numpy as np
+
+from base.CacheFiles import load_npy, save_npy
+
+class PredictionCache:
+    """ Store for the predictions of a model, keyed by (model fingerprint, input fingerprint), optionally backed by $PREDICTION_CACHE_DIR """
+
+    def __init__(self, cache_dir = None):
+        if cache_dir is None:
+            cache_dir = os.environ.get("PREDICTION_CACHE_DIR", None)
+        self.cache_dir = cache_dir
+        self.predictions = {}
+
+    @staticmethod
+    def fingerprint_files(paths):
+        """ content hash of the files that define a model, e.g. its checkpoint index and its preprocessor """
+        sha = hashlib.sha1()
+        for path in paths:
+            with open(path, "rb") as infile:
+                sha.update(infile.read())
+
+        return sha.hexdigest()
+
+    @staticmethod
+    def fingerprint_data(data):
+        """ content hash of the input array that is passed to the model """
+        data = np.ascontiguousarray(data)
+        sha = hashlib.sha1("{}_{}".format(data.shape, data.dtype.str).encode())
+        sha.update(data.data)
+
+        return sha.hexdigest()
+
+    def key(self, model_fingerprint, data):
+        return model_fingerprint + "_" + PredictionCache.fingerprint_data(data)
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        if key in self.predictions:
+            return self.predictions[key]
+
+        if self.cache_dir is None:
+            return None
+
+        predictions = load_npy(self._cache_path(key), "prediction cache")
+        if predictions is None:
+            return None
+
+        predictions.flags.writeable = False
+        self.predictions[key] = predictions
+        return predictions
+
+    def put(self, key, predictions):
+        # the cache takes ownership of 'predictions' (without copying them): they are handed out to several users, none of which may change them
+        predictions = np.asarray(predictions)
+        predictions.flags.writeable = False
+        self.predictions[key] = predictions
+
+        if self.cache_dir is not None:
+            save_npy(self._cache_path(key), predictions, "prediction cache")
+
+        return predictions
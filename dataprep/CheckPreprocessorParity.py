@@ -0,0 +1,54 @@
+import numpy as np
+from argparse import ArgumentParser
+
+from delphes.Hbb0LepDelphesPreprocessor import Hbb0LepDelphesPreprocessor
+from delphes.Hbb1LepDelphesPreprocessor import Hbb1LepDelphesPreprocessor
+
+def CheckPreprocessorParity(files, channel, rtol = 1e-6):
+    """ Run the columnar and the row-wise event selection on the same files and compare their outputs. """
+
+    if channel == "0lep":
+        pre = Hbb0LepDelphesPreprocessor()
+    elif channel == "1lep":
+        pre = Hbb1LepDelphesPreprocessor()
+    else:
+        raise Exception("The requested channel is not supported!")
+
+    all_good = True
+    for infile_path in files:
+        # Note: both selections modify the loaded events in place, need to re-load them in between
+        pre.load(infile_path)
+        processed_columnar = pre.process(lumiweight = 1.0)
+        pre.load(infile_path)
+        processed_rowwise = pre.process_rowwise(lumiweight = 1.0)
+
+        if processed_columnar is None or processed_rowwise is None:
+            good = processed_columnar is None and processed_rowwise is None
+            print("{}: no events selected (columnar: {}, row-wise: {})".format(infile_path, processed_columnar is None, processed_rowwise is None))
+        elif len(processed_columnar) != len(processed_rowwise):
+            good = False
+            print("{}: selected {} events (columnar) vs. {} events (row-wise)".format(infile_path, len(processed_columnar), len(processed_rowwise)))
+        else:
+            good = True
+            for column in pre.output_branches:
+                values_columnar = processed_columnar[column].values.astype(np.float64)
+                values_rowwise = processed_rowwise[column].values.astype(np.float64)
+                if not np.allclose(values_columnar, values_rowwise, rtol = rtol, atol = 0.0, equal_nan = True):
+                    good = False
+                    print("{}: mismatch in column '{}' (max. abs. difference = {})".format(infile_path, column, np.nanmax(np.abs(values_columnar - values_rowwise))))
+            print("{}: compared {} selected events".format(infile_path, len(processed_columnar)))
+
+        all_good = all_good and good
+
+    print("columnar and row-wise selection {}".format("agree" if all_good else "DISAGREE"))
+    return all_good
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "compare the columnar event selection against the row-wise reference implementation")
+    parser.add_argument("--channel", action = "store", dest = "channel", default = "0lep")
+    parser.add_argument("--rtol", action = "store", dest = "rtol", type = float, default = 1e-6)
+    parser.add_argument("files", nargs = '+', action = "store")
+    args = vars(parser.parse_args())
+
+    if not CheckPreprocessorParity(**args):
+        raise SystemExit(1)
@@ -2,14 +2,16 @@ import os, glob
 from argparse import ArgumentParser
 
 from h5add import h5add
+from EventFileManifest import EventFileManifest
 
-def IsGoodEventFile(eventfile):
-    try:
-        import pandas as pd
-        df = pd.read_hdf(eventfile)
-        return True
-    except:
-        return False
+# the manifest caching the validation results of the event files, shared with CombineLumiFiles
+manifest_name = "event_manifest.json"
+
+def IsGoodEventFile(eventfile, manifest = None):
+    # Note: this only looks at the HDF5 metadata, the events themselves are not read
+    if manifest is None:
+        manifest = EventFileManifest()
+    return manifest.is_good(eventfile)
 
 def CombineEventFiles(indir, channel):
     from CombineLumiFiles import IsGoodLumiFile
@@ -25,16 +27,18 @@ def CombineEventFiles(indir, channel):
     # Note: this semi-automatic way of doing it is faster than simply
     #     lumifiles = glob.glob(os.path.join(indir, "**/lumi.conf"), recursive = True)
     sub_dirs = glob.glob(os.path.join(indir, '*/'))
+    manifest = EventFileManifest(os.path.join(indir, manifest_name))
     event_file_candidates = []
     for sub_dir in sub_dirs:
         eventfile_path = os.path.join(sub_dir, eventfile[channel])
 
         # ignore any subdirectory that does not have a lumi file in it
-        if IsGoodLumiFile(os.path.join(sub_dir, "lumi.conf")) and IsGoodEventFile(eventfile_path):
+        if IsGoodLumiFile(os.path.join(sub_dir, "lumi.conf")) and IsGoodEventFile(eventfile_path, manifest):
             event_file_candidates.append(eventfile_path)
         else:
             print("Warning: '{}' does not have a good lumi file or a corrupted event file, ignoring its events!".format(sub_dir))
 
+    manifest.save()
     print("have found {} good event files in this directory".format(len(event_file_candidates)))
 
     # combine them together
@@ -19,7 +19,8 @@ def IsGoodLumiFile(lumifile):
         return False
 
 def CombineLumiFiles(indir, channel):
-    from CombineEventFiles import IsGoodEventFile
+    from CombineEventFiles import IsGoodEventFile, manifest_name
+    from EventFileManifest import EventFileManifest
 
     """ combines all lumi.conf files found in all subdirectories """
 
@@ -32,12 +33,14 @@ def CombineLumiFiles(indir, channel):
     # Note: this semi-automatic way of doing it is faster than simply
     #     lumifiles = glob.glob(os.path.join(indir, "**/lumi.conf"), recursive = True)
     sub_dirs = glob.glob(os.path.join(indir, '*/'))
+    manifest = EventFileManifest(os.path.join(indir, manifest_name))
     lumifiles = []
     for sub_dir in sub_dirs:
         lumifile_path = os.path.join(sub_dir, "lumi.conf")
         eventfile_path = os.path.join(sub_dir, eventfile[channel])
-        if IsGoodLumiFile(lumifile_path) and IsGoodEventFile(eventfile_path):
+        if IsGoodLumiFile(lumifile_path) and IsGoodEventFile(eventfile_path, manifest):
             lumifiles.append(lumifile_path)
+    manifest.save()
 
     print("have found {} lumi files in this directory".format(len(lumifiles)))
 
@@ -0,0 +1,28 @@
+import os
+import numpy as np
+from argparse import ArgumentParser
+
+from base.Configs import TrainingConfig
+from base.CompiledDataset import CompiledDataset
+
+def CompileDataset(infile, outdir, dtype, random_state):
+    if os.path.exists(outdir):
+        raise Exception("Error: output directory already exists!")
+
+    slice_defs = {"training": TrainingConfig.training_slice, "validation": TrainingConfig.validation_slice, "test": TrainingConfig.test_slice}
+
+    dataset = CompiledDataset.compile(infile, outdir, sample_names = TrainingConfig.sig_samples + TrainingConfig.bkg_samples,
+                                      random_state = random_state, dtype = np.dtype(dtype), slice_defs = slice_defs)
+
+    for sample_name, sample in dataset.samples.items():
+        print("{}: {} events, slices: {}".format(sample_name, sample["nevents"], sample["slices"]))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "convert a training dataset into shuffled, memory-mappable column arrays")
+    parser.add_argument("--infile", action = "store", dest = "infile")
+    parser.add_argument("--outdir", action = "store", dest = "outdir")
+    parser.add_argument("--dtype", action = "store", dest = "dtype", default = "float32")
+    parser.add_argument("--random_state", action = "store", dest = "random_state", type = int, default = 12345)
+    args = vars(parser.parse_args())
+
+    CompileDataset(**args)
@@ -0,0 +1,58 @@
+import os, json
+
+from h5add import h5schema
+from base.CacheFiles import write_atomic
+
+class EventFileManifest:
+    """ Keeps track of the validity and content (tables, row counts and column schema) of event files, based on their
+    HDF5 metadata only. The results are cached on disk, keyed by the path, modification time and size of each file. """
+
+    def __init__(self, manifest_path = None):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.modified = False
+
+        if self.manifest_path is not None and os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r') as manifest_file:
+                    self.entries = json.load(manifest_file)
+            except ValueError:
+                print("manifest '{}' is corrupted, ignoring it".format(self.manifest_path))
+
+    @staticmethod
+    def _file_key(eventfile):
+        stat = os.stat(eventfile)
+        return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+    def lookup(self, eventfile):
+        """ return the manifest entry for this file, inspecting it if it is not known yet (or has changed) """
+        eventfile = os.path.abspath(eventfile)
+
+        try:
+            file_key = EventFileManifest._file_key(eventfile)
+        except OSError:
+            return {"good": False}
+
+        entry = self.entries.get(eventfile)
+        if entry is None or any(entry[key] != val for key, val in file_key.items()):
+            try:
+                schema = h5schema(eventfile)
+                tables = {table_name: {"nrows": nrows, "columns": columns} for table_name, (nrows, columns) in schema.items()}
+                good = len(tables) > 0 and all(len(table["columns"]) > 0 for table in tables.values())
+            except Exception:
+                tables = {}
+                good = False
+
+            entry = dict(file_key, good = good, tables = tables)
+            self.entries[eventfile] = entry
+            self.modified = True
+
+        return entry
+
+    def is_good(self, eventfile):
+        return self.lookup(eventfile)["good"]
+
+    def save(self):
+        if self.manifest_path is not None and self.modified:
+            write_atomic(self.manifest_path, lambda manifest_file: json.dump(self.entries, manifest_file, indent = 1))
+            self.modified = False
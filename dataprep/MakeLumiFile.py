@@ -3,9 +3,9 @@ from argparse import ArgumentParser
 from configparser import ConfigParser
 
 from delphes.CrossSectionReader import CrossSectionReader
-from delphes.Hbb0LepDelphesPreprocessor import Hbb0LepDelphesPreprocessor
+from delphes.SOWScanner import SOWScanner
 
-def GenerateLumiFile(input_dir, lumi, xsec = None):
+def GenerateLumiFile(input_dir, lumi, xsec = None, jobs = 1):
     # if no explicit cross section given, try to read it from the generator output
     if not xsec:
         # first, read the generator-level cross section
@@ -27,12 +27,12 @@ def GenerateLumiFile(input_dir, lumi, xsec = None):
     event_file_candidates = glob.glob(os.path.join(input_dir, "**/*.root"), recursive = True)
     print("found {} ROOT files for this process".format(len(event_file_candidates)))
 
-    pre = Hbb0LepDelphesPreprocessor()
-    
+    # Note: this only reads the event weights, and keeps the per-file results cached such that only new files need to be scanned
+    scanner = SOWScanner(cache_path = os.path.join(input_dir, "sow_cache.json"), jobs = jobs)
+    SOWs = scanner.scan(event_file_candidates)
+
     SOW = 0.0
-    for event_file in event_file_candidates:
-        pre.load(event_file)
-        cur_sow = pre.get_SOW()
+    for event_file, cur_sow in SOWs.items():
         print("found SOW = {} in '{}'".format(cur_sow, event_file))
 
         SOW += cur_sow
@@ -50,11 +50,13 @@ if __name__ == "__main__":
     parser.add_argument("dirs", nargs = '+', action = "store")
     parser.add_argument("--lumi", action = "store", dest = "lumi")
     parser.add_argument("--xsec", action = "store", dest = "xsec")
+    parser.add_argument("--jobs", action = "store", dest = "jobs", type = int, default = 1)
     args = vars(parser.parse_args())
 
     dirs = args["dirs"]
     lumi = float(args["lumi"])
     xsec = args["xsec"]
+    jobs = args["jobs"]
     if xsec:
         xsec = float(xsec)
 
@@ -62,4 +64,4 @@ if __name__ == "__main__":
 
     # generate a lumi file for each directory sequentially
     for cur_dir in dirs:
-        GenerateLumiFile(cur_dir, lumi, xsec)
+        GenerateLumiFile(cur_dir, lumi, xsec, jobs = jobs)
@@ -1,37 +1,91 @@
 import os
 import pandas as pd
+import multiprocessing as mp
+from collections import deque
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 
-def h5add(output_file, input_files):
-    tables = {}
-
-    for input_file in input_files:
-        # check which keys (i.e. tables) are available in the present input file
-        with pd.HDFStore(input_file) as hdf:
-            keys = hdf.keys()
-            available_tables = [os.path.basename(key) for key in keys]
-
-        # then, read in the tables present in this file
-        for cur_table_name in available_tables:
-            cur_table = pd.read_hdf(input_file, key = cur_table_name)
-            
-            if not cur_table_name in tables:
-                tables[cur_table_name] = []
-            tables[cur_table_name].append(cur_table)
-
-    # now, concatenate all the read tables and dump them into the output file
-    for cur_table_name in tables.keys():
-        merged_table = pd.concat(tables[cur_table_name]).reset_index(drop = True)
-            
-        if os.path.exists(output_file):
-            mode = 'a'
-        else:
-            mode = 'w'
-            
-        merged_table.to_hdf(output_file, key = cur_table_name, mode = mode)
+def h5schema(input_file):
+    """ Return the number of rows and the column schema of every table in 'input_file', without reading the data itself. """
+    schema = {}
+
+    with pd.HDFStore(input_file, mode = 'r') as hdf:
+        for key in hdf.keys():
+            storer = hdf.get_storer(key)
+            if storer.is_table:
+                nrows = storer.nrows
+            else:
+                # tables in 'fixed' format store their index as the second axis
+                nrows = storer.group.axis1.shape[0]
+
+            dtypes = hdf.select(key, start = 0, stop = 0).dtypes
+            schema[os.path.basename(key)] = (int(nrows), list(zip(dtypes.index, map(str, dtypes.values))))
+
+    return schema
+
+def _read_slice(input_file, table_name, start, stop):
+    with pd.HDFStore(input_file, mode = 'r') as hdf:
+        return hdf.select(table_name, start = start, stop = stop)
+
+def _read_slices(slices, threads):
+    """ Yields (table name, chunk) for all slices, in order. With more than one thread, the slices are read by a pool of processes. """
+    if threads <= 1:
+        for cur_slice in slices:
+            yield cur_slice[1], _read_slice(*cur_slice)
+        return
+
+    # PyTables is not thread-safe, but every reader process has its own copy of the HDF5 library and can read independently;
+    # they are spawned (not forked) such that they do not inherit the state of the output file
+    with ProcessPoolExecutor(max_workers = threads, mp_context = mp.get_context("spawn")) as pool:
+
+        # the readers prefetch a bounded number of slices, such that the memory usage stays constant
+        pending = deque()
+        for cur_slice in slices:
+            pending.append((cur_slice[1], pool.submit(_read_slice, *cur_slice)))
+            if len(pending) > 2 * threads:
+                cur_table_name, future = pending.popleft()
+                yield cur_table_name, future.result()
+
+        while len(pending) > 0:
+            cur_table_name, future = pending.popleft()
+            yield cur_table_name, future.result()
+
+def h5add(output_file, input_files, chunksize = 100000, threads = 1):
+    # check which tables are available in the input files, and make sure that they can be merged
+    schemas = [h5schema(input_file) for input_file in input_files]
+
+    table_columns = {}
+    for input_file, schema in zip(input_files, schemas):
+        for cur_table_name, (_, columns) in schema.items():
+            table_columns.setdefault(cur_table_name, (input_file, columns))
+            reference_file, reference_columns = table_columns[cur_table_name]
+            if columns != reference_columns:
+                raise Exception("Error: table '{}' in '{}' has columns {}, but {} in '{}'!".format(cur_table_name, input_file, columns, reference_columns, reference_file))
+
+    # then, read the input tables in chunks and append them to the output one after the other
+    slices = [(input_file, cur_table_name, start, min(start + chunksize, schema[cur_table_name][0])) for cur_table_name in table_columns.keys()
+              for input_file, schema in zip(input_files, schemas) if cur_table_name in schema
+              for start in range(0, schema[cur_table_name][0], chunksize)]
+
+    with pd.HDFStore(output_file, mode = 'a') as store:
+
+        # the merged tables replace any existing tables of the same name
+        for cur_table_name in table_columns.keys():
+            if cur_table_name in store:
+                store.remove(cur_table_name)
+
+        rows_written = {}
+        for cur_table_name, cur_chunk in _read_slices(slices, threads):
+            # the merged table gets a continuous index
+            offset = rows_written.get(cur_table_name, 0)
+            cur_chunk.index = pd.RangeIndex(offset, offset + len(cur_chunk))
+            store.append(cur_table_name, cur_chunk, format = "table", index = False)
+            rows_written[cur_table_name] = offset + len(cur_chunk)
 
 if __name__ == "__main__":
     parser = ArgumentParser("behaves like hadd, but for h5 files")
+    parser.add_argument("--chunksize", action = "store", dest = "chunksize", type = int, default = 100000)
+    parser.add_argument("--threads", action = "store", dest = "threads", type = int, default = 1)
     parser.add_argument("files", nargs = "+", action = "store")
     args = vars(parser.parse_args())
 
@@ -42,4 +96,4 @@ if __name__ == "__main__":
     if os.path.exists(output_file):
         raise Exception("Error: output file already exists!")
 
-    h5add(output_file, input_files)
+    h5add(output_file, input_files, chunksize = args["chunksize"], threads = args["threads"])
@@ -1,33 +1,110 @@
 import uproot as ur
+import numpy as np
+import pandas as pd
+
+from delphes.JaggedColumn import JaggedColumn
 
 class DelphesPreprocessor:
-    
+
     def __init__(self):
         self.df = None
+        self.columns = None
 
     def load(self, infile_path, branches):
         try:
             tree = ur.open(infile_path)["Delphes"]
-            self.df = tree.pandas.df(branches, flatten = False)
-            self.df.reset_index(drop = True)
+            self._set_arrays(tree.arrays(branches, namedecode = "utf-8"))
         except:
             # the Delphes tree is not available for some reason, do nothing
             print("file '{}' not found or problem reading it!".format(infile_path))
+            self.columns = None
+
+        self.df = None
+
+    def iterate(self, infile_path, branches, chunksize):
+        """ load the Delphes tree in chunks of 'chunksize' entries; the events of each chunk are available in turn """
+        try:
+            tree = ur.open(infile_path)["Delphes"]
+        except:
+            # the Delphes tree is not available for some reason, do nothing
+            print("file '{}' not found or problem reading it!".format(infile_path))
+            self.columns = None
+            return
+
+        for arrays in tree.iterate(branches, entrysteps = chunksize, namedecode = "utf-8"):
+            self._set_arrays(arrays)
             self.df = None
+            yield
 
     def process(self):
         """ do nothing by default; all the action happens in the overriding methods """
         return self.df
 
     def get_SOW(self):
-        if self.df is not None:
-            if len(self.df) > 0:
-                return float(sum(self._extract_column("Event.Weight")))
+        if self.columns is not None:
+            if self._number_events() > 0:
+                return float(np.sum(self._column("Event.Weight").nth(0)))
             else:
                 return 0.0
         else:
             return 0.0
 
+    # --------------------------------------------------------------
+    # columnar interface: every quantity is computed for all events at once
+    # --------------------------------------------------------------
+
+    def _set_arrays(self, arrays):
+        """ convert the arrays read from the Delphes tree into the columnar event representation """
+        self.columns = {}
+        for branch, values in arrays.items():
+            if hasattr(values, "counts"):
+                # object-level branch: promote floating-point content to double precision for all subsequent arithmetic
+                dtype = np.float64 if values.content.dtype.kind == 'f' else None
+                self.columns[branch] = JaggedColumn.from_awkward(values, dtype = dtype)
+            else:
+                self.columns[branch] = np.asarray(values)
+
+    def _number_events(self):
+        if self.columns is None or len(self.columns) == 0:
+            return 0
+
+        return len(next(iter(self.columns.values())))
+
+    def _column(self, column_name):
+        return self.columns[column_name]
+
+    def _set_column(self, column_name, values):
+        self.columns[column_name] = values
+
+    def _select_events(self, event_mask):
+        """ keep only the events passing 'event_mask' in all columns """
+        if self.columns is not None:
+            event_mask = np.asarray(event_mask, dtype = bool)
+            self.columns = {name: (column.take_events(event_mask) if isinstance(column, JaggedColumn) else column[event_mask]) for name, column in self.columns.items()}
+
+    def _export_columns(self, column_names):
+        """ return the requested (flat) columns as a pandas table, or None if no events are left """
+        if self._number_events() == 0:
+            return None
+
+        return pd.DataFrame({column_name: self.columns[column_name] for column_name in column_names}, columns = column_names)
+
+    @staticmethod
+    def _delta_phi(phi1, phi2):
+        dphi = np.abs(phi1 - phi2)
+        return np.where(dphi > np.pi, 2 * np.pi - dphi, dphi)
+
+    # --------------------------------------------------------------
+    # row-wise interface: kept as the reference implementation of the event selection
+    # --------------------------------------------------------------
+
+    def _columns_to_df(self):
+        """ build the (slow) pandas representation with one array per event and object-level branch """
+        if self.columns is None:
+            self.df = None
+        else:
+            self.df = pd.DataFrame({name: (column.to_arrays() if isinstance(column, JaggedColumn) else column) for name, column in self.columns.items()})
+
     def _add_column(self, column_name, fill_lambda):
         if self.df is not None:
             if len(self.df) >= 1:
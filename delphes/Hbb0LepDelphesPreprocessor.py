@@ -4,6 +4,8 @@ import numpy as np
 class Hbb0LepDelphesPreprocessor(DelphesPreprocessor):
 
     def __init__(self):
+        super(Hbb0LepDelphesPreprocessor, self).__init__()
+
         # the original branches needed for all subsequent processing steps
         self.input_branches = ["Event.Weight", "Electron.PT", "Muon.PT", "Jet.PT", "Jet.Mass", "Jet.Flavor", "Jet.Phi", "Jet.Eta", "MissingET.MET", "MissingET.Phi"]
 
@@ -15,7 +17,94 @@ class Hbb0LepDelphesPreprocessor(DelphesPreprocessor):
     def load(self, infile_path):
         super(Hbb0LepDelphesPreprocessor, self).load(infile_path = infile_path, branches = self.input_branches)
 
+    def iterate(self, infile_path, chunksize):
+        return super(Hbb0LepDelphesPreprocessor, self).iterate(infile_path = infile_path, branches = self.input_branches, chunksize = chunksize)
+
     def process(self, lumiweight):
+        if self.columns is None:
+            return None
+
+        if self._number_events() == 0:
+            return None
+
+        # ensure the correct normalization of these events
+        self._set_column("EventWeight", self._column("Event.Weight").nth(0) * lumiweight)
+
+        # count the number of electrons and muons (== leptons) above 7 GeV
+        muon_pt = self._column("Muon.PT")
+        electron_pt = self._column("Electron.PT")
+        self._set_column("number_hard_muons", muon_pt.count(muon_pt.content > 7.0))
+        self._set_column("number_hard_electrons", electron_pt.count(electron_pt.content > 7.0))
+        self._set_column("number_hard_leptons", self._column("number_hard_muons") + self._column("number_hard_electrons"))
+
+        # select only events with no hard leptons
+        self._select_events(self._column("number_hard_leptons") == 0)
+
+        # select only events with MET > 150 GeV
+        self._set_column("MET", self._column("MissingET.MET").nth(0)) # Delphes stores MET as a vector of length 1
+        self._select_events(self._column("MET") > 150)
+
+        # select only events with exactly 2 hard b-jets (use truth-tagging here to increase statistics)
+        jet_pt = self._column("Jet.PT")
+        is_b_jet = self._column("Jet.Flavor").content == 5
+        self._set_column("number_b_jets_truth_tagging", jet_pt.count(is_b_jet))
+        self._set_column("number_hard_b_jets", jet_pt.count(np.logical_and(jet_pt.content > 45.0, is_b_jet)))
+        self._select_events(np.logical_and(self._column("number_b_jets_truth_tagging") == 2, self._column("number_hard_b_jets") >= 1))
+
+        # also, use just events with either 2 or 3 jets
+        self._set_column("number_jets", self._column("Jet.Flavor").count())
+        self._set_column("nJ", self._column("number_jets"))
+        self._select_events(np.logical_or(self._column("number_jets") == 2, self._column("number_jets") == 3))
+
+        # cut on the scalar sum of jet p_T: 120 GeV for 2 jets, 150 GeV for 3 jets
+        self._set_column("SumPtJet", self._column("Jet.PT").sum())
+        self._select_events(self._column("SumPtJet") > np.where(self._column("number_jets") == 2, 120, 150))
+
+        # at this point, can flatten the properties of the two b-jets
+        is_b_jet = self._column("Jet.Flavor").content == 5
+        for column_name, branch in [("pTB", "Jet.PT"), ("phiB", "Jet.Phi"), ("etaB", "Jet.Eta"), ("mB", "Jet.Mass")]:
+            b_jets = self._column(branch).select(is_b_jet)
+            self._set_column(column_name + "1", b_jets.nth(0))
+            self._set_column(column_name + "2", b_jets.nth(1))
+
+        # also compute the jet energies of the two b-jets (needed later to get mBB)
+        for ind in ["1", "2"]:
+            pt, eta, phi, m = self._column("pTB" + ind), self._column("etaB" + ind), self._column("phiB" + ind), self._column("mB" + ind)
+            self._set_column("EB" + ind, np.sqrt(m ** 2 + (pt * np.cosh(eta)) ** 2))
+            self._set_column("pxB" + ind, pt * np.cos(phi))
+            self._set_column("pyB" + ind, pt * np.sin(phi))
+            self._set_column("pzB" + ind, pt * np.sinh(eta))
+
+        # get the Higgs candidate
+        for comp in ["px", "py", "pz", "E"]:
+            self._set_column(comp + "BB", self._column(comp + "B1") + self._column(comp + "B2"))
+        self._set_column("phiBB", np.arctan2(self._column("pyBB"), self._column("pxBB")))
+
+        # compute some of its properties
+        self._set_column("dEtaBB", np.abs(self._column("etaB1") - self._column("etaB2")))
+        self._set_column("dRBB", np.sqrt((self._column("etaB1") - self._column("etaB2")) ** 2 + self._delta_phi(self._column("phiB1"), self._column("phiB2")) ** 2))
+
+        # make sure that the MET does not point in the direction of any of the jets
+        jet_phi = self._column("Jet.Phi")
+        MET_phi = self._column("MissingET.Phi").nth(0)
+        self._select_events(jet_phi.all(self._delta_phi(jet_phi.broadcast(MET_phi), jet_phi.content) > np.pi / 6))
+
+        # make sure the MET and the Higgs candidate are separated
+        self._set_column("dPhiMETdijet", self._delta_phi(self._column("phiBB"), self._column("MissingET.Phi").nth(0)))
+        self._select_events(self._column("dPhiMETdijet") > 2 * np.pi / 3)
+
+        # make sure the two b-jets are not too close to each other
+        self._select_events(self._delta_phi(self._column("phiB1"), self._column("phiB2")) < 7 * np.pi / 9)
+
+        # compute the invariant mass of the two b-jets
+        self._set_column("mBB", np.sqrt(self._column("EBB") ** 2 - self._column("pxBB") ** 2 - self._column("pyBB") ** 2 - self._column("pzBB") ** 2))
+
+        return self._export_columns(self.output_branches)
+
+    def process_rowwise(self, lumiweight):
+        """ reference implementation of 'process', operating on one event at a time """
+        self._columns_to_df()
+
         if self.df is None:
             return None
 
@@ -4,6 +4,8 @@ import numpy as np
 class Hbb1LepDelphesPreprocessor(DelphesPreprocessor):
 
     def __init__(self):
+        super(Hbb1LepDelphesPreprocessor, self).__init__()
+
         self.input_branches = ["Event.Weight", "Electron.PT", "Electron.Eta", "Electron.Phi", "Muon.PT", "Muon.Eta", "Muon.Phi", "Jet.PT", "Jet.Mass", "Jet.Flavor", "Jet.Phi", "Jet.Eta", "MissingET.MET", "MissingET.Phi"]
 
         self.permanent_output_branches = ["EventWeight", "MET", "pTB1", "pTB2", "mBB", "dRBB", "dEtaBB", "dPhiVH", "dPhilb", "mTW", "mtop", "dEtaVH", "pTV"]
@@ -12,7 +14,143 @@ class Hbb1LepDelphesPreprocessor(DelphesPreprocessor):
     def load(self, infile_path):
         super(Hbb1LepDelphesPreprocessor, self).load(infile_path = infile_path, branches = self.input_branches)
 
+    def iterate(self, infile_path, chunksize):
+        return super(Hbb1LepDelphesPreprocessor, self).iterate(infile_path = infile_path, branches = self.input_branches, chunksize = chunksize)
+
     def process(self, lumiweight):
+        if self.columns is None:
+            return None
+
+        if self._number_events() == 0:
+            return None
+
+        # ensure the correct normalization of these events
+        self._set_column("EventWeight", self._column("Event.Weight").nth(0) * lumiweight)
+
+        # count the number of hard electrons and muons (== leptons)
+        muon_pt = self._column("Muon.PT")
+        electron_pt = self._column("Electron.PT")
+        self._set_column("number_hard_muons", muon_pt.count(muon_pt.content > 25.0))
+        self._set_column("number_hard_electrons", electron_pt.count(electron_pt.content > 27.0))
+        self._set_column("number_hard_leptons", self._column("number_hard_muons") + self._column("number_hard_electrons"))
+
+        # select only events with exactly one hard lepton
+        self._select_events(self._column("number_hard_leptons") == 1)
+
+        # select only events with either 2 or 3 jets passing some pT requirement
+        jet_pt = self._column("Jet.PT")
+        jet_eta = self._column("Jet.Eta").content
+        self._set_column("number_passing_jets", jet_pt.count(np.logical_and(jet_eta < 2.5, jet_pt.content > 20)) + jet_pt.count(np.logical_and(jet_eta > 2.5, jet_pt.content > 30)))
+        self._select_events(np.logical_or(self._column("number_passing_jets") == 2, self._column("number_passing_jets") == 3))
+
+        # select only events with exactly 2 hard b-jets (use truth-tagging here to increase statistics)
+        jet_pt = self._column("Jet.PT")
+        is_b_jet = self._column("Jet.Flavor").content == 5
+        self._set_column("number_b_jets_truth_tagging", jet_pt.count(is_b_jet))
+        self._set_column("number_hard_b_jets", jet_pt.count(np.logical_and(jet_pt.content > 45.0, is_b_jet)))
+        self._select_events(np.logical_and(self._column("number_b_jets_truth_tagging") == 2, self._column("number_hard_b_jets") >= 1))
+
+        # put selection on the MET: electron events need MET > 30 GeV, no additional MET requirement for muons
+        self._set_column("MET", self._column("MissingET.MET").nth(0)) # Delphes stores MET as a vector of length 1
+        self._select_events(np.logical_or(self._column("number_hard_electrons") != 1, self._column("MET") > 30))
+
+        # flatten the properties of the single lepton in the event (take it as massless)
+        is_hard_muon = self._column("Muon.PT").content > 25.0
+        is_hard_electron = self._column("Electron.PT").content > 27
+        has_hard_muon = self._column("number_hard_muons") > 0
+        for column_name, muon_branch, electron_branch in [("lepton_pt", "Muon.PT", "Electron.PT"), ("lepton_eta", "Muon.Eta", "Electron.Eta"), ("lepton_phi", "Muon.Phi", "Electron.Phi")]:
+            self._set_column(column_name, np.where(has_hard_muon, self._column(muon_branch).select(is_hard_muon).nth(0), self._column(electron_branch).select(is_hard_electron).nth(0)))
+
+        lepton_pt, lepton_eta, lepton_phi = self._column("lepton_pt"), self._column("lepton_eta"), self._column("lepton_phi")
+        self._set_column("px_lepton", lepton_pt * np.cos(lepton_phi))
+        self._set_column("py_lepton", lepton_pt * np.sin(lepton_phi))
+        self._set_column("pz_lepton", lepton_pt * np.sinh(lepton_eta))
+        self._set_column("E_lepton", lepton_pt * np.cosh(lepton_eta))
+
+        # flatten the properties of the MET
+        MET, MET_phi = self._column("MET"), self._column("MissingET.Phi").nth(0)
+        self._set_column("pxMET", MET * np.cos(MET_phi))
+        self._set_column("pyMET", MET * np.sin(MET_phi))
+
+        # reconstruct the longitudinal neutrino momentum from the W mass constraint
+        mW = 80.37
+        px_lepton, py_lepton, pz_lepton = self._column("px_lepton"), self._column("py_lepton"), self._column("pz_lepton")
+        pxMET, pyMET = self._column("pxMET"), self._column("pyMET")
+        X = mW**2 + 2 * px_lepton * pxMET + 2 * py_lepton * pyMET
+        has_real_solution = np.abs(X) > np.abs(2 * lepton_pt * MET)
+
+        # for an imaginary solution, instead rescale the MET to make the discriminant zero
+        alpha = mW**2 / (2 * lepton_pt * MET - 2 * px_lepton * pxMET - 2 * py_lepton * pyMET)
+        pzMET_rescaled = 1 / (2 * lepton_pt ** 2) * pz_lepton * (mW**2 + 2 * px_lepton * pxMET * alpha + 2 * py_lepton * pyMET * alpha)
+
+        discriminant = np.sqrt(np.where(has_real_solution, X**2 - 4 * (lepton_pt * MET)**2, 0.0))
+        self._set_column("pzMET1", np.where(has_real_solution, 1 / (2 * lepton_pt ** 2) * (X * pz_lepton + discriminant), pzMET_rescaled))
+        self._set_column("pzMET2", np.where(has_real_solution, 1 / (2 * lepton_pt ** 2) * (X * pz_lepton - discriminant), pzMET_rescaled))
+        self._set_column("EMET1", np.sqrt(MET**2 + self._column("pzMET1")**2))
+        self._set_column("EMET2", np.sqrt(MET**2 + self._column("pzMET2")**2))
+
+        # flatten the properties of the two b-jets
+        is_b_jet = self._column("Jet.Flavor").content == 5
+        for column_name, branch in [("pTB", "Jet.PT"), ("phiB", "Jet.Phi"), ("etaB", "Jet.Eta"), ("mB", "Jet.Mass")]:
+            b_jets = self._column(branch).select(is_b_jet)
+            self._set_column(column_name + "1", b_jets.nth(0))
+            self._set_column(column_name + "2", b_jets.nth(1))
+
+        # also compute the jet energies of the two b-jets (needed later to get mBB)
+        for ind in ["1", "2"]:
+            pt, eta, phi, m = self._column("pTB" + ind), self._column("etaB" + ind), self._column("phiB" + ind), self._column("mB" + ind)
+            self._set_column("EB" + ind, np.sqrt(m ** 2 + (pt * np.cosh(eta)) ** 2))
+            self._set_column("pxB" + ind, pt * np.cos(phi))
+            self._set_column("pyB" + ind, pt * np.sin(phi))
+            self._set_column("pzB" + ind, pt * np.sinh(eta))
+
+        # get the Higgs candidate
+        for comp in ["px", "py", "pz", "E"]:
+            self._set_column(comp + "BB", self._column(comp + "B1") + self._column(comp + "B2"))
+        self._set_column("pTBB", np.sqrt(self._column("pxBB")**2 + self._column("pyBB")**2))
+        self._set_column("phiBB", np.arctan2(self._column("pyBB"), self._column("pxBB")))
+        self._set_column("etaBB", np.arcsinh(self._column("pzBB") / self._column("pTBB")))
+
+        self._set_column("dEtaBB", np.abs(self._column("etaB1") - self._column("etaB2")))
+        self._set_column("dRBB", np.sqrt((self._column("etaB1") - self._column("etaB2")) ** 2 + self._delta_phi(self._column("phiB1"), self._column("phiB2")) ** 2))
+
+        # compute the invariant mass of the two b-jets
+        self._set_column("mBB", np.sqrt(self._column("EBB") ** 2 - self._column("pxBB") ** 2 - self._column("pyBB") ** 2 - self._column("pzBB") ** 2))
+
+        # attempt to reconstruct the top from the neutrino, lepton and one of the b-jets
+        for ind in ["1", "2"]:
+            self._set_column("mtop" + ind, np.sqrt((self._column("E_lepton") + self._column("EMET" + ind) + self._column("EB" + ind)) ** 2 -
+                                                   (px_lepton + pxMET + self._column("pxB" + ind)) ** 2 -
+                                                   (py_lepton + pyMET + self._column("pyB" + ind)) ** 2 -
+                                                   (pz_lepton + self._column("pzMET" + ind) + self._column("pzB" + ind)) ** 2))
+
+        # use the solution for METz that minimizes mtop (with the same NaN-handling as np.min / np.argmin)
+        mtop1, mtop2 = self._column("mtop1"), self._column("mtop2")
+        self._set_column("mtop", np.minimum(mtop1, mtop2))
+        use_first_solution = np.logical_or(np.isnan(mtop1), np.logical_and(np.logical_not(np.isnan(mtop2)), mtop1 <= mtop2))
+        self._set_column("pzMET", np.where(use_first_solution, self._column("pzMET1"), self._column("pzMET2")))
+
+        # put the final signal region cut on mbb and mtop
+        self._select_events(np.logical_or(self._column("mBB") >= 75, self._column("mtop") <= 225))
+
+        # compute transverse momentum of the V boson (as sum of MET and the lepton)
+        pxV = self._column("pxMET") + self._column("px_lepton")
+        pyV = self._column("pyMET") + self._column("py_lepton")
+        self._set_column("pTV", np.sqrt(pxV**2 + pyV**2))
+        self._set_column("phiV", np.arctan2(pyV, pxV))
+        self._set_column("etaV", np.arcsinh((self._column("pzMET") + self._column("lepton_pt")) / self._column("pTV")))
+        self._set_column("dEtaVH", np.abs(self._column("etaV") - self._column("etaBB")))
+
+        self._set_column("dPhiVH", self._delta_phi(self._column("phiV"), self._column("phiBB")))
+        self._set_column("dPhilb", np.minimum(self._delta_phi(self._column("lepton_phi"), self._column("phiB1")), self._delta_phi(self._column("lepton_phi"), self._column("phiB2"))))
+        self._set_column("mTW", np.sqrt(2 * self._column("lepton_pt") * self._column("MET") * (1 - np.cos(self._delta_phi(self._column("lepton_phi"), self._column("MissingET.Phi").nth(0))))))
+
+        return self._export_columns(self.output_branches)
+
+    def process_rowwise(self, lumiweight):
+        """ reference implementation of 'process', operating on one event at a time """
+        self._columns_to_df()
+
         if self.df is None:
             return None
 
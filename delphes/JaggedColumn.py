@@ -0,0 +1,99 @@
+import numpy as np
+
+class JaggedColumn:
+    """ A per-event list of objects (jets, leptons, ...), stored as a flat content array and per-event offsets. """
+
+    def __init__(self, content, counts):
+        self.content = np.asarray(content)
+        self.counts = np.asarray(counts, dtype = np.int64)
+
+        self.offsets = np.zeros(len(self.counts) + 1, dtype = np.int64)
+        np.cumsum(self.counts, out = self.offsets[1:])
+
+        if len(self.content) != self.offsets[-1]:
+            raise Exception("Error: content and counts of this column are not compatible!")
+
+    @classmethod
+    def from_awkward(cls, jagged, dtype = None):
+        """ build from a JaggedArray as returned by uproot's 'tree.arrays' """
+        content = jagged.flatten()
+        if dtype is not None:
+            content = content.astype(dtype)
+
+        return cls(content, jagged.counts)
+
+    @classmethod
+    def from_arrays(cls, arrays, dtype = None):
+        """ build from a sequence of per-event arrays (e.g. an object-column of a pandas table) """
+        counts = np.array([len(cur) for cur in arrays], dtype = np.int64)
+        content = np.concatenate(list(arrays)) if len(arrays) > 0 else np.zeros(0)
+        if dtype is not None:
+            content = content.astype(dtype)
+
+        return cls(content, counts)
+
+    def to_arrays(self):
+        """ split back into a list of per-event arrays """
+        return np.split(self.content, self.offsets[1:-1])
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def parents(self):
+        """ the index of the event each object belongs to """
+        return np.repeat(np.arange(len(self.counts)), self.counts)
+
+    @property
+    def local_index(self):
+        """ the position of each object within its own event """
+        return np.arange(len(self.content)) - np.repeat(self.offsets[:-1], self.counts)
+
+    def broadcast(self, event_values):
+        """ repeat a per-event quantity once for every object in that event """
+        return np.asarray(event_values)[self.parents]
+
+    def sum(self, mask = None):
+        """ per-event sum over all objects (or only over those passing 'mask') """
+        values = self.content if mask is None else np.where(mask, self.content, 0)
+        retval = np.zeros(len(self.counts), dtype = np.float64 if values.dtype.kind == 'f' else np.int64)
+
+        # Note: 'reduceat' gives wrong results for empty segments, so only apply it to the non-empty ones
+        nonempty = self.counts > 0
+        if np.any(nonempty):
+            retval[nonempty] = np.add.reduceat(values, self.offsets[:-1][nonempty])
+
+        return retval
+
+    def count(self, mask = None):
+        """ per-event number of objects (or only of those passing 'mask') """
+        if mask is None:
+            return self.counts.copy()
+
+        return JaggedColumn(np.asarray(mask, dtype = np.int64), self.counts).sum()
+
+    def all(self, mask):
+        """ per-event flag whether all objects pass 'mask' (true for events without objects) """
+        return self.count(np.logical_not(mask)) == 0
+
+    def any(self, mask):
+        """ per-event flag whether at least one object passes 'mask' """
+        return self.count(mask) > 0
+
+    def select(self, mask):
+        """ keep only the objects passing 'mask', preserving their order within each event """
+        mask = np.asarray(mask, dtype = bool)
+        return JaggedColumn(self.content[mask], self.count(mask))
+
+    def nth(self, n, default = np.nan):
+        """ per-event value of the n-th object, 'default' for events with fewer objects """
+        has_nth = self.counts > n
+        retval = np.full(len(self.counts), default, dtype = np.result_type(self.content.dtype, np.asarray(default).dtype))
+        retval[has_nth] = self.content[self.offsets[:-1][has_nth] + n]
+
+        return retval
+
+    def take_events(self, event_mask):
+        """ keep only the events passing 'event_mask' """
+        event_mask = np.asarray(event_mask, dtype = bool)
+        return JaggedColumn(self.content[np.repeat(event_mask, self.counts)], self.counts[event_mask])
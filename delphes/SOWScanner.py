@@ -0,0 +1,80 @@
+import os, json
+import numpy as np
+import uproot as ur
+from multiprocessing import Pool
+
+from base.CacheFiles import write_atomic
+from delphes.JaggedColumn import JaggedColumn
+
+class SOWScanner:
+    """ Computes the sum of event weights of Delphes files, reading nothing but the weight branch. Per-file results are
+    cached (keyed by the path, modification time and size of each file), such that only new or changed files are scanned again. """
+
+    def __init__(self, cache_path = None, jobs = 1, chunksize = 1000000):
+        self.cache_path = cache_path
+        self.jobs = jobs
+        self.chunksize = chunksize
+
+    @staticmethod
+    def scan_file(infile_path, chunksize = 1000000):
+        """ return the SOW of a single file, or None if it cannot be read """
+        try:
+            tree = ur.open(infile_path)["Delphes"]
+
+            SOW = 0.0
+            for chunk in tree.iterate(["Event.Weight"], entrysteps = chunksize, namedecode = "utf-8"):
+                # Delphes stores the event weight as a vector of length 1
+                SOW += float(np.sum(JaggedColumn.from_awkward(chunk["Event.Weight"], dtype = np.float64).nth(0, default = 0.0)))
+
+            return SOW
+        except:
+            print("file '{}' not found or problem reading it!".format(infile_path))
+            return None
+
+    @staticmethod
+    def _file_key(infile_path):
+        stat = os.stat(infile_path)
+        return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+    def _load_cache(self):
+        if self.cache_path is not None and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r') as cache_file:
+                    return json.load(cache_file)
+            except ValueError:
+                print("SOW cache '{}' is corrupted, ignoring it".format(self.cache_path))
+
+        return {}
+
+    def _save_cache(self, cache):
+        if self.cache_path is not None:
+            write_atomic(self.cache_path, lambda cache_file: json.dump(cache, cache_file, indent = 1))
+
+    def _scan_file_job(self, infile_path):
+        return SOWScanner.scan_file(infile_path, chunksize = self.chunksize)
+
+    def scan(self, infile_paths):
+        """ return a dictionary with the SOW of every file (0.0 for unreadable files) """
+        cache = self._load_cache()
+        file_keys = {os.path.abspath(infile_path): SOWScanner._file_key(infile_path) for infile_path in infile_paths}
+
+        # only look at the files that are not yet known (or have changed since they were last scanned)
+        to_scan = [infile_path for infile_path, file_key in file_keys.items() if not (infile_path in cache and all(cache[infile_path][key] == val for key, val in file_key.items()))]
+        print("have SOW for {} files cached, need to scan {} files".format(len(file_keys) - len(to_scan), len(to_scan)))
+
+        if self.jobs > 1 and len(to_scan) > 1:
+            with Pool(processes = self.jobs) as pool:
+                scanned = pool.map(self._scan_file_job, to_scan, chunksize = 1)
+        else:
+            scanned = [self._scan_file_job(infile_path) for infile_path in to_scan]
+
+        for infile_path, SOW in zip(to_scan, scanned):
+            if SOW is not None:
+                # only cache successful scans, such that broken files are attempted again next time
+                cache[infile_path] = dict(file_keys[infile_path], SOW = SOW)
+            else:
+                cache.pop(infile_path, None)
+
+        self._save_cache(cache)
+
+        return {infile_path: (cache[infile_path]["SOW"] if infile_path in cache else 0.0) for infile_path in file_keys.keys()}
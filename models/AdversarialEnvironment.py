@@ -14,6 +14,7 @@ from models.DisCoAdversary import DisCoAdversary
 from models.PtEstAdversary import PtEstAdversary
 from base.PCAWhiteningPreprocessor import PCAWhiteningPreprocessor
 from base.Configs import TrainingConfig
+from base.PredictionCache import PredictionCache
 
 from utils.NeuralMIEstimator import NeuralMIEstimator
 from utils.BinnedMIEstimator import BinnedMIEstimator
@@ -32,6 +33,10 @@ class AdversarialEnvironment(TFEnvironment):
 
         self.global_pars = global_pars
 
+        # predictions of an environment loaded from disk are only computed once for every input
+        self.prediction_cache = PredictionCache()
+        self.model_fingerprint = None
+
     # attempt to reconstruct a previously built graph, including loading back its weights
     @classmethod
     def from_file(cls, config_dir):
@@ -174,6 +179,7 @@ class AdversarialEnvironment(TFEnvironment):
             self.saver = tf.train.Saver()
 
     def init(self, data_train, data_nuisance):
+        self.model_fingerprint = None # the environment is about to be trained
         self.pre.setup(data_train)
         self.pre_nuisance.setup(data_nuisance)
 
@@ -298,25 +304,42 @@ class AdversarialEnvironment(TFEnvironment):
         print("classifier loss (2j): {:.4e}, classifier loss (3j): {:.4e}, adv. loss (2j) = {:.4e}, adv. loss (3j) = {:.4e}".format(classifier_lossval_2j, classifier_lossval_3j, adversary_lossval_2j, adversary_lossval_3j))
 
     # use the model to make predictions on 'data', adhering to a certain batch size for evolution
-    def predict(self, data, auxdat = None, pred_size = 256, use_dropout = True, seed = 12345):
+    # for an environment loaded from disk, the returned predictions are cached and must not be modified
+    def predict(self, data, auxdat = None, pred_size = 65536, use_dropout = True, seed = 12345):
         if auxdat is None:
             nJ = data[:, TrainingConfig.training_branches.index("nJ")]
         else:
             nJ = auxdat[:, TrainingConfig.auxiliary_branches.index("nJ")]
+
+        cache_key = None
+        if self.model_fingerprint is not None:
+            # the predictions also depend on the jet multiplicity of every event and on the random seed
+            cache_key = self.prediction_cache.key("{}_{}_{}".format(self.model_fingerprint, seed, PredictionCache.fingerprint_data(nJ)), data)
+            cached = self.prediction_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         data_pre = self.pre.process(data)
 
         datlen = len(data_pre)
-        chunks = np.split(data_pre, datlen / pred_size, axis = 0)
-        nJ_chunks = np.split(nJ, datlen / pred_size, axis = 0)
+        retval = None
+
+        with self.graph.as_default():
+            tf.set_random_seed(seed)
+
+            # fill the predictions of all chunks into the same output array
+            for start in range(0, datlen, pred_size):
+                stop = min(start + pred_size, datlen)
+                retval_cur = self.sess.run(self.classifier_out, feed_dict = {self.data_in: data_pre[start:stop], self.is_training: False, self.nJ_in: nJ[start:stop]})
 
-        retvals = []
-        for chunk, nJ_chunk in zip(chunks, nJ_chunks):
-            with self.graph.as_default():
-                tf.set_random_seed(seed)
-                retval_cur = self.sess.run(self.classifier_out, feed_dict = {self.data_in: chunk, self.is_training: False, self.nJ_in: nJ_chunk})
-                retvals.append(retval_cur)
+                if retval is None:
+                    retval = np.empty((datlen,) + retval_cur.shape[1:], dtype = retval_cur.dtype)
+                retval[start:stop] = retval_cur
 
-        return np.concatenate(retvals, axis = 0)
+        if cache_key is not None and retval is not None:
+            retval = self.prediction_cache.put(cache_key, retval)
+
+        return retval
 
     def get_model_statistics(self, data, nuisances, labels, weights, auxdat_step):
         retdict = {}
@@ -345,12 +368,15 @@ class AdversarialEnvironment(TFEnvironment):
 
     # try to load back the environment
     def load(self, indir):
+        self.model_fingerprint = None
         file_path = os.path.join(indir, "model.dat")
+        weights_loaded = False
 
         with self.graph.as_default():
             try:
                 self.saver.restore(self.sess, file_path)
                 print("weights successfully loaded for " + indir)
+                weights_loaded = True
             except:
                 print("no model checkpoint found, continuing with uninitialized graph!")
         try:
@@ -359,6 +385,12 @@ class AdversarialEnvironment(TFEnvironment):
             print("preprocessors successfully loaded for " + indir)
         except FileNotFoundError:
             print("no preprocessors found")
+            return
+
+        # the checkpoint index holds the checksums of all weights, together with the preprocessor it determines the predictions
+        weights_path = file_path + ".index"
+        if weights_loaded and os.path.exists(weights_path):
+            self.model_fingerprint = PredictionCache.fingerprint_files([weights_path, os.path.join(indir, "pre.pkl")])
 
     # save the entire environment such that it can be set up again from here
     def save(self, outdir):
@@ -5,6 +5,7 @@ from configparser import ConfigParser
 import tensorflow as tf
 
 from base.PCAWhiteningPreprocessor import PCAWhiteningPreprocessor
+from base.PredictionCache import PredictionCache
 
 # possible concrete models that are supported
 from models.GMMAdversary import GMMAdversary
@@ -20,11 +21,23 @@ from base.Configs import TrainingConfig
 
 class AdversarialModel:
 
-    def __init__(self, name, classifier_model, adversary_model, global_pars, path = None, training_config = {}):
+    def __init__(self, name, classifier_model, adversary_model, global_pars, path = None, training_config = {}, shared_with = None, scope_prefix = "", fused_train_ops = True):
         self.classifier_model = classifier_model
         self.adversary_model = adversary_model
         self.training_config = training_config
 
+        # several models (e.g. for different values of lambda) can live in the same graph and session, and share their inputs:
+        # the networks of each one are then built in separate variable scopes, starting with 'scope_prefix'
+        self.shared_with = shared_with
+        self.scope_prefix = scope_prefix
+
+        # whether to build the fused training ops of this model alone; models that are trained together with others (see
+        # 'AdversarialModelSweep') are updated by the joint fused ops instead, which are built separately
+        self.fused_train_ops = fused_train_ops and self.shared_with is None
+
+        self.classifier_graph_model = self._make_scoped(self.classifier_model)
+        self.adversary_graph_model = self._make_scoped(self.adversary_model)
+
         self.pre = None
         self.pre_nuisance = None
 
@@ -32,14 +45,46 @@ class AdversarialModel:
         self.data_formatter = eval(global_pars["data_formatter"])()
 
         self.lambda_final = float(self.global_pars["lambda"])
-        self.graph = tf.Graph()
+
+        # memory that the intermediate results of the classifier may take up during inference, this determines the size of the chunks
+        self.inference_memory = float(self.global_pars.get("inference_memory_mb", 256)) * 1024 ** 2
+
+        # predictions are only cached for a model that is fully defined by the files it was loaded from (see 'load')
+        self.prediction_cache = PredictionCache()
+        self.model_fingerprint = None
+
+        # apply the whitening transformations inside the graph instead of calling the preprocessors on every batch
+        self.preprocess_in_graph = self.global_pars.getboolean("preprocess_in_graph", fallback = False)
+
+        # number of training updates to perform in a single session call (needs the batches to be sampled inside the graph)
+        self.fused_steps = max(int(float(self.training_config.get("fused_steps", 1))), 1)
+
+        # sample the training batches inside the graph (this needs the raw inputs, i.e. the preprocessing to happen there as well)
+        self.use_input_pipeline = float(self.training_config.get("tf_input_pipeline", 0)) > 0 or self.fused_steps > 1
+        if self.use_input_pipeline:
+            self.preprocess_in_graph = True
 
         self.path = path
         self.name = name
-        self.sess = self.sess = tf.Session(graph = self.graph, 
-                                           config = TrainingConfig.session_config)
 
-        self.private_DisCo_adversary = DisCoAdversary("private_DisCo", hyperpars = {})
+        if self.shared_with is None:
+            self.graph = tf.Graph()
+            self.sess = self.sess = tf.Session(graph = self.graph, 
+                                               config = TrainingConfig.make_session_config(self.training_config.get("num_threads", None)))
+        else:
+            # the inputs (and therefore the way they are provided and preprocessed) are those of the other model
+            self.graph = self.shared_with.graph
+            self.sess = self.shared_with.sess
+            self.preprocess_in_graph = self.shared_with.preprocess_in_graph
+            self.fused_steps = self.shared_with.fused_steps
+            self.use_input_pipeline = self.shared_with.use_input_pipeline
+
+        self.private_DisCo_adversary = DisCoAdversary(self.scope_prefix + "private_DisCo", hyperpars = {})
+
+    def _make_scoped(self, model):
+        if not self.scope_prefix:
+            return model
+        return type(model)(self.scope_prefix + model.name, hyperpars = model.hyperpars)
 
     @staticmethod
     def extract_config(model_name, config):
@@ -59,7 +104,7 @@ class AdversarialModel:
         return gconfig
 
     @classmethod
-    def from_config(cls, config_dir):
+    def from_config(cls, config_dir, shared_with = None, scope_prefix = "", fused_train_ops = True):
         gconfig = ConfigParser()
         gconfig.read(os.path.join(config_dir, "meta.conf"))
 
@@ -81,7 +126,7 @@ class AdversarialModel:
 
         mod = classifier_model(classifier_model_name, hyperpars = classifier_hyperpars)
         adv = adversary_model(adversary_model_name, hyperpars = adversary_hyperpars)
-        obj = cls(model_name, mod, adv, global_pars, path = config_dir, training_config = training_config)
+        obj = cls(model_name, mod, adv, global_pars, path = config_dir, training_config = training_config, shared_with = shared_with, scope_prefix = scope_prefix, fused_train_ops = fused_train_ops)
 
         # then re-build the graph using these settings
         obj.build()
@@ -96,71 +141,320 @@ class AdversarialModel:
         num_nuisances = int(float(self.global_pars["num_nuisances"]))
 
         with self.graph.as_default():
-            self.pre = PCAWhiteningPreprocessor(num_inputs)
-            self.pre_nuisance = PCAWhiteningPreprocessor(num_nuisances)
-            
-            # prepare the inputs
+            if self.shared_with is not None:
+                self._share_inputs(self.shared_with)
+            else:
+                self._build_inputs(num_inputs, num_nuisances)
+
+            self.lambdaval = tf.placeholder_with_default([self.lambda_final], [1], name = 'lambdaval')
+            self.lambdaval_private_DisCo = tf.placeholder(tf.float32, [1], name = 'lambdaval_private_DisCo')
+
+            # the learning rates follow the decay schedule in the graph, unless they are fed explicitly
+            self.classifier_step = tf.Variable(0, dtype = tf.int64, trainable = False, name = "classifier_step")
+            self.adversary_step = tf.Variable(0, dtype = tf.int64, trainable = False, name = "adversary_step")
+            self.classifier_adv_step = tf.Variable(0, dtype = tf.int64, trainable = False, name = "classifier_adv_step")
+
+            self.classifier_lr = tf.placeholder_with_default(self._build_lr_scheduler("adam_clf", self.classifier_step), [], name = "classifier_lr")
+            self.adversary_lr = tf.placeholder_with_default(self._build_lr_scheduler("adam_adv", self.adversary_step), [], name = "adversary_lr")
+            self.classifier_adv_lr = tf.placeholder_with_default(self._build_lr_scheduler("adam_clf_adv", self.classifier_adv_step), [], name = "classifier_adv_lr")
+
+            losses = self._build_losses(self.data_in, self.nuisances_in, self.labels_in, self.weights_in)
+            self.data_pre, self.nuisances_pre = losses["data_pre"], losses["nuisances_pre"]
+            self.weights_bkg = losses["weights_bkg"]
+            self.classifier_out, self.classifier_vars = losses["classifier_out"], losses["classifier_vars"]
+            self.classifier_out_single = losses["classifier_out_single"]
+            self.classification_loss = losses["classification_loss"]
+            self.adv_loss, self.adversary_vars = losses["adv_loss"], losses["adversary_vars"]
+            self.total_loss = losses["total_loss"]
+
+            self._build_inference(num_inputs)
+
+            self.private_DisCo_adv_loss, _ = self.private_DisCo_adversary.build_loss(self.classifier_out_single, self.nuisances_pre, weights = self.weights_bkg, is_training = self.is_training)
+            self.private_DisCo_total_loss = self.classification_loss + self.lambdaval_private_DisCo * (-self.private_DisCo_adv_loss)
+
+            # set up the optimisers
+            self.classifier_optimizer = tf.train.AdamOptimizer(learning_rate = self.classifier_lr, 
+                                                               beta1 = float(self.global_pars["adam_clf_beta1"]), 
+                                                               beta2 = float(self.global_pars["adam_clf_beta2"]), 
+                                                               epsilon = float(self.global_pars["adam_clf_eps"]))
+            self.train_classifier_standalone = self.classifier_optimizer.minimize(self.classification_loss, var_list = self.classifier_vars, global_step = self.classifier_step)
+
+            self.adversary_optimizer = tf.train.AdamOptimizer(learning_rate = self.adversary_lr,
+                                                              beta1 = float(self.global_pars["adam_adv_beta1"]), 
+                                                              beta2 = float(self.global_pars["adam_adv_beta2"]), 
+                                                              epsilon = float(self.global_pars["adam_adv_eps"]))
+            self.train_adversary_standalone = self.adversary_optimizer.minimize(self.adv_loss, var_list = self.adversary_vars, global_step = self.adversary_step)
+
+            self.classifier_adv_optimizer = tf.train.AdamOptimizer(learning_rate = self.classifier_adv_lr, 
+                                                                   beta1 = float(self.global_pars["adam_clf_adv_beta1"]), 
+                                                                   beta2 = float(self.global_pars["adam_clf_adv_beta2"]), 
+                                                                   epsilon = float(self.global_pars["adam_clf_adv_eps"]))
+            self.train_classifier_adv = self.classifier_adv_optimizer.minimize(self.total_loss, var_list = self.classifier_vars, global_step = self.classifier_adv_step)
+
+            # training ops that perform several updates (each on a new batch from the input pipeline) in a single call
+            # (models that are part of an 'AdversarialModelSweep' are trained by the fused ops of the sweep)
+            if self.fused_steps > 1 and self.fused_train_ops:
+                self.train_classifier_standalone_fused = AdversarialModel.build_fused_train_op([self], "classifier_optimizer", "classification_loss", "classifier_vars", "classifier_step")
+                self.train_adversary_standalone_fused = AdversarialModel.build_fused_train_op([self], "adversary_optimizer", "adv_loss", "adversary_vars", "adversary_step")
+                self.train_classifier_adv_fused = AdversarialModel.build_fused_train_op([self], "classifier_adv_optimizer", "total_loss", "classifier_vars", "classifier_adv_step")
+            else:
+                self.train_classifier_standalone_fused = None
+                self.train_adversary_standalone_fused = None
+                self.train_classifier_adv_fused = None
+
+            saved_vars = self.classifier_vars + self.adversary_vars
+            if self.scope_prefix:
+                # store the variables under their usual names, such that the checkpoints can also be loaded by a standalone model
+                saved_vars = {self._checkpoint_name(var): var for var in saved_vars}
+            self.saver = tf.train.Saver(var_list = saved_vars)
+
+    def _checkpoint_name(self, var):
+        name = var.op.name
+        if name.startswith(self.scope_prefix):
+            return name[len(self.scope_prefix):]
+
+        # variables created outside of any scope (such as the one of the DisCoAdversary) only get a unique suffix in the shared graph
+        return re.sub("_[0-9]+$", "", name)
+
+    def _build_inputs(self, num_inputs, num_nuisances):
+        self.pre = PCAWhiteningPreprocessor(num_inputs)
+        self.pre_nuisance = PCAWhiteningPreprocessor(num_nuisances)
+
+        # prepare the inputs: if the input pipeline is used, they are taken from there whenever they are not fed explicitly
+        if self.use_input_pipeline:
+            self.pipeline_batch = self._build_input_pipeline(num_inputs, num_nuisances)
+            data_default, nuisances_default, labels_default, weights_default = self.pipeline_batch
+
+            self.labels_in = tf.placeholder_with_default(labels_default, [None, ], name = 'labels_in')
+            self.data_in = tf.placeholder_with_default(data_default, [None, num_inputs], name = 'data_in')
+            self.nuisances_in = tf.placeholder_with_default(nuisances_default, [None, num_nuisances], name = 'nuisances_in')
+            self.weights_in = tf.placeholder_with_default(weights_default, [None, ], name = 'weights_in')
+        else:
             self.labels_in = tf.placeholder(tf.int32, [None, ], name = 'labels_in')
             self.data_in = tf.placeholder(tf.float32, [None, num_inputs], name = 'data_in')
             self.nuisances_in = tf.placeholder(tf.float32, [None, num_nuisances], name = 'nuisances_in')
             self.weights_in = tf.placeholder(tf.float32, [None, ], name = 'weights_in')
-            self.is_training = tf.placeholder(tf.bool, name = 'is_training')
-            self.lambdaval = tf.placeholder(tf.float32, [1], name = 'lambdaval')
-            self.lambdaval_private_DisCo = tf.placeholder(tf.float32, [1], name = 'lambdaval_private_DisCo')
 
-            self.classifier_lr = tf.placeholder(tf.float32, [], name = "classifier_lr")
-            self.adversary_lr = tf.placeholder(tf.float32, [], name = "adversary_lr")
-                        
-            self.labels_one_hot = tf.one_hot(self.labels_in, depth = 2)
-            self.weights_bkg = tf.where(tf.math.equal(self.labels_in, 0), self.weights_in, tf.zeros_like(self.weights_in))
+        self.is_training = tf.placeholder(tf.bool, name = 'is_training')
+
+        if self.fused_steps > 1:
+            self.fused_nsteps = tf.placeholder_with_default(self.fused_steps, [], name = "fused_nsteps")
+
+        # the parameters of the preprocessors are not known yet when the graph is built, they are set from
+        # the (fitted or loaded) preprocessors later on and are not part of the checkpoints
+        if self.preprocess_in_graph:
+            self.data_pre_vars, self.data_pre_pars = self._build_preprocessing(num_inputs, name = "pre")
+            self.nuisances_pre_vars, self.nuisances_pre_pars = self._build_preprocessing(num_nuisances, name = "pre_nuis")
+
+    def _share_inputs(self, other):
+        self.pre = other.pre
+        self.pre_nuisance = other.pre_nuisance
+
+        shared_inputs = ["labels_in", "data_in", "nuisances_in", "weights_in", "is_training", "fused_nsteps", "data_pre_vars", "data_pre_pars", 
+                         "nuisances_pre_vars", "nuisances_pre_pars", "pipeline_batch", "pipeline_iterator", "sampling_tables_sig", "sampling_tables_bkg",
+                         "combined_pipeline_init", "background_pipeline_init"]
+        for shared_input in shared_inputs:
+            if hasattr(other, shared_input):
+                setattr(self, shared_input, getattr(other, shared_input))
+
+    def _build_inference(self, num_inputs):
+        # a separate path through the classifier (with the same variables) that is only used for predictions: it has its own input
+        # (and therefore never touches the input pipeline), and contains neither dropout nor the adversary
+        self.inference_data_in = tf.placeholder(tf.float32, [None, num_inputs], name = 'inference_data_in')
+        inference_data_pre = self._apply_preprocessing(self.inference_data_in, self.data_pre_vars) if self.preprocess_in_graph else self.inference_data_in
+
+        with tf.variable_scope(tf.get_variable_scope(), reuse = True):
+            self.inference_out, _ = self.classifier_graph_model.build_model(inference_data_pre, is_training = False)
+
+        # number of values per event that are kept around during inference: the inputs, and the outputs of all layers
+        values_per_event = num_inputs + sum(int(var.shape[-1]) for var in self.classifier_vars if len(var.shape) == 2)
+        self.inference_chunk_size = max(int(self.inference_memory / (4 * values_per_event)), 256)
+
+    def _build_lr_scheduler(self, optimizer_name, step):
+        # same schedule as in '_lr_scheduler'
+        lr_start = float(self.global_pars[optimizer_name + "_lr"])
+        lr_decay = float(self.global_pars[optimizer_name + "_lr_decay"])
+        return lr_start * tf.exp(-lr_decay * tf.cast(step, tf.float32))
+
+    def _build_input_pipeline(self, num_inputs, num_nuisances):
+
+        # the tables describing how to sample a set of training samples, as provided by 'VectorizedSampler.get_sampling_tables'
+        def sampling_tables_placeholders(name):
+            return (tf.placeholder(tf.float32, [None, num_inputs], name = name + "_data"),
+                    tf.placeholder(tf.float32, [None, num_nuisances], name = name + "_nuis"),
+                    tf.placeholder(tf.float32, [None, ], name = name + "_labels"),
+                    tf.placeholder(tf.float32, [None, ], name = name + "_weights"),
+                    tf.placeholder(tf.float32, [None, ], name = name + "_SOWs"),
+                    tf.placeholder(tf.float64, [None, ], name = name + "_row_nevents"),
+                    tf.placeholder(tf.int64, [None, ], name = name + "_row_offsets"),
+                    tf.placeholder(tf.int32, [None, ], name = name + "_row_component"),
+                    tf.placeholder(tf.float32, [], name = name + "_weight_scale"))
+
+        # draws one batch, in the same way as 'VectorizedSampler' does
+        def sample_batch(data, nuis, labels, weights, SOWs, row_nevents, row_offsets, row_component, weight_scale):
+            inds = tf.cast(tf.floor(tf.random_uniform(tf.shape(row_nevents), dtype = tf.float64) * row_nevents), tf.int64) + row_offsets
+
+            sampled_weights = tf.gather(weights, inds)
+            component_SOWs = tf.unsorted_segment_sum(sampled_weights, row_component, tf.size(SOWs))
+            scales = tf.where(component_SOWs > 0, SOWs / component_SOWs, tf.ones_like(SOWs))
+            sampled_weights = tf.abs(sampled_weights * tf.gather(scales, row_component) * weight_scale) # train on absolute weights
+
+            return tf.gather(data, inds), tf.gather(nuis, inds), tf.cast(tf.gather(labels, inds), tf.int32), sampled_weights
+
+        def sample_combined_batch(tables_sig, tables_bkg):
+            return tuple(tf.concat([cur_sig, cur_bkg], axis = 0) for cur_sig, cur_bkg in zip(sample_batch(*tables_sig), sample_batch(*tables_bkg)))
+
+        prefetch_depth = max(int(float(self.training_config.get("prefetch_queue_depth", 0))), 1)
+        num_parallel_calls = max(int(float(self.training_config.get("prefetch_producers", 1))), 1)
+
+        self.sampling_tables_sig = sampling_tables_placeholders("sampling_tables_sig")
+        self.sampling_tables_bkg = sampling_tables_placeholders("sampling_tables_bkg")
+
+        # batches made from signal and background, or from background alone
+        combined_dataset = tf.data.Dataset.from_tensors((self.sampling_tables_sig, self.sampling_tables_bkg)).repeat()
+        combined_dataset = combined_dataset.map(sample_combined_batch, num_parallel_calls = num_parallel_calls).prefetch(prefetch_depth)
+
+        background_dataset = tf.data.Dataset.from_tensors(self.sampling_tables_bkg).repeat()
+        background_dataset = background_dataset.map(sample_batch, num_parallel_calls = num_parallel_calls).prefetch(prefetch_depth)
+
+        self.pipeline_iterator = tf.data.Iterator.from_structure(combined_dataset.output_types, combined_dataset.output_shapes)
+        self.combined_pipeline_init = self.pipeline_iterator.make_initializer(combined_dataset)
+        self.background_pipeline_init = self.pipeline_iterator.make_initializer(background_dataset)
+
+        return self.pipeline_iterator.get_next()
+
+    def _build_losses(self, data_in, nuisances_in, labels_in, weights_in):
+        if self.preprocess_in_graph:
+            data_pre = self._apply_preprocessing(data_in, self.data_pre_vars)
+            nuisances_pre = self._apply_preprocessing(nuisances_in, self.nuisances_pre_vars)
+        else:
+            data_pre = data_in
+            nuisances_pre = nuisances_in
 
-            # set up the classifier
-            self.classifier_out, self.classifier_vars = self.classifier_model.build_model(self.data_in, is_training = self.is_training)
-            self.classification_loss = self.classifier_model.build_loss(self.classifier_out, self.labels_one_hot, weights = self.weights_in)
+        labels_one_hot = tf.one_hot(labels_in, depth = 2)
+        weights_bkg = tf.where(tf.math.equal(labels_in, 0), weights_in, tf.zeros_like(weights_in))
 
-            self.classifier_out_single = tf.expand_dims(self.classifier_out[:,0], axis = 1)
+        # set up the classifier
+        classifier_out, classifier_vars = self.classifier_graph_model.build_model(data_pre, is_training = self.is_training)
+        classification_loss = self.classifier_graph_model.build_loss(classifier_out, labels_one_hot, weights = weights_in)
 
-            # set up the adversary
-            self.adv_loss, self.adversary_vars = self.adversary_model.build_loss(self.classifier_out_single, self.nuisances_in, weights = self.weights_bkg, is_training = self.is_training)
+        classifier_out_single = tf.expand_dims(classifier_out[:,0], axis = 1)
 
-            self.private_DisCo_adv_loss, _ = self.private_DisCo_adversary.build_loss(self.classifier_out_single, self.nuisances_in, weights = self.weights_bkg, is_training = self.is_training)
+        # set up the adversary
+        adv_loss, adversary_vars = self.adversary_graph_model.build_loss(classifier_out_single, nuisances_pre, weights = weights_bkg, is_training = self.is_training)
 
-            # total loss
-            self.total_loss = self.classification_loss + self.lambdaval * (-self.adv_loss)
+        # total loss
+        total_loss = classification_loss + self.lambdaval * (-adv_loss)
 
-            self.private_DisCo_total_loss = self.classification_loss + self.lambdaval_private_DisCo * (-self.private_DisCo_adv_loss)
+        return {"data_pre": data_pre, "nuisances_pre": nuisances_pre, "weights_bkg": weights_bkg,
+                "classifier_out": classifier_out, "classifier_vars": classifier_vars, "classifier_out_single": classifier_out_single,
+                "classification_loss": classification_loss, "adv_loss": adv_loss, "adversary_vars": adversary_vars, "total_loss": total_loss}
 
-            # set up the optimisers
-            self.train_classifier_standalone = tf.train.AdamOptimizer(learning_rate = self.classifier_lr, 
-                                                                      beta1 = float(self.global_pars["adam_clf_beta1"]), 
-                                                                      beta2 = float(self.global_pars["adam_clf_beta2"]), 
-                                                                      epsilon = float(self.global_pars["adam_clf_eps"])).minimize(self.classification_loss, var_list = self.classifier_vars)
+    @staticmethod
+    def build_fused_train_op(models, optimizer_name, loss_name, var_list_name, step_name):
+        """ Build a training op that performs several updates of all 'models' (which share their inputs), each one on a new batch 
+        from the input pipeline. The optimizer, loss, variables and step counter are looked up by their attribute names in each model. """
+        pipeline_iterator = models[0].pipeline_iterator
+        fused_nsteps = models[0].fused_nsteps
+
+        def body(cur_step):
+            # rebuild the losses on the next batch from the pipeline, with the variables that are already there
+            data_batch, nuisances_batch, labels_batch, weights_batch = pipeline_iterator.get_next()
+
+            train_ops = []
+            for model in models:
+                with tf.variable_scope(tf.get_variable_scope(), reuse = True):
+                    losses = model._build_losses(data_batch, nuisances_batch, labels_batch, weights_batch)
+
+                # Note: the optimizer (and its slot variables) is shared with the corresponding single-step training op
+                train_ops.append(getattr(model, optimizer_name).minimize(losses[loss_name], var_list = getattr(model, var_list_name), global_step = getattr(model, step_name)))
+
+            with tf.control_dependencies(train_ops):
+                return cur_step + 1
+
+        return tf.while_loop(lambda cur_step: cur_step < fused_nsteps, body, [tf.constant(0)], parallel_iterations = 1)
+
+    def start_input_pipeline(self, sampling_tables_sig, sampling_tables_bkg):
+        """ (Re)start the input pipeline to produce batches from the given sampling tables: combined signal and background
+        batches, or background-only batches if 'sampling_tables_sig' is 'None'. """
+        table_keys = ["data", "nuis", "labels", "weights", "SOWs", "row_nevents", "row_offsets", "row_component", "weight_scale"]
+
+        feed_dict = {placeholder: sampling_tables_bkg[key] for placeholder, key in zip(self.sampling_tables_bkg, table_keys)}
+        if sampling_tables_sig is not None:
+            feed_dict.update({placeholder: sampling_tables_sig[key] for placeholder, key in zip(self.sampling_tables_sig, table_keys)})
+            pipeline_init = self.combined_pipeline_init
+        else:
+            pipeline_init = self.background_pipeline_init
+
+        with self.graph.as_default():
+            self.sess.run(pipeline_init, feed_dict = feed_dict)
+
+    def get_pipeline_batch(self):
+        """ fetch the next batch from the input pipeline, e.g. to evaluate the losses on it """
+        with self.graph.as_default():
+            return self.sess.run(self.pipeline_batch)
+
+    def _train_from_pipeline(self, train_op, fused_train_op, nsteps):
+        with self.graph.as_default():
+            if fused_train_op is None:
+                for step in range(nsteps):
+                    self.sess.run(train_op, feed_dict = {self.is_training: True})
+            else:
+                self.sess.run(fused_train_op, feed_dict = {self.is_training: True, self.fused_nsteps: nsteps})
+
+    def train_step_from_pipeline(self, nsteps = 1):
+        self._train_from_pipeline(self.train_classifier_adv, self.train_classifier_adv_fused, nsteps)
+
+    def train_classifier_from_pipeline(self, nsteps = 1):
+        self._train_from_pipeline(self.train_classifier_standalone, self.train_classifier_standalone_fused, nsteps)
 
-            self.train_adversary_standalone = tf.train.AdamOptimizer(learning_rate = self.adversary_lr,
-                                                                     beta1 = float(self.global_pars["adam_adv_beta1"]), 
-                                                                     beta2 = float(self.global_pars["adam_adv_beta2"]), 
-                                                                     epsilon = float(self.global_pars["adam_adv_eps"])).minimize(self.adv_loss, var_list = self.adversary_vars)
+    def train_adversary_from_pipeline(self, nsteps = 1):
+        self._train_from_pipeline(self.train_adversary_standalone, self.train_adversary_standalone_fused, nsteps)
 
-            self.train_classifier_adv = tf.train.AdamOptimizer(learning_rate = self.classifier_lr, 
-                                                               beta1 = float(self.global_pars["adam_clf_adv_beta1"]), 
-                                                               beta2 = float(self.global_pars["adam_clf_adv_beta2"]), 
-                                                               epsilon = float(self.global_pars["adam_clf_adv_eps"])).minimize(self.total_loss, var_list = self.classifier_vars)
+    def _build_preprocessing(self, num_inputs, name):
+        offset = tf.Variable(np.zeros(num_inputs), dtype = tf.float32, trainable = False, name = name + "_offset")
+        matrix = tf.Variable(np.identity(num_inputs), dtype = tf.float32, trainable = False, name = name + "_matrix")
 
-            self.saver = tf.train.Saver(var_list = self.classifier_vars + self.adversary_vars)
+        offset_in = tf.placeholder(tf.float32, [num_inputs], name = name + "_offset_in")
+        matrix_in = tf.placeholder(tf.float32, [num_inputs, num_inputs], name = name + "_matrix_in")
+        assign_op = tf.group(tf.assign(offset, offset_in), tf.assign(matrix, matrix_in))
+
+        return (offset, matrix), (offset_in, matrix_in, assign_op)
+
+    def _apply_preprocessing(self, inputs, pre_vars):
+        offset, matrix = pre_vars
+        return tf.matmul(inputs - offset, matrix)
+
+    def _set_preprocessing_pars(self):
+        # copy the parameters of the preprocessors into the graph
+        if self.preprocess_in_graph:
+            for pre, (offset_in, matrix_in, assign_op) in [(self.pre, self.data_pre_pars), (self.pre_nuisance, self.nuisances_pre_pars)]:
+                offset, matrix = pre.get_affine_transform()
+                with self.graph.as_default():
+                    self.sess.run(assign_op, feed_dict = {offset_in: offset, matrix_in: matrix})
+
+    def _preprocess_data(self, data):
+        return data if self.preprocess_in_graph else self.pre.process(data)
+
+    def _preprocess_nuisances(self, nuisances):
+        return nuisances if self.preprocess_in_graph else self.pre_nuisance.process(nuisances)
 
     def init(self, data_train, data_nuisance):
+        self.model_fingerprint = None # the model is about to be trained
         self.pre.setup(data_train)
         self.pre_nuisance.setup(data_nuisance)
 
         with self.graph.as_default():
             self.sess.run(tf.global_variables_initializer())
 
+        self._set_preprocessing_pars()
+
     def _lr_scheduler(self, lr_start, lr_decay, batchnum):
         return lr_start * np.exp(-lr_decay * batchnum)
 
     def train_step(self, data_step, nuisances_step, labels_step, weights_step, batchnum):
-        data_pre = self.pre.process(data_step)
-        nuisances_pre = self.pre_nuisance.process(nuisances_step)
+        data_pre = self._preprocess_data(data_step)
+        nuisances_pre = self._preprocess_nuisances(nuisances_step)
         weights_step = weights_step.flatten()
 
         classifier_lr = self._lr_scheduler(lr_start = float(self.global_pars["adam_clf_adv_lr"]),
@@ -169,12 +463,12 @@ class AdversarialModel:
 
         try:
             with self.graph.as_default():
-                self.sess.run(self.train_classifier_adv, feed_dict = {self.data_in: data_pre, self.nuisances_in: nuisances_pre, self.labels_in: labels_step, self.weights_in: weights_step, self.lambdaval: [self.lambda_final], self.is_training: True, self.classifier_lr: classifier_lr})
+                self.sess.run(self.train_classifier_adv, feed_dict = {self.data_in: data_pre, self.nuisances_in: nuisances_pre, self.labels_in: labels_step, self.weights_in: weights_step, self.lambdaval: [self.lambda_final], self.is_training: True, self.classifier_adv_lr: classifier_lr})
         except:
             print("problem when executing train_step, skipping")
 
     def train_classifier(self, data_step, labels_step, weights_step, batchnum):
-        data_pre = self.pre.process(data_step)
+        data_pre = self._preprocess_data(data_step)
         weights_step = weights_step.flatten()
 
         # determine the current learning rate as per the scheduling
@@ -186,8 +480,8 @@ class AdversarialModel:
             self.sess.run(self.train_classifier_standalone, feed_dict = {self.data_in: data_pre, self.labels_in: labels_step, self.weights_in: weights_step, self.is_training: True, self.classifier_lr: classifier_lr})
 
     def train_adversary(self, data_step, nuisances_step, labels_step, weights_step, batchnum):
-        data_pre = self.pre.process(data_step)
-        nuisances_pre = self.pre_nuisance.process(nuisances_step)
+        data_pre = self._preprocess_data(data_step)
+        nuisances_pre = self._preprocess_nuisances(nuisances_step)
         weights_step = weights_step.flatten()
 
         # determine the current learning rate as per the scheduling
@@ -199,7 +493,7 @@ class AdversarialModel:
             self.sess.run(self.train_adversary_standalone, feed_dict = {self.data_in: data_pre, self.nuisances_in: nuisances_pre, self.labels_in: labels_step, self.weights_in: weights_step, self.is_training: True, self.adversary_lr: adversary_lr})
 
     def evaluate_classifier_loss(self, data, labels, weights_step):
-        data_pre = self.pre.process(data)
+        data_pre = self._preprocess_data(data)
         weights_step = weights_step.flatten()
 
         with self.graph.as_default():
@@ -208,8 +502,8 @@ class AdversarialModel:
         return classifier_lossval
 
     def evaluate_adversary_loss(self, data, nuisances, labels, weights_step):
-        data_pre = self.pre.process(data)
-        nuisances_pre = self.pre_nuisance.process(nuisances)
+        data_pre = self._preprocess_data(data)
+        nuisances_pre = self._preprocess_nuisances(nuisances)
         weights_step = weights_step.flatten()
 
         with self.graph.as_default():
@@ -218,8 +512,8 @@ class AdversarialModel:
         return adv_loss
 
     def evaluate_private_DisCo_adversary_loss(self, data, nuisances, labels, weights_step):
-        data_pre = self.pre.process(data)
-        nuisances_pre = self.pre_nuisance.process(nuisances)
+        data_pre = self._preprocess_data(data)
+        nuisances_pre = self._preprocess_nuisances(nuisances)
         weights_step = weights_step.flatten()
 
         with self.graph.as_default():
@@ -228,8 +522,8 @@ class AdversarialModel:
         return adv_loss
 
     def evaluate_loss(self, data, nuisances, labels, weights_step):
-        data_pre = self.pre.process(data)
-        nuisances_pre = self.pre_nuisance.process(nuisances)
+        data_pre = self._preprocess_data(data)
+        nuisances_pre = self._preprocess_nuisances(nuisances)
         weights_step = weights_step.flatten()
 
         with self.graph.as_default():
@@ -238,8 +532,8 @@ class AdversarialModel:
         return total_loss
 
     def evaluate_all_losses_private_DisCo(self, data, nuisances, labels, weights_step, DisCo_lambda):
-        data_pre = self.pre.process(data)
-        nuisances_pre = self.pre_nuisance.process(nuisances)
+        data_pre = self._preprocess_data(data)
+        nuisances_pre = self._preprocess_nuisances(nuisances)
         weights_step = weights_step.flatten()
 
         with self.graph.as_default():
@@ -249,8 +543,8 @@ class AdversarialModel:
         return clf_loss, adv_loss, total_loss, private_DisCo_adv_loss, private_DisCo_total_loss
 
     def evaluate_all_losses(self, data, nuisances, labels, weights_step):
-        data_pre = self.pre.process(data)
-        nuisances_pre = self.pre_nuisance.process(nuisances)
+        data_pre = self._preprocess_data(data)
+        nuisances_pre = self._preprocess_nuisances(nuisances)
         weights_step = weights_step.flatten()
 
         try:
@@ -267,8 +561,8 @@ class AdversarialModel:
         return clf_loss, adv_loss, total_loss
 
     def evaluate_private_DisCo_total_loss(self, data, nuisances, labels, weights_step, DisCo_lambda):
-        data_pre = self.pre.process(data)
-        nuisances_pre = self.pre_nuisance.process(nuisances)
+        data_pre = self._preprocess_data(data)
+        nuisances_pre = self._preprocess_nuisances(nuisances)
         weights_step = weights_step.flatten()
 
         with self.graph.as_default():
@@ -276,21 +570,41 @@ class AdversarialModel:
 
         return total_loss
 
-    def predict(self, data, pred_size = 256):
-        data_pre = self.pre.process(data)
-        datlen = len(data_pre)
+    def predict(self, data, pred_size = None, out = None):
+        # evaluate the classifier in chunks of 'pred_size' events, writing into 'out' if given
+        # for a model loaded from disk, the returned predictions are cached and must not be modified
+        datlen = len(data)
+        pred_size = self.inference_chunk_size if pred_size is None else pred_size
 
-        print("datlen = {}".format(datlen))
+        cache_key = None
+        if self.model_fingerprint is not None:
+            cache_key = self.prediction_cache.key(self.model_fingerprint, data)
+            cached = self.prediction_cache.get(cache_key)
+            if cached is not None:
+                if out is None:
+                    return cached
 
-        chunks = np.array_split(data_pre, max(datlen / pred_size, 1), axis = 0)
-        retvals = []
-        for chunk in chunks:
-            retval_cur = self.sess.run(self.classifier_out, feed_dict = {self.data_in: chunk, self.is_training: False})
-            retvals.append(retval_cur)
+                out[:] = cached
+                return out
 
-        return np.concatenate(retvals, axis = 0)
+        owns_out = out is None
+        if owns_out:
+            out = np.empty((datlen, 2), dtype = np.float32)
+
+        with self.graph.as_default():
+            for start in range(0, datlen, pred_size):
+                stop = min(start + pred_size, datlen)
+                out[start:stop] = self.sess.run(self.inference_out, feed_dict = {self.inference_data_in: self._preprocess_data(data[start:stop])})
+
+        if cache_key is not None:
+            # the cache must not keep a reference to an array that belongs to the caller
+            self.prediction_cache.put(cache_key, out if owns_out else np.copy(out))
+
+        return out
 
     def load(self, indir):
+        self.model_fingerprint = None
+        weights_path = None
         
         # load the weights
         with self.graph.as_default():
@@ -301,6 +615,7 @@ class AdversarialModel:
                 print("trying to load weights from {}".format(checkpoint_dir))
                 self.saver.restore(self.sess, os.path.join(checkpoint_dir, "model.dat"))
                 print("weights successfully loaded from " + checkpoint_dir)
+                weights_path = os.path.join(checkpoint_dir, "model.dat.index")
             except:
                 print("no weights found, continuing with uninitialized graph!")
 
@@ -309,8 +624,14 @@ class AdversarialModel:
             self.pre = PCAWhiteningPreprocessor.from_file(os.path.join(indir, "pre.pkl"))
             self.pre_nuisance = PCAWhiteningPreprocessor.from_file(os.path.join(indir, "pre_nuis.pkl"))
             print("preprocessors successfully loaded from " + indir)
+            self._set_preprocessing_pars()
         except FileNotFoundError:
             print("no preprocessors found")
+            return
+
+        # the index of the checkpoint holds the checksums of all weights, together with the preprocessor it determines the predictions
+        if weights_path is not None and os.path.exists(weights_path):
+            self.model_fingerprint = PredictionCache.fingerprint_files([weights_path, os.path.join(indir, "pre.pkl")])
 
     def save(self, outdir):
         
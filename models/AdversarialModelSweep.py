@@ -0,0 +1,117 @@
+import tensorflow as tf
+from models.AdversarialModel import AdversarialModel
+
+class AdversarialModelSweep:
+    # several AdversarialModels (e.g. for different lambda) that share graph, session and inputs, and are trained in lock-step
+
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.leader = self.replicas[0] # provides the inputs for all others
+
+        # only models that see the same data and use the same training schedule can be trained together
+        for replica in self.replicas[1:]:
+            for par in ["data_formatter", "num_inputs", "num_nuisances", "preprocess_in_graph"]:
+                if replica.global_pars.get(par, None) != self.leader.global_pars.get(par, None):
+                    raise Exception("Error: models '{}' and '{}' differ in '{}' and cannot be trained together!".format(self.leader.path, replica.path, par))
+
+            if dict(replica.training_config.items()) != dict(self.leader.training_config.items()):
+                raise Exception("Error: models '{}' and '{}' use different training configurations and cannot be trained together!".format(self.leader.path, replica.path))
+
+        self.graph = self.leader.graph
+        self.sess = self.leader.sess
+        self.path = self.leader.path
+        self.data_formatter = self.leader.data_formatter
+        self.training_config = self.leader.training_config
+        self.use_input_pipeline = self.leader.use_input_pipeline
+        self.fused_steps = self.leader.fused_steps
+
+        with self.graph.as_default():
+            if self.fused_steps > 1:
+                # each step takes one batch from the pipeline and applies it to all replicas
+                self.train_classifier_standalone_fused = AdversarialModel.build_fused_train_op(self.replicas, "classifier_optimizer", "classification_loss", "classifier_vars", "classifier_step")
+                self.train_adversary_standalone_fused = AdversarialModel.build_fused_train_op(self.replicas, "adversary_optimizer", "adv_loss", "adversary_vars", "adversary_step")
+                self.train_classifier_adv_fused = AdversarialModel.build_fused_train_op(self.replicas, "classifier_adv_optimizer", "total_loss", "classifier_vars", "classifier_adv_step")
+            else:
+                self.train_classifier_standalone_fused = None
+                self.train_adversary_standalone_fused = None
+                self.train_classifier_adv_fused = None
+
+    @classmethod
+    def from_config(cls, config_dirs):
+        # the first model sets up the graph and its inputs, all others are added to it; none of them builds fused ops of its own
+        replicas = []
+        for ind, config_dir in enumerate(config_dirs):
+            replica = AdversarialModel.from_config(config_dir, shared_with = replicas[0] if len(replicas) > 0 else None, scope_prefix = "replica{}_".format(ind),
+                                                   fused_train_ops = False)
+            replicas.append(replica)
+
+        print("training {} models in the same session".format(len(replicas)))
+        return cls(replicas)
+
+    def init(self, data_train, data_nuisance):
+        # this initializes the variables of all replicas
+        self.leader.init(data_train, data_nuisance)
+
+        for replica in self.replicas:
+            replica.pre = self.leader.pre
+            replica.pre_nuisance = self.leader.pre_nuisance
+            replica.model_fingerprint = None
+
+    def _run_all(self, train_ops, feed_dict):
+        with self.graph.as_default():
+            self.sess.run(train_ops, feed_dict = feed_dict)
+
+    def train_step(self, data_step, nuisances_step, labels_step, weights_step, batchnum):
+        # Note: the learning rates follow the schedules in the graph, which agree with those of the individual models
+        feed_dict = {self.leader.data_in: self.leader._preprocess_data(data_step), self.leader.nuisances_in: self.leader._preprocess_nuisances(nuisances_step),
+                     self.leader.labels_in: labels_step, self.leader.weights_in: weights_step.flatten(), self.leader.is_training: True}
+
+        # the replicas are updated one after the other, such that a failing one (e.g. a diverging run) only skips its own step
+        for replica in self.replicas:
+            try:
+                self._run_all(replica.train_classifier_adv, feed_dict)
+            except tf.errors.OpError as e:
+                print("problem when executing train_step for model in {}, skipping: {}".format(replica.path, e.message))
+
+    def train_classifier(self, data_step, labels_step, weights_step, batchnum):
+        feed_dict = {self.leader.data_in: self.leader._preprocess_data(data_step), self.leader.labels_in: labels_step,
+                     self.leader.weights_in: weights_step.flatten(), self.leader.is_training: True}
+        self._run_all([replica.train_classifier_standalone for replica in self.replicas], feed_dict)
+
+    def train_adversary(self, data_step, nuisances_step, labels_step, weights_step, batchnum):
+        feed_dict = {self.leader.data_in: self.leader._preprocess_data(data_step), self.leader.nuisances_in: self.leader._preprocess_nuisances(nuisances_step),
+                     self.leader.labels_in: labels_step, self.leader.weights_in: weights_step.flatten(), self.leader.is_training: True}
+        self._run_all([replica.train_adversary_standalone for replica in self.replicas], feed_dict)
+
+    def start_input_pipeline(self, sampling_tables_sig, sampling_tables_bkg):
+        self.leader.start_input_pipeline(sampling_tables_sig, sampling_tables_bkg)
+
+    def get_pipeline_batch(self):
+        return self.leader.get_pipeline_batch()
+
+    def _train_from_pipeline(self, train_op_name, fused_train_op, nsteps):
+        # all replicas are updated on the same batch, which is drawn from the pipeline only once per step
+        with self.graph.as_default():
+            if fused_train_op is None:
+                for step in range(nsteps):
+                    self.sess.run([getattr(replica, train_op_name) for replica in self.replicas], feed_dict = {self.leader.is_training: True})
+            else:
+                self.sess.run(fused_train_op, feed_dict = {self.leader.is_training: True, self.leader.fused_nsteps: nsteps})
+
+    def train_step_from_pipeline(self, nsteps = 1):
+        self._train_from_pipeline("train_classifier_adv", self.train_classifier_adv_fused, nsteps)
+
+    def train_classifier_from_pipeline(self, nsteps = 1):
+        self._train_from_pipeline("train_classifier_standalone", self.train_classifier_standalone_fused, nsteps)
+
+    def train_adversary_from_pipeline(self, nsteps = 1):
+        self._train_from_pipeline("train_adversary_standalone", self.train_adversary_standalone_fused, nsteps)
+
+    def evaluate_adversary_loss(self, data, nuisances, labels, weights_step):
+        feed_dict = {self.leader.data_in: self.leader._preprocess_data(data), self.leader.nuisances_in: self.leader._preprocess_nuisances(nuisances),
+                     self.leader.labels_in: labels, self.leader.weights_in: weights_step.flatten(), self.leader.is_training: True}
+
+        with self.graph.as_default():
+            adv_losses = self.sess.run([replica.adv_loss for replica in self.replicas], feed_dict = feed_dict)
+
+        return adv_losses
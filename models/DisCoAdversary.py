@@ -7,12 +7,19 @@ class DisCoAdversary(AdversaryModel):
     def __init__(self, name, hyperpars):
         # don't need to do anything for this simple adversary
         self.name = name
-        self.hyperpars = hyperpars # are ignored for now anyways
+        self.hyperpars = hyperpars
+
+        # the algorithm used to compute the distance correlation: "dense" or "broadcast" (O(N^2) memory and time) or "sorted" (O(N) memory)
+        self.disco_kernel = self.hyperpars.get("disco_kernel", "dense")
+        if self.disco_kernel not in self.distance_corr_kernels:
+            raise Exception("Error: unknown DisCo kernel '{}', available: {}".format(self.disco_kernel, list(self.distance_corr_kernels.keys())))
 
     def build_loss(self, pred, nuisance, is_training, weights = 1.0, eps = 1e-6, batchnum = 0):
         self.weights_scaled = weights / tf.reduce_sum(weights, axis = 0) * tf.cast(tf.shape(nuisance)[0], tf.float32)
-        self.disco = self._distance_corr(pred, nuisance, self.weights_scaled)
-        self.dummy = tf.Variable(1.0)
+        self.disco = self.distance_corr_kernels[self.disco_kernel](self, pred, nuisance, self.weights_scaled)
+        if not hasattr(self, "dummy"):
+            # the loss can be built several times (e.g. for the fused training ops), but always shares the same variable
+            self.dummy = tf.Variable(1.0)
         
         self.disco_loss = self.disco + 0.0 * self.dummy
         self.these_vars = [self.dummy]
@@ -69,3 +76,135 @@ class DisCoAdversary(AdversaryModel):
             dCorr = (tf.reduce_mean(ABavg*normedweight)/tf.math.sqrt(tf.reduce_mean(AAavg*normedweight)*tf.reduce_mean(BBavg*normedweight)))**power
   
         return dCorr
+
+    def _distance_corr_broadcast(self, var_1, var_2, normedweight, power=1):
+        """Same as '_distance_corr', but the double-centered distance matrices are computed by broadcasting the row and column
+        means, and the weighted averages are evaluated as matrix-vector products. This avoids the tiled and transposed
+        NxN copies of the dense version: only the distance matrices themselves and their products are materialized.
+        """
+
+        ww = tf.reshape(normedweight, [-1, 1])
+        nevents = tf.cast(tf.size(var_1), tf.float32)
+
+        # the same steps are used for both variables
+        def double_centered_distances(vals):
+            vals = tf.reshape(vals, [-1, 1])
+            dists = tf.math.abs(vals - tf.transpose(vals))
+            row_means = tf.matmul(dists, ww) / nevents # amatavg in '_distance_corr'
+            return dists - row_means - tf.transpose(row_means) + tf.reduce_mean(row_means * ww)
+
+        # equivalent to tf.reduce_mean(tf.reduce_mean(mat * normedweight, axis = 1) * normedweight)
+        def weighted_mean(mat):
+            return tf.reduce_sum(tf.matmul(mat, ww) * ww) / tf.square(nevents)
+
+        Amat = double_centered_distances(var_1)
+        Bmat = double_centered_distances(var_2)
+
+        ABavg = weighted_mean(Amat * Bmat)
+        AAavg = weighted_mean(tf.square(Amat))
+        BBavg = weighted_mean(tf.square(Bmat))
+
+        if power==1:
+            dCorr = ABavg/tf.math.sqrt(AAavg*BBavg)
+        elif power==2:
+            dCorr = ABavg**2/(AAavg*BBavg)
+        else:
+            dCorr = (ABavg/tf.math.sqrt(AAavg*BBavg))**power
+
+        return dCorr
+
+    def _distance_corr_sorted(self, var_1, var_2, normedweight, power=1):
+        """Same as '_distance_corr', but for 1D variables only and without building any NxN matrices: all the
+        required sums over pairs of events are evaluated in O(N log^2 N) time and O(N) memory, based on sorting.
+        The computation is carried out in double precision, since it relies on cancellations between large sums.
+        """
+
+        xx = tf.cast(tf.reshape(var_1, [-1]), tf.float64)
+        yy = tf.cast(tf.reshape(var_2, [-1]), tf.float64)
+        ww = tf.cast(tf.reshape(normedweight, [-1]), tf.float64)
+        nevents = tf.cast(tf.size(xx), tf.float64)
+
+        def argsort(vals):
+            return tf.nn.top_k(-vals, k = tf.size(vals)).indices
+
+        def exclusive_cumsum(vals):
+            return tf.cumsum(vals, axis = 0, exclusive = True)
+
+        # weighted row means of the distance matrices, i.e. amatavg and bmatavg in '_distance_corr'
+        def distance_row_means(vals):
+            order = argsort(vals)
+            vals_sorted = tf.gather(vals, order)
+            weights_sorted = tf.gather(ww, order)
+
+            weights_below = exclusive_cumsum(weights_sorted)
+            weighted_vals_below = exclusive_cumsum(weights_sorted * vals_sorted)
+            weights_above = tf.reduce_sum(weights_sorted) - weights_below - weights_sorted
+            weighted_vals_above = tf.reduce_sum(weights_sorted * vals_sorted) - weighted_vals_below - weights_sorted * vals_sorted
+
+            row_means_sorted = (vals_sorted * (weights_below - weights_above) - (weighted_vals_below - weighted_vals_above)) / nevents
+            return tf.gather(row_means_sorted, tf.invert_permutation(order))
+
+        # sum over all pairs of w_i * w_j * |x_i - x_j| * |y_i - y_j|
+        def cross_distance_sum():
+            order = argsort(xx)
+            xx_sorted = tf.gather(xx, order)
+            yy_sorted = tf.gather(yy, order)
+            ww_sorted = tf.gather(ww, order)
+            yy_rank = tf.invert_permutation(argsort(yy_sorted))
+
+            moments = tf.stack([ww_sorted, ww_sorted * xx_sorted, ww_sorted * yy_sorted, ww_sorted * xx_sorted * yy_sorted], axis = 1)
+
+            # sums over all events j that come before i in x ...
+            below = exclusive_cumsum(moments)
+
+            # ... and over those that also come before i in y: split the events (ordered in x) into blocks of increasing size, and for each
+            # pair of neighbouring blocks add the contributions of the left block to the events in the right block (ordered in y)
+            positions = tf.range(tf.size(xx))
+            def add_block_level(block_size, below_dominated):
+                pair_index = positions // (2 * block_size)
+                is_left = tf.equal((positions // block_size) % 2, 0)
+
+                block_order = argsort(tf.cast(pair_index, tf.float64) * 2 * nevents + tf.cast(yy_rank, tf.float64))
+                left_moments = tf.gather(moments * tf.expand_dims(tf.cast(is_left, tf.float64), 1), block_order)
+                left_below = exclusive_cumsum(left_moments)
+                left_below -= tf.gather(left_below, tf.gather(pair_index, block_order) * 2 * block_size)
+
+                contributions = tf.where(tf.gather(is_left, block_order), tf.zeros_like(left_below), left_below)
+                return block_size * 2, below_dominated + tf.gather(contributions, tf.invert_permutation(block_order))
+
+            _, below_dominated = tf.while_loop(lambda block_size, below_dominated: block_size < tf.size(xx), add_block_level,
+                                               [tf.constant(1), tf.zeros_like(moments)])
+
+            xy_sorted = xx_sorted * yy_sorted
+            all_below = ww_sorted * (xx_sorted * below[:,2] - xy_sorted * below[:,0] - below[:,3] + yy_sorted * below[:,1])
+            dominated_below = ww_sorted * (xy_sorted * below_dominated[:,0] - xx_sorted * below_dominated[:,2] - yy_sorted * below_dominated[:,1] + below_dominated[:,3])
+
+            return 2 * (tf.reduce_sum(all_below) + 2 * tf.reduce_sum(dominated_below))
+
+        # sum over all pairs of w_i * w_j * |x_i - x_j|^2
+        def squared_distance_sum(vals):
+            return 2 * (tf.reduce_sum(ww) * tf.reduce_sum(ww * vals * vals) - tf.square(tf.reduce_sum(ww * vals)))
+
+        amatavg = distance_row_means(xx)
+        bmatavg = distance_row_means(yy)
+        amatavgavg = tf.reduce_mean(amatavg * ww)
+        bmatavgavg = tf.reduce_mean(bmatavg * ww)
+
+        # weighted mean of the products of the doubly-centered distance matrices, i.e. tf.reduce_mean(ABavg * normedweight) in '_distance_corr'
+        def centered_product_mean(distance_sum, row_means_1, row_means_2, avg_1, avg_2):
+            return (distance_sum - 2 * nevents * tf.reduce_sum(ww * row_means_1 * row_means_2)) / tf.square(nevents) + avg_1 * avg_2
+
+        ABavg = centered_product_mean(cross_distance_sum(), amatavg, bmatavg, amatavgavg, bmatavgavg)
+        AAavg = centered_product_mean(squared_distance_sum(xx), amatavg, amatavg, amatavgavg, amatavgavg)
+        BBavg = centered_product_mean(squared_distance_sum(yy), bmatavg, bmatavg, bmatavgavg, bmatavgavg)
+
+        if power==1:
+            dCorr = ABavg/tf.math.sqrt(AAavg*BBavg)
+        elif power==2:
+            dCorr = ABavg**2/(AAavg*BBavg)
+        else:
+            dCorr = (ABavg/tf.math.sqrt(AAavg*BBavg))**power
+
+        return tf.cast(dCorr, tf.float32)
+
+    distance_corr_kernels = {"dense": _distance_corr, "broadcast": _distance_corr_broadcast, "sorted": _distance_corr_sorted}
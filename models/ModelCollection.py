@@ -11,8 +11,9 @@ class ModelCollection:
         self.models = models
         self.default_value = [[-99, -99]]
 
-    @classmethod
-    def from_config(cls, config_dir):
+    @staticmethod
+    def prepare_model_dirs(config_dir):
+        """ return the directories of the models that comprise the ModelCollection in 'config_dir', creating them if necessary """
         gconfig = ConfigParser()
         gconfig.read(os.path.join(config_dir, "meta.conf"))
 
@@ -23,7 +24,7 @@ class ModelCollection:
         print("found the following contained models:")
         print('\n'.join(contained_models))
 
-        models = []
+        model_dirs = []
 
         for model_name in contained_models:
             
@@ -38,8 +39,13 @@ class ModelCollection:
                 with open(model_config_path, 'w') as model_config_file:
                     model_config.write(model_config_file)
                 
-            model = AdversarialModel.from_config(model_dir)
-            models.append(model)
+            model_dirs.append(model_dir)
+
+        return model_dirs
+
+    @classmethod
+    def from_config(cls, config_dir):
+        models = [AdversarialModel.from_config(model_dir) for model_dir in ModelCollection.prepare_model_dirs(config_dir)]
 
         # create the ModelCollection
         return cls(models)
@@ -47,33 +53,29 @@ class ModelCollection:
     def predict(self, data):
         assert isinstance(data, pd.DataFrame)
 
-        preds = []
+        # the predictions of all models are written directly into their rows of the output
+        retval = np.empty((len(data), len(self.default_value[0])), dtype = np.float64)
+        covered = np.zeros(len(data), dtype = bool)
+
         for model in self.models:
-            
-            # get the chunk of data that this model requires
-            model_data = model.data_formatter.format_as_TrainingSample(data).data
 
-            # and also get the location of this chunk in the complete dataset
-            model_indices = model.data_formatter.get_formatted_indices(data)
-            
+            # get the location of the chunk of data that this model requires in the complete dataset
+            model_mask = model.data_formatter.get_formatted_mask(data)
+
             # perform the prediction
-            if len(model_data) > 0:
-                model_pred = pd.DataFrame(model.predict(model_data), index = model_indices)
-                preds.append(model_pred)
+            if np.any(model_mask):
+                model_data = model.data_formatter.format_as_TrainingSample(data).data
+                retval[model_mask] = model.predict(model_data)
+                covered |= model_mask
 
         # _something_ will have happened
-        assert len(preds) > 0
-        retval = pd.concat(preds).sort_index()
+        assert np.any(covered)
         
         # check if some data has not been seen by any model
-        missed_indices = [ind for ind in data.index if ind not in retval.index]
-        missed_retval = pd.DataFrame(np.repeat(self.default_value, len(missed_indices), axis = 0), 
-                                     index = missed_indices)
-
-        if len(missed_indices) > 0:
-            print("Had no model available for {} entries!".format(len(missed_indices)))
-            retval = pd.concat([retval, missed_retval]).sort_index()
-
-        return retval.as_matrix()
-
+        missed = ~covered
+        num_missed = np.count_nonzero(missed)
+        if num_missed > 0:
+            print("Had no model available for {} entries!".format(num_missed))
+            retval[missed] = self.default_value[0]
 
+        return retval
@@ -32,53 +32,31 @@ class CategoryPlotter:
             raise Exception("Error: expect a list of explicit bin edges for this function!")
         
         colors = []
-        data = []
-        weights = []
+        bin_contents = []
         labels = []
+        centers = []
+        sow_squared_total = np.zeros(len(binning) - 1)
 
         # choose some default ordering if no special choice is made
         if not process_order:
-            process_order = category.event_content.keys()
+            process_order = category.get_processes()
 
         # go through the signal components that feed into this category and plot them as a stacked histogram
         for process_name in process_order:
-            process_values, process_weights = category.get_event_variable(process_name, var)
+            # the sum-of-weights-squared for each bin is needed to get the uncertainties correct
+            # (for density = True, it is normalized together with the bin contents, i.e. the uncertainties are in the same units)
+            cur_bin_contents, sow_squared, cur_bin_edges = category.get_histogram(binning, process_name, var, clipping = clipping, density = density)
+            sow_squared_total = np.add(sow_squared_total, sow_squared)
 
             color = CategoryPlotter.process_colors[process_name]
 
             colors.append(color)
-            if clipping:
-                clipped_values = np.clip(process_values, binning[0], binning[-1])
-            else:
-                clipped_values = process_values
-            data.append(clipped_values)
-            weights.append(process_weights)
             if process_name in CategoryPlotter.process_labels:
                 label = CategoryPlotter.process_labels[process_name]
             else:
                 label = process_name
             labels.append(label)
 
-        # then plot the histogram
-        fig = plt.figure(figsize = (6, 5))
-        ax = fig.add_subplot(111)
-
-        centers = []
-        bin_contents = []
-        sow_squared_total = np.zeros(len(binning) - 1)
-
-        for cur_data, cur_weights in zip(data, weights):
-
-            #print(cur_weights)
-            cur_bin_contents, cur_bin_edges = np.histogram(cur_data, bins = binning, weights = cur_weights.flatten(), density = density)
-            #print(cur_bin_contents)
-            bins = np.digitize(cur_data, bins = binning) - 1 # subtract 1 to get back a 0-indexed array
-
-            # compute sum-of-weights-squared for each bin to get the uncertainties correct
-            sow_squared = np.array([np.sum(np.square(cur_weights[np.argwhere(bins == cur_bin)])) for cur_bin in range(0, len(binning) - 1)]).flatten()
-
-            sow_squared_total = np.add(sow_squared_total, sow_squared)
-
             if ignore_binning:
                 cur_bin_edges = np.linspace(cur_bin_edges[0], cur_bin_edges[-1], num = len(cur_bin_edges), endpoint = True)
 
@@ -90,6 +68,10 @@ class CategoryPlotter:
             centers.append(cur_centers)
             bin_contents.append(cur_bin_contents)
 
+        # then plot the histogram
+        fig = plt.figure(figsize = (6, 5))
+        ax = fig.add_subplot(111)
+
         # compute the actual per-bin uncertainty
         sow_total = np.sqrt(sow_squared_total)
         
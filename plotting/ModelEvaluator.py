@@ -12,6 +12,7 @@ from scipy.special import rel_entr
 
 from base.Configs import TrainingConfig
 from analysis.Category import Category
+from base.Histograms import weighted_histogram
 
 class ModelEvaluator:
 
@@ -32,10 +33,10 @@ class ModelEvaluator:
 
     @staticmethod
     def get_JS_categories(cat_a, cat_b, binning, var, processes):
-        var_a, weights_a = cat_a.get_event_variable(processes, var)
-        var_b, weights_b = cat_b.get_event_variable(processes, var)
+        p_binned, _, _ = cat_a.get_histogram(binning, processes, var, clipping = True, density = True)
+        q_binned, _, _ = cat_b.get_histogram(binning, processes, var, clipping = True, density = True)
 
-        return ModelEvaluator._get_JS(var_a, weights_a.flatten(), var_b, weights_b.flatten(), binning)
+        return ModelEvaluator._get_JS_binned(p_binned, q_binned)
 
     # computes the Jenson-Shannon divergence (using logarithms in base 2!!) between 
     # sets of weighted samples drawn from distributions p and q. Using log_2 ensures
@@ -48,9 +49,14 @@ class ModelEvaluator:
             binning = np.linspace(np.min([p, q]), np.max([p, q]), num = binning, endpoint = True)
 
         # first, need to bin p and q to get two "probability vectors" that can be easily compared
-        p_binned, _ = np.histogram(np.clip(p, binning[0], binning[-1]), bins = binning, weights = p_weights, density = True)
-        q_binned, _ = np.histogram(np.clip(q, binning[0], binning[-1]), bins = binning, weights = q_weights, density = True)
+        p_binned, _, _ = weighted_histogram(p, p_weights, binning, clipping = True, density = True)
+        q_binned, _, _ = weighted_histogram(q, q_weights, binning, clipping = True, density = True)
 
+        return ModelEvaluator._get_JS_binned(p_binned, q_binned, base = base)
+
+    # same as '_get_JS', but for two distributions that are already binned
+    @staticmethod
+    def _get_JS_binned(p_binned, q_binned, base = 2):
         # make sure they do not contain negative entries
         p_binned = np.maximum(p_binned, 0.0)
         q_binned = np.maximum(q_binned, 0.0)
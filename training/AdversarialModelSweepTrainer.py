@@ -0,0 +1,29 @@
+from training.AdversarialModelTrainer import AdversarialModelTrainer
+
+class AdversarialModelSweepTrainer(AdversarialModelTrainer):
+    """ Trains all replicas of an AdversarialModelSweep in lock-step. The training statistics and checkpoints are kept separately
+    for every replica, exactly as if it had been trained on its own. """
+
+    def __init__(self, sweep, batch_sampler, training_pars):
+        super().__init__(sweep, batch_sampler, training_pars)
+
+        # these only keep track of the statistics and the best validation loss of each replica
+        self.replica_trainers = [AdversarialModelTrainer(replica, batch_sampler, training_pars) for replica in sweep.replicas]
+
+    def _validation_check(self, batch, train_batch, valsamples_sig, valsamples_bkg):
+        print("-------------------------------------")
+        print("batch {}:".format(batch))
+
+        statdicts_train = [replica.get_model_statistics(*train_batch, postfix = "_train", DisCo_lambda = 5.0) for replica in self.model.replicas]
+
+        # all replicas are evaluated on the same validation batches
+        statdicts_validation = [[] for replica in self.model.replicas]
+        for validation_batch in self._validation_batches(valsamples_sig, valsamples_bkg):
+            for replica, cur_statdicts_validation in zip(self.model.replicas, statdicts_validation):
+                cur_statdicts_validation.append(replica.get_model_statistics(*validation_batch, postfix = "_validation", DisCo_lambda = 5.0))
+
+        for replica_trainer, statdict_train, cur_statdicts_validation in zip(self.replica_trainers, statdicts_train, statdicts_validation):
+            print("model in {} (lambda = {}):".format(replica_trainer.model.path, replica_trainer.model.lambda_final))
+            replica_trainer._record_statistics(batch, statdict_train, cur_statdicts_validation)
+
+        print("-------------------------------------")
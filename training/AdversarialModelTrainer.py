@@ -1,6 +1,7 @@
 import os, pickle
 import numpy as np
 import training.BatchSamplers as BatchSamplers
+from training.BatchPrefetcher import BatchPrefetcher
 
 class AdversarialModelTrainer:
 
@@ -17,6 +18,12 @@ class AdversarialModelTrainer:
         self.validation_check_batchsize = 20000
 
         self.statistics_dict = {} # to hold the model statistics
+        self.best_val_loss = 1e6
+        self.combined_buffers = {} # output buffers for the combined batches, one set per batch size
+
+        # number of batches to sample ahead in background threads (0 samples every batch right before it is used)
+        self.prefetch_queue_depth = int(self.training_pars.get("prefetch_queue_depth", 0))
+        self.prefetch_producers = int(self.training_pars.get("prefetch_producers", 1))
 
     def _average_over_dicts(self, dicts):
         available_keys = dicts[0].keys()
@@ -29,8 +36,6 @@ class AdversarialModelTrainer:
 
     def train(self, trainsamples_sig, trainsamples_bkg, valsamples_sig, valsamples_bkg):
 
-        best_val_loss = 1e6
-        
         # first, format the training and validation datasets in the way required by the model
         trainsamples_sig_formatted = [self.data_formatter.format_as_TrainingSample(cur_sample, is_signal = True) for cur_sample in trainsamples_sig]
         trainsamples_bkg_formatted = [self.data_formatter.format_as_TrainingSample(cur_sample, is_signal = False) for cur_sample in trainsamples_bkg]
@@ -44,35 +49,60 @@ class AdversarialModelTrainer:
 
         batchsize = self.training_pars["batchsize"]
 
+        # batches that are handed over from the background producers cannot live in reused buffers
+        reuse_buffers = self.prefetch_queue_depth <= 0
+        make_training_batch = lambda: self._sample_combined(trainsamples_sig_formatted, trainsamples_bkg_formatted, batchsize, reuse_buffers = reuse_buffers)
+        make_background_batch = lambda: self._sample_background(trainsamples_bkg_formatted, batchsize, reuse_buffers = reuse_buffers)
+
+        # if the model samples its batches itself, the training loops below only need to trigger the training steps
+        if self.model.use_input_pipeline:
+            sampler = self.batch_sampler if isinstance(self.batch_sampler, BatchSamplers.VectorizedSampler) else BatchSamplers.VectorizedSampler()
+            sampling_tables_sig = sampler.get_sampling_tables(trainsamples_sig_formatted, size = batchsize // 2)
+            sampling_tables_bkg = sampler.get_sampling_tables(trainsamples_bkg_formatted, size = batchsize // 2)
+            sampling_tables_bkg_only = sampler.get_sampling_tables(trainsamples_bkg_formatted, size = batchsize)
+
         # pre-train the classifier
         clf_pretrain_batches = int(self.training_pars["classifier_pretrain_batches"])
         print("pretraining the classifier for {} batches".format(clf_pretrain_batches))
-        for batch in range(clf_pretrain_batches):
-            sampled_sig, weights_sig = self.batch_sampler(trainsamples_sig_formatted, size = batchsize // 2)
-            sampled_bkg, weights_bkg = self.batch_sampler(trainsamples_bkg_formatted, size = batchsize // 2)
-            (data_batch, nuis_batch, labels_batch), weights_batch = self._combine_samples(sampled_sig, weights_sig, sampled_bkg, weights_bkg)
-            weights_batch = np.abs(weights_batch)  # train on absolute weights
-
-            self.model.train_classifier(data_batch, labels_batch, weights_batch, batch)
+        if self.model.use_input_pipeline:
+            self.model.start_input_pipeline(sampling_tables_sig, sampling_tables_bkg)
+            for cur_batch in self._pipeline_steps(self.model.train_classifier_from_pipeline, clf_pretrain_batches):
+                pass
+        else:
+            for batch, (data_batch, nuis_batch, labels_batch, weights_batch) in enumerate(self._batches(make_training_batch, clf_pretrain_batches)):
+                self.model.train_classifier(data_batch, labels_batch, weights_batch, batch)
 
         # pre-train the adversary
         adv_pretrain_batches = int(self.training_pars["adversary_pretrain_batches"])
         print("pretraining the adversarial network for {} batches".format(adv_pretrain_batches))
-        for batch in range(adv_pretrain_batches):
-            (data_batch_bkg, nuis_batch_bkg, labels_batch_bkg), weights_bkg = self.batch_sampler(trainsamples_bkg_formatted, size = batchsize)
-            weights_bkg = np.abs(weights_bkg)
+        if self.model.use_input_pipeline:
+            self.model.start_input_pipeline(None, sampling_tables_bkg_only)
+            adv_pretrain_batch_source = self._pipeline_steps(self.model.train_adversary_from_pipeline, adv_pretrain_batches)
+        else:
+            adv_pretrain_batch_source = self._batches(make_background_batch, adv_pretrain_batches)
 
-            self.model.train_adversary(data_batch_bkg, nuis_batch_bkg, labels_batch_bkg, weights_bkg, batch)
+        for batch, cur_batch in enumerate(adv_pretrain_batch_source):
+            if cur_batch is not None:
+                data_batch_bkg, nuis_batch_bkg, labels_batch_bkg, weights_bkg = cur_batch
+                self.model.train_adversary(data_batch_bkg, nuis_batch_bkg, labels_batch_bkg, weights_bkg, batch)
 
             if batch % self.validation_check_interval == 0:
-                
+                if cur_batch is None:
+                    data_batch_bkg, nuis_batch_bkg, labels_batch_bkg, weights_bkg = self.model.get_pipeline_batch()
+
                 adv_loss = self.model.evaluate_adversary_loss(data_batch_bkg, nuis_batch_bkg, labels_batch_bkg, weights_bkg)
                 print("batch {}: adv_loss = {}".format(batch, adv_loss))
 
         # start the actual adversarial training
         adv_training_batches = int(self.training_pars["training_batches"])
         print("performing adversarial training for {} batches".format(adv_training_batches))
-        for batch in range(adv_training_batches):
+        if self.model.use_input_pipeline:
+            self.model.start_input_pipeline(sampling_tables_sig, sampling_tables_bkg)
+            training_batch_source = self._pipeline_steps(self.model.train_step_from_pipeline, adv_training_batches)
+        else:
+            training_batch_source = self._batches(make_training_batch, adv_training_batches)
+
+        for batch, cur_batch in enumerate(training_batch_source):
             
             # # update adversary
             # for adv_update in range(5):
@@ -81,62 +111,118 @@ class AdversarialModelTrainer:
             #     self.model.train_adversary(data_batch_bkg, nuis_batch_bkg, labels_batch_bkg, weights_bkg, batch)
 
             # update classifier
-            sampled_sig, weights_sig = self.batch_sampler(trainsamples_sig_formatted, size = batchsize // 2)
-            sampled_bkg, weights_bkg = self.batch_sampler(trainsamples_bkg_formatted, size = batchsize // 2)
-            (data_batch, nuis_batch, labels_batch), weights_batch = self._combine_samples(sampled_sig, weights_sig, sampled_bkg, weights_bkg)
-            weights_batch = np.abs(weights_batch)
-
-            self.model.train_step(data_batch, nuis_batch, labels_batch, weights_batch, batch)
+            if cur_batch is not None:
+                data_batch, nuis_batch, labels_batch, weights_batch = cur_batch
+                self.model.train_step(data_batch, nuis_batch, labels_batch, weights_batch, batch)
 
             if batch % self.validation_check_interval == 0:
+                if cur_batch is None:
+                    data_batch, nuis_batch, labels_batch, weights_batch = self.model.get_pipeline_batch()
                 
-                print("-------------------------------------")
-                print("batch {}:".format(batch))
-                
-                # gather some statistics on the evolution of the losses on the training dataset
-                cur_statdict = self.model.get_model_statistics(data_batch, nuis_batch, labels_batch, weights_batch, postfix = "_train", DisCo_lambda = 5.0)
-                cur_statdict["batch"] = batch
-
-                # average over several evaluations on samples from the validation dataset
-                statdicts_validation = []
-                for eval_step in range(5):
-                    # compute the average loss on the validation dataset to check when to stop training
-                    validation_sampled_sig, validation_weights_sig = self.batch_sampler(valsamples_sig_formatted, size = self.validation_check_batchsize // 2)
-                    validation_sampled_bkg, validation_weights_bkg = self.batch_sampler(valsamples_bkg_formatted, size = self.validation_check_batchsize // 2)
-                    (data_validation_batch, nuis_validation_batch, labels_validation_batch), validation_weights_batch = self._combine_samples(validation_sampled_sig, validation_weights_sig, validation_sampled_bkg, validation_weights_bkg)
-                    validation_weights_batch = np.abs(validation_weights_batch)
-                
-                    cur_statdict_validation = self.model.get_model_statistics(data_validation_batch, nuis_validation_batch, labels_validation_batch, validation_weights_batch, postfix = "_validation", DisCo_lambda = 5.0)
-                    statdicts_validation.append(cur_statdict_validation)
-
-                statdict_validation = self._average_over_dicts(statdicts_validation)
-                cur_statdict.update(statdict_validation)
-
-                stat_dict_text = ["{} = {:.6g}".format(key, val) for key, val in cur_statdict.items() if key is not "batch"]
-                print("{}".format(" | ".join(stat_dict_text)))
-
-                self._append_to_statistics_dict(cur_statdict) # register it in the central location
-
-                # save the updated training statistics to the binary file
-                model_stat_path = os.path.join(self.model.path, "training_evolution.pkl")
-                print("saving statistics dict to {}".format(model_stat_path))
-                with open(model_stat_path, "wb") as stat_outfile:
-                    pickle.dump(self.statistics_dict, stat_outfile)
-
-                validation_loss = cur_statdict_validation["total_loss_validation"]
-                if validation_loss is not None:
-                    if validation_loss < best_val_loss:
-                        print("have new best validation loss; triggering checkpoint saver")
-                        best_val_loss = validation_loss
-                
-                        self.model.save(self.model.path)
-
-                print("-------------------------------------")
-
-    def _combine_samples(self, samples_sig, weights_sig, samples_bkg, weights_bkg):
-
-        data_combined = [np.concatenate([cur_sig_sampled, cur_bkg_sampled], axis = 0) for cur_sig_sampled, cur_bkg_sampled in zip(samples_sig, samples_bkg)]
-        weights_combined = np.concatenate([weights_sig, weights_bkg], axis = 0)
+                self._validation_check(batch, (data_batch, nuis_batch, labels_batch, weights_batch), valsamples_sig_formatted, valsamples_bkg_formatted)
+
+    def _validation_check(self, batch, train_batch, valsamples_sig, valsamples_bkg):
+        print("-------------------------------------")
+        print("batch {}:".format(batch))
+
+        # gather some statistics on the evolution of the losses on the training dataset
+        statdict_train = self.model.get_model_statistics(*train_batch, postfix = "_train", DisCo_lambda = 5.0)
+        statdicts_validation = [self.model.get_model_statistics(*validation_batch, postfix = "_validation", DisCo_lambda = 5.0)
+                                for validation_batch in self._validation_batches(valsamples_sig, valsamples_bkg)]
+
+        self._record_statistics(batch, statdict_train, statdicts_validation)
+        print("-------------------------------------")
+
+    def _validation_batches(self, valsamples_sig, valsamples_bkg, num_batches = 5):
+        # Note: every batch lives in the same buffers and needs to be used before the next one is requested
+        for eval_step in range(num_batches):
+            validation_sampled_sig, validation_weights_sig = self.batch_sampler(valsamples_sig, size = self.validation_check_batchsize // 2)
+            validation_sampled_bkg, validation_weights_bkg = self.batch_sampler(valsamples_bkg, size = self.validation_check_batchsize // 2)
+            (data_validation_batch, nuis_validation_batch, labels_validation_batch), validation_weights_batch = self._combine_samples(validation_sampled_sig, validation_weights_sig, validation_sampled_bkg, validation_weights_bkg)
+            validation_weights_batch = np.abs(validation_weights_batch, out = validation_weights_batch)
+
+            yield data_validation_batch, nuis_validation_batch, labels_validation_batch, validation_weights_batch
+
+    def _record_statistics(self, batch, statdict_train, statdicts_validation):
+        cur_statdict = dict(statdict_train)
+        cur_statdict["batch"] = batch
+
+        # average over several evaluations on samples from the validation dataset
+        statdict_validation = self._average_over_dicts(statdicts_validation)
+        cur_statdict.update(statdict_validation)
+
+        stat_dict_text = ["{} = {:.6g}".format(key, val) for key, val in cur_statdict.items() if key is not "batch"]
+        print("{}".format(" | ".join(stat_dict_text)))
+
+        self._append_to_statistics_dict(cur_statdict) # register it in the central location
+
+        # save the updated training statistics to the binary file
+        model_stat_path = os.path.join(self.model.path, "training_evolution.pkl")
+        print("saving statistics dict to {}".format(model_stat_path))
+        with open(model_stat_path, "wb") as stat_outfile:
+            pickle.dump(self.statistics_dict, stat_outfile)
+
+        # compute the loss on the validation dataset to check when to save a checkpoint
+        validation_loss = statdicts_validation[-1]["total_loss_validation"]
+        if validation_loss is not None:
+            if validation_loss < self.best_val_loss:
+                print("have new best validation loss; triggering checkpoint saver")
+                self.best_val_loss = validation_loss
+        
+                self.model.save(self.model.path)
+
+    def _pipeline_steps(self, train_from_pipeline, nbatches):
+        # the model trains on its own batches, possibly performing several updates per call: only report back
+        # which batches have been processed (as 'None'), such that the training loops can keep track of them
+        for start in range(0, nbatches, self.model.fused_steps):
+            nsteps = min(self.model.fused_steps, nbatches - start)
+            train_from_pipeline(nsteps)
+
+            for batch in range(nsteps):
+                yield None
+
+    def _batches(self, make_batch, nbatches):
+        if self.prefetch_queue_depth > 0:
+            return BatchPrefetcher(make_batch, nbatches, queue_depth = self.prefetch_queue_depth, num_producers = self.prefetch_producers)
+        else:
+            return (make_batch() for batch in range(nbatches))
+
+    def _sample_combined(self, samples_sig, samples_bkg, size, reuse_buffers = True):
+        sampled_sig, weights_sig = self.batch_sampler(samples_sig, size = size // 2)
+        sampled_bkg, weights_bkg = self.batch_sampler(samples_bkg, size = size // 2)
+        (data_batch, nuis_batch, labels_batch), weights_batch = self._combine_samples(sampled_sig, weights_sig, sampled_bkg, weights_bkg, reuse_buffers = reuse_buffers)
+        weights_batch = np.abs(weights_batch, out = weights_batch) # train on absolute weights
+
+        return data_batch, nuis_batch, labels_batch, weights_batch
+
+    def _sample_background(self, samples_bkg, size, reuse_buffers = True):
+        (data_batch, nuis_batch, labels_batch), weights_batch = self.batch_sampler(samples_bkg, size = size)
+        if not reuse_buffers:
+            # the sampler may fill the same buffers again for the next batch
+            data_batch, nuis_batch, labels_batch, weights_batch = [np.array(cur) for cur in [data_batch, nuis_batch, labels_batch, weights_batch]]
+        weights_batch = np.abs(weights_batch, out = weights_batch)
+
+        return data_batch, nuis_batch, labels_batch, weights_batch
+
+    def _combine_samples(self, samples_sig, weights_sig, samples_bkg, weights_bkg, reuse_buffers = True):
+
+        if not reuse_buffers:
+            data_combined = [np.concatenate([cur_sig_sampled, cur_bkg_sampled], axis = 0) for cur_sig_sampled, cur_bkg_sampled in zip(samples_sig, samples_bkg)]
+            weights_combined = np.concatenate([weights_sig, weights_bkg], axis = 0)
+            return data_combined, weights_combined
+
+        # fill the combined batch into buffers that are reused for all batches of the same size
+        nrows = len(weights_sig) + len(weights_bkg)
+        if nrows not in self.combined_buffers:
+            data_buffers = [np.empty((nrows,) + cur_sig_sampled.shape[1:], dtype = np.result_type(cur_sig_sampled, cur_bkg_sampled))
+                            for cur_sig_sampled, cur_bkg_sampled in zip(samples_sig, samples_bkg)]
+            weights_buffer = np.empty(nrows, dtype = np.result_type(weights_sig, weights_bkg))
+            self.combined_buffers[nrows] = (data_buffers, weights_buffer)
+
+        data_combined, weights_combined = self.combined_buffers[nrows]
+        for cur_sig_sampled, cur_bkg_sampled, cur_combined in zip(samples_sig, samples_bkg, data_combined):
+            np.concatenate([cur_sig_sampled, cur_bkg_sampled], axis = 0, out = cur_combined)
+        np.concatenate([weights_sig, weights_bkg], axis = 0, out = weights_combined)
         
         return data_combined, weights_combined
 
@@ -0,0 +1,48 @@
+import threading, queue
+
+class BatchPrefetcher:
+    # yields 'nbatches' batches from 'make_batch', produced in background threads while the graph runs on the current one
+
+    def __init__(self, make_batch, nbatches, queue_depth = 4, num_producers = 1):
+        self.make_batch = make_batch
+        self.nbatches = nbatches
+        self.queue_depth = max(queue_depth, 1)
+        self.num_producers = max(num_producers, 1)
+
+    def _produce(self, batch_queue, stop_event):
+        while not stop_event.is_set():
+            try:
+                cur_batch = (self.make_batch(), None)
+            except Exception as e:
+                # hand the problem over to the consumer, which will raise it
+                cur_batch = (None, e)
+
+            while not stop_event.is_set():
+                try:
+                    batch_queue.put(cur_batch, timeout = 0.1)
+                    break
+                except queue.Full:
+                    continue
+
+            if cur_batch[1] is not None:
+                return
+
+    def __iter__(self):
+        batch_queue = queue.Queue(maxsize = self.queue_depth)
+        stop_event = threading.Event()
+
+        producers = [threading.Thread(target = self._produce, args = (batch_queue, stop_event), daemon = True) for cur in range(self.num_producers)]
+        for producer in producers:
+            producer.start()
+
+        try:
+            for batch in range(self.nbatches):
+                cur_batch, exception = batch_queue.get()
+                if exception is not None:
+                    raise exception
+
+                yield cur_batch
+        finally:
+            stop_event.set()
+            for producer in producers:
+                producer.join()
@@ -1,4 +1,6 @@
+import threading
 import numpy as np
+from collections import OrderedDict
 
 def sample_from(sources, weights, req = 100):
     inds = np.random.choice(len(weights), req)
@@ -78,6 +80,117 @@ def sample_from_TrainingSamples(samples, size, sampling_pars = {}):
 
     return sample_from_components([data, nuis, labels], weights, batch_size = size, sampling_pars = sampling_pars)
     
+class VectorizedSampler:
+    """ drop-in replacement for 'sample_from_TrainingSamples' (note: a returned batch is only valid until the next request for the same samples) """
+
+    def __init__(self, sampling_pars = {}, max_pools = 4):
+        self.sampling_pars = sampling_pars
+        self.max_pools = max_pools # only keep the most recently used sets of samples around
+        self.pools = OrderedDict()
+        self.pool_lock = threading.Lock()
+
+    def _get_pool(self, samples):
+        pool_key = tuple(id(cur_sample) for cur_sample in samples)
+
+        with self.pool_lock:
+            if pool_key not in self.pools:
+                self.pools[pool_key] = self._build_pool(samples)
+                if len(self.pools) > self.max_pools:
+                    self.pools.popitem(last = False)
+
+            self.pools.move_to_end(pool_key)
+            return self.pools[pool_key]
+
+    def _build_pool(self, samples):
+        nevents = np.array([len(cur_sample.weights) for cur_sample in samples])
+        weights = [cur_sample.weights for cur_sample in samples]
+
+        if self.sampling_pars.get("sampling_fractions", None) is not None:
+            # pretend that each component came with the requested SOW to start with
+            SOWs = np.array(self.sampling_pars["sampling_fractions"], dtype = float)
+        else:
+            # keep the original proportions
+            SOWs = np.array([np.sum(cur) for cur in weights], dtype = float)
+        SOWs /= np.sum(SOWs) # normalize total SOW to 1
+
+        pool = {"samples": samples, # keep the samples alive for as long as their 'id's are used as key
+                "sources": [np.concatenate([getattr(cur_sample, field) for cur_sample in samples], axis = 0) for field in ["data", "nuis", "labels"]],
+                "weights": np.concatenate(weights, axis = 0),
+                "nevents": nevents,
+                "offsets": np.concatenate([[0], np.cumsum(nevents)[:-1]]),
+                "SOWs": SOWs,
+                "layouts": {}}
+
+        return pool
+
+    def _get_layout(self, pool, size):
+        # every thread fills its own buffers, such that several batch producers can share the same sampler
+        layout_key = (size, threading.get_ident())
+        if layout_key in pool["layouts"]:
+            return pool["layouts"][layout_key]
+
+        # the number of events drawn from each component
+        samplinglengths = self.sampling_pars.get("sampling_lengths", [1.0 for cur in pool["nevents"]])
+        reqs = np.array([int(cur_samplinglength * size / len(pool["nevents"])) for cur_samplinglength in samplinglengths])
+        nrows = np.sum(reqs)
+
+        # the component every row of the batch is drawn from
+        row_component = np.repeat(np.arange(len(reqs)), reqs)
+
+        layout = {"nrows": nrows,
+                  "row_component": row_component,
+                  "row_nevents": pool["nevents"][row_component].astype(float),
+                  "row_offsets": pool["offsets"][row_component],
+                  "filled_components": np.flatnonzero(reqs > 0),
+                  "component_starts": np.concatenate([[0], np.cumsum(reqs)[:-1]])[reqs > 0],
+                  "uniform": np.empty(nrows, dtype = float),
+                  "indices": np.empty(nrows, dtype = np.int64),
+                  "scales": np.empty(nrows, dtype = pool["weights"].dtype),
+                  "sampled": [np.empty((nrows,) + cur_source.shape[1:], dtype = cur_source.dtype) for cur_source in pool["sources"]],
+                  "sampled_weights": np.empty(nrows, dtype = pool["weights"].dtype)}
+
+        pool["layouts"][layout_key] = layout
+        return layout
+
+    def get_sampling_tables(self, samples, size):
+        """ everything needed to draw batches of this size in the same way as '__call__' does, e.g. inside a TensorFlow graph """
+        pool = self._get_pool(samples)
+        layout = self._get_layout(pool, size)
+
+        data, nuis, labels = pool["sources"]
+        return {"data": data, "nuis": nuis, "labels": labels, "weights": pool["weights"], "SOWs": pool["SOWs"],
+                "row_nevents": layout["row_nevents"], "row_offsets": layout["row_offsets"], "row_component": layout["row_component"],
+                "weight_scale": size / 10.0}
+
+    def __call__(self, samples, size):
+        pool = self._get_pool(samples)
+        layout = self._get_layout(pool, size)
+
+        # draw the events of all components at once: uniformly within each component, then shifted to its position in the pool
+        indices = layout["indices"]
+        np.multiply(np.random.random_sample(layout["nrows"]), layout["row_nevents"], out = layout["uniform"])
+        np.copyto(indices, layout["uniform"], casting = "unsafe")
+        indices += layout["row_offsets"]
+
+        for cur_source, cur_sampled in zip(pool["sources"], layout["sampled"]):
+            np.take(cur_source, indices, axis = 0, out = cur_sampled)
+
+        sampled_weights = layout["sampled_weights"]
+        np.take(pool["weights"], indices, out = sampled_weights)
+
+        # normalize the components such that their SOWs are in the correct relation to each other
+        scales = np.ones(len(pool["nevents"]))
+        if len(layout["filled_components"]) > 0:
+            component_SOWs = np.add.reduceat(sampled_weights, layout["component_starts"])
+            filled_SOWs = pool["SOWs"][layout["filled_components"]]
+            scales[layout["filled_components"]] = np.divide(filled_SOWs, component_SOWs, out = np.ones_like(filled_SOWs), where = component_SOWs > 0)
+
+        np.take(scales, layout["row_component"], out = layout["scales"])
+        sampled_weights *= layout["scales"]
+        sampled_weights *= size / 10.0 # perform some scaling of the weights
+
+        return layout["sampled"], sampled_weights
+
 def all(samples):
 
     data = np.concatenate([cur_sample.data for cur_sample in samples], axis = 0)
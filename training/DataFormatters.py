@@ -34,6 +34,10 @@ class only_nJ:
     def get_formatted_indices(self, data):
         return self._extract_nJ(data, self.nJ).index
 
+    def get_formatted_mask(self, data):
+        # boolean mask selecting the same rows as 'get_formatted_indices', in the order in which they appear in 'data'
+        return (data["nJ"] == self.nJ).values
+
 class only_2j(only_nJ):
 
     def __init__(self):
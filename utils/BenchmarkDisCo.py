@@ -0,0 +1,63 @@
+import time, resource
+import numpy as np
+import multiprocessing as mp
+from argparse import ArgumentParser
+
+def _benchmark_kernel(kernel, batch_size, repetitions, result_queue):
+    import tensorflow as tf
+    from models.DisCoAdversary import DisCoAdversary
+
+    rng = np.random.RandomState(12345)
+    graph = tf.Graph()
+    with graph.as_default():
+        pred_in = tf.placeholder(tf.float32, [None, 1], name = "pred_in")
+        nuisance_in = tf.placeholder(tf.float32, [None, 1], name = "nuisance_in")
+        weights_in = tf.placeholder(tf.float32, [None, ], name = "weights_in")
+
+        adversary = DisCoAdversary("DisCo_" + kernel, hyperpars = {"disco_kernel": kernel})
+        loss, _ = adversary.build_loss(pred_in, nuisance_in, is_training = False, weights = weights_in)
+        step = [loss, tf.gradients(loss, pred_in)[0]] # the loss is evaluated together with its gradient, as in a training step
+
+        sess = tf.Session(graph = graph)
+        sess.run(tf.global_variables_initializer())
+
+    feed_dict = {pred_in: rng.uniform(size = (batch_size, 1)), nuisance_in: rng.exponential(scale = 100.0, size = (batch_size, 1)),
+                 weights_in: rng.uniform(size = batch_size)}
+
+    # the memory in use before the first evaluation serves as baseline
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sess.run(step, feed_dict = feed_dict)
+
+    start = time.time()
+    for repetition in range(repetitions):
+        sess.run(step, feed_dict = feed_dict)
+    step_time = (time.time() - start) / repetitions
+
+    peak_memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024.0 # in MB
+    result_queue.put((step_time, peak_memory))
+
+def BenchmarkDisCo(batch_sizes, kernels, repetitions):
+
+    print("{:>8} {:>10} {:>14} {:>16}".format("N", "kernel", "step time [ms]", "peak memory [MB]"))
+    for batch_size in batch_sizes:
+        for kernel in kernels:
+            # every measurement runs in a fresh process, such that the peak memory usage can be attributed to it
+            result_queue = mp.Queue()
+            proc = mp.Process(target = _benchmark_kernel, args = (kernel, batch_size, repetitions, result_queue))
+            proc.start()
+            step_time, peak_memory = result_queue.get()
+            proc.join()
+
+            print("{:>8} {:>10} {:>14.1f} {:>16.1f}".format(batch_size, kernel, 1000 * step_time, peak_memory))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "measure step time and peak memory of the DisCo implementations for different batch sizes")
+    parser.add_argument("--batch_sizes", action = "store", dest = "batch_sizes", default = "1000,2000,4000,8000,16000")
+    parser.add_argument("--kernels", action = "store", dest = "kernels", default = "dense,broadcast,sorted")
+    parser.add_argument("--repetitions", action = "store", dest = "repetitions", type = int, default = 10)
+    args = vars(parser.parse_args())
+
+    args["batch_sizes"] = [int(cur) for cur in args["batch_sizes"].split(',')]
+    args["kernels"] = args["kernels"].split(',')
+
+    BenchmarkDisCo(**args)
@@ -0,0 +1,60 @@
+import time
+import numpy as np
+import tensorflow as tf
+from argparse import ArgumentParser
+
+from base.Configs import TrainingConfig
+from models.AdversarialModel import AdversarialModel
+from training.BatchSamplers import VectorizedSampler, all as all_samples
+from NewTrainAdversarialModel import load_shuffled_slices
+
+def BenchmarkTrainingThreads(infile_path, model_dir, threads, steps, warmup_steps, batchsize):
+    sig_data_train, = load_shuffled_slices(infile_path, TrainingConfig.sig_samples, [TrainingConfig.training_slice])
+    bkg_data_train, = load_shuffled_slices(infile_path, TrainingConfig.bkg_samples, [TrainingConfig.training_slice])
+
+    model = AdversarialModel.from_config(model_dir)
+    samples_sig = [model.data_formatter.format_as_TrainingSample(cur_sample, is_signal = True) for cur_sample in sig_data_train]
+    samples_bkg = [model.data_formatter.format_as_TrainingSample(cur_sample, is_signal = False) for cur_sample in bkg_data_train]
+    (data_all, nuis_all, labels_all), weights_all = all_samples(samples_sig + samples_bkg)
+
+    # the batches are prepared in advance, such that only the training steps themselves are timed
+    sampler = VectorizedSampler()
+    batches = []
+    for batch in range(warmup_steps + steps):
+        sampled_sig, weights_sig = sampler(samples_sig, size = batchsize // 2)
+        sampled_bkg, weights_bkg = sampler(samples_bkg, size = batchsize // 2)
+        batches.append([cur.copy() for cur in sampled_sig] + [cur.copy() for cur in sampled_bkg] + [weights_sig.copy(), weights_bkg.copy()])
+
+    results = {}
+    for num_threads in threads:
+        # start from a fresh session with the requested number of threads
+        model.sess.close()
+        model.sess = tf.Session(graph = model.graph, config = TrainingConfig.make_session_config(num_threads))
+        model.init(data_all, nuis_all)
+
+        for batch, (data_sig, nuis_sig, labels_sig, data_bkg, nuis_bkg, labels_bkg, weights_sig, weights_bkg) in enumerate(batches):
+            if batch == warmup_steps:
+                start = time.time()
+
+            model.train_step(np.concatenate([data_sig, data_bkg]), np.concatenate([nuis_sig, nuis_bkg]), np.concatenate([labels_sig, labels_bkg]),
+                             np.abs(np.concatenate([weights_sig, weights_bkg])), batch)
+
+        results[num_threads] = steps / (time.time() - start)
+        print("{} threads: {:.1f} steps/s".format(num_threads, results[num_threads]))
+
+    print("-------------------------------------")
+    for num_threads, steps_per_second in results.items():
+        print("{:>3} threads: {:8.1f} steps/s ({:.2f}x)".format(num_threads, steps_per_second, steps_per_second / results[threads[0]]))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "measure the training throughput of a model for different numbers of threads")
+    parser.add_argument("--data", action = "store", dest = "infile_path")
+    parser.add_argument("--model_dir", action = "store", dest = "model_dir")
+    parser.add_argument("--threads", action = "store", dest = "threads", default = "1,2,4,8")
+    parser.add_argument("--steps", action = "store", dest = "steps", type = int, default = 500)
+    parser.add_argument("--warmup_steps", action = "store", dest = "warmup_steps", type = int, default = 20)
+    parser.add_argument("--batchsize", action = "store", dest = "batchsize", type = int, default = 1000)
+    args = vars(parser.parse_args())
+
+    args["threads"] = [int(cur) for cur in args["threads"].split(',')]
+    BenchmarkTrainingThreads(**args)
@@ -0,0 +1,66 @@
+import time
+import numpy as np
+import tensorflow as tf
+from argparse import ArgumentParser
+
+from models.DisCoAdversary import DisCoAdversary
+
+def CheckDisCoParity(batch_sizes, kernels, reference_kernel, tolerance, seed):
+    rng = np.random.RandomState(seed)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        pred_in = tf.placeholder(tf.float32, [None, 1], name = "pred_in")
+        nuisance_in = tf.placeholder(tf.float32, [None, 1], name = "nuisance_in")
+        weights_in = tf.placeholder(tf.float32, [None, ], name = "weights_in")
+
+        # the DisCo loss and its gradient w.r.t. the classifier output, for each implementation
+        outputs = {}
+        for kernel in [reference_kernel] + kernels:
+            adversary = DisCoAdversary("DisCo_" + kernel, hyperpars = {"disco_kernel": kernel})
+            loss, _ = adversary.build_loss(pred_in, nuisance_in, is_training = False, weights = weights_in)
+            outputs[kernel] = (loss, tf.gradients(loss, pred_in)[0])
+
+        sess = tf.Session(graph = graph)
+        sess.run(tf.global_variables_initializer())
+
+    all_good = True
+    for batch_size in batch_sizes:
+        # a classifier output with some dependence on the nuisance, and some ties in both
+        nuisance = np.round(rng.exponential(scale = 100.0, size = (batch_size, 1)), 1)
+        pred = 1.0 / (1.0 + np.exp(-rng.normal(size = (batch_size, 1)) - nuisance / 100.0))
+        pred[:batch_size // 10] = 0.5
+        weights = np.abs(rng.normal(loc = 1.0, size = batch_size))
+        feed_dict = {pred_in: pred, nuisance_in: nuisance, weights_in: weights}
+
+        reference_loss, reference_grad = sess.run(outputs[reference_kernel], feed_dict = feed_dict)
+
+        for kernel in kernels:
+            start = time.time()
+            cur_loss, cur_grad = sess.run(outputs[kernel], feed_dict = feed_dict)
+            elapsed = time.time() - start
+
+            loss_diff = abs(cur_loss - reference_loss) / abs(reference_loss)
+            grad_diff = np.max(np.abs(cur_grad - reference_grad)) / np.max(np.abs(reference_grad))
+            good = loss_diff < tolerance and grad_diff < tolerance
+            all_good &= good
+
+            print("N = {:>6}, {:>8}: loss = {:.6g} (reference: {:.6g}), rel. diff. loss = {:.2g}, gradient = {:.2g}, {:.1f} ms {}".format(
+                batch_size, kernel, cur_loss, reference_loss, loss_diff, grad_diff, 1000 * elapsed, "" if good else "<-- MISMATCH"))
+
+    print("all implementations agree" if all_good else "found mismatches!")
+    return all_good
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "compare the alternative DisCo implementations to the dense reference")
+    parser.add_argument("--batch_sizes", action = "store", dest = "batch_sizes", default = "10,100,1000,4000")
+    parser.add_argument("--kernels", action = "store", dest = "kernels", default = "broadcast,sorted")
+    parser.add_argument("--reference", action = "store", dest = "reference_kernel", default = "dense")
+    parser.add_argument("--tolerance", action = "store", dest = "tolerance", type = float, default = 1e-3)
+    parser.add_argument("--seed", action = "store", dest = "seed", type = int, default = 12345)
+    args = vars(parser.parse_args())
+
+    args["batch_sizes"] = [int(cur) for cur in args["batch_sizes"].split(',')]
+    args["kernels"] = args["kernels"].split(',')
+
+    CheckDisCoParity(**args)
@@ -1,5 +1,4 @@
 import os
-import pandas as pd
 import numpy as np
 from argparse import ArgumentParser
 from sklearn.model_selection import train_test_split
@@ -8,6 +7,7 @@ from base.Configs import TrainingConfig
 from analysis.CutBasedCategoryFiller import CutBasedCategoryFiller
 from plotting.CategoryPlotter import CategoryPlotter
 from DatasetExtractor import TrainNuisAuxSplit
+from NewTrainAdversarialModel import load_shuffled_slices
 from base.Configs import TrainingConfig
 
 def GetCBASignalEfficiencies(outdir):
@@ -21,17 +21,14 @@ def GetCBASignalEfficiencies(outdir):
     data_slice = TrainingConfig.validation_slice
     slice_size = data_slice[1] - data_slice[0]
 
-    data_sig = [pd.read_hdf(infile_path, key = sample) for sample in sig_samples]
-    data_bkg = [pd.read_hdf(infile_path, key = sample) for sample in bkg_samples]
+    data_sig, = load_shuffled_slices(infile_path, sig_samples, [data_slice])
+    data_bkg, = load_shuffled_slices(infile_path, bkg_samples, [data_slice])
 
     # load all signal processes
     sig_data_test = [] # this holds all the branches used as inputs to the classifier
     sig_weights_test = []
     sig_aux_data_test = [] # this holds some other branches that may be important
-    for sample, sample_name in zip(data_sig, sig_samples):
-        cur_length = len(sample)
-        sample = sample.sample(frac = 1, random_state = 12345).reset_index(drop = True) # shuffle the sample
-        cur_test = sample[int(data_slice[0] * cur_length) : int(data_slice[1] * cur_length)]
+    for cur_test, sample_name in zip(data_sig, sig_samples):
         cur_testdata, cur_nuisdata, cur_weights = TrainNuisAuxSplit(cur_test) # load the standard classifier input, nuisances and weights
 
         cur_aux_data = cur_test[TrainingConfig.auxiliary_branches].values
@@ -43,10 +40,7 @@ def GetCBASignalEfficiencies(outdir):
     bkg_data_test = [] # this holds all the branches used as inputs to the classifier
     bkg_weights_test = []
     bkg_aux_data_test = [] # this holds some other branches that may be important
-    for sample, sample_name in zip(data_bkg, bkg_samples):
-        cur_length = len(sample)
-        sample = sample.sample(frac = 1, random_state = 12345).reset_index(drop = True) # shuffle the sample
-        cur_test = sample[int(data_slice[0] * cur_length) : int(data_slice[1] * cur_length)]
+    for cur_test, sample_name in zip(data_bkg, bkg_samples):
         cur_testdata, cur_nuisdata, cur_weights = TrainNuisAuxSplit(cur_test) # load the standard classifier input, nuisances and weights
 
         cur_aux_data = cur_test[TrainingConfig.auxiliary_branches].values
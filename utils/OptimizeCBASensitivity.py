@@ -1,6 +1,5 @@
 import os, pickle
 import numpy as np
-import pandas as pd
 import subprocess as sp
 import itertools
 from sklearn.model_selection import train_test_split
@@ -16,6 +15,7 @@ import matplotlib.pyplot as plt
 from base.Configs import TrainingConfig
 from analysis.CutBasedCategoryFiller import CutBasedCategoryFiller
 from DatasetExtractor import TrainNuisAuxSplit
+from NewTrainAdversarialModel import load_shuffled_slices
 
 evalcnt = 0
 
@@ -123,17 +123,14 @@ def OptimizeCBASensitivity(infile_path, outdir, do_plots = True):
     bkg_samples = TrainingConfig.bkg_samples
 
     print("loading data ...")
-    sig_data = [pd.read_hdf(infile_path, key = sig_sample) for sig_sample in sig_samples]
-    bkg_data = [pd.read_hdf(infile_path, key = bkg_sample) for bkg_sample in bkg_samples]
+    sig_data, = load_shuffled_slices(infile_path, sig_samples, [data_slice])
+    bkg_data, = load_shuffled_slices(infile_path, bkg_samples, [data_slice])
 
     sig_data_train = []
     sig_mBB_train = []
     sig_weights_train = []
     sig_aux_data_train = []
-    for sample in sig_data:
-        cur_length = len(sample)
-        sample = sample.sample(frac = 1, random_state = 12345).reset_index(drop = True) # shuffle the sample
-        cur_train = sample[int(data_slice[0] * cur_length) : int(data_slice[1] * cur_length)]
+    for cur_train in sig_data:
         cur_traindata, cur_nuisdata, cur_weights = TrainNuisAuxSplit(cur_train) # load the standard classifier input, nuisances and weights
         cur_aux_data = cur_train[TrainingConfig.other_branches].values
         sig_data_train.append(cur_traindata)
@@ -145,10 +142,7 @@ def OptimizeCBASensitivity(infile_path, outdir, do_plots = True):
     bkg_mBB_train = []
     bkg_weights_train = []
     bkg_aux_data_train = []
-    for sample in bkg_data:
-        cur_length = len(sample)
-        sample = sample.sample(frac = 1, random_state = 12345).reset_index(drop = True) # shuffle the sample
-        cur_train = sample[int(data_slice[0] * cur_length) : int(data_slice[1] * cur_length)]
+    for cur_train in bkg_data:
         cur_traindata, cur_nuisdata, cur_weights = TrainNuisAuxSplit(cur_train) # load the standard classifier input, nuisances and weights
         cur_aux_data = cur_train[TrainingConfig.other_branches].values
         bkg_data_train.append(cur_traindata)